@@ -1,381 +1,258 @@
+import io
+import math
+import os
+
 import streamlit as st
-import networkx as nx
-import matplotlib.pyplot as plt
-from matplotlib.gridspec import GridSpec
-import matplotlib.image as mpimg
-import matplotlib.patches as mpatches
-from adjustText import adjust_text
-import matplotlib.font_manager as fm
+import streamlit.components.v1 as components
+
+# matplotlib, NetworkX and adjustText are NOT imported up here: together they
+# take over a second to load, and we only need them when actually drawing the
+# map (which the caches below make rare). See middle_earth/staticmap.py.
+from middle_earth.analysis import (alternative_routes_analysis, centrality_ranking, place_name,
+                                   regional_groups_analysis, shortest_path_analysis,
+                                   strategic_locations_analysis, tradeoff_routes_analysis)
+from middle_earth.astar import CoordinateHeuristic, LandmarkHeuristic
+from middle_earth.basemap import Basemap
+from middle_earth.batch import plan_routes, read_pairs, write_csv, write_jsonl
+from middle_earth.data import graph_from_env
+from middle_earth.dynamic import DynamicNetwork
+from middle_earth.graph import as_compact
+from middle_earth.results import result_cache_from_env
+from middle_earth.staticmap import FIGURE_SIZE, RENDER_DPI, create_visualization
+from middle_earth.tracing import (RingBufferSink, cache_lookup, cache_miss, configure_from_env, span,
+                                  trace, traced)
+from middle_earth.vectormap import (FRONTEND_DIR, HighlightState, background_image, map_payload,
+                                    route_ids)
 
 # Make the page look nice and wide
 st.set_page_config(page_title="Middle Earth Network Analysis", layout="wide")
 
-# Start with a fresh graph - this will hold all our locations and paths
-G = nx.DiGraph()
+# Where the background map lives
+MAP_IMAGE_PATH = 'middle_earth_map_optimized.png'
+# Our coordinates are a 100 x 75 grid laid over the map picture
+MAP_EXTENT = (0, 100, 0, 75)
 
-# This huge dictionary has all our locations and their info
-# x,y coordinates are based on a reference map, and each place has a type
-# (like haven, fortress, etc.) which we'll use for coloring later
-locations = {
-    # Classic good guy places
-    'Shire': {'pos': (25, 52), 'type': 'haven'},        # Hobbit central!
-    'Grey_Havens': {'pos': (15, 52), 'type': 'haven'},  # Elf port city
-    'Rivendell': {'pos': (47, 52), 'type': 'haven'},    # Elrond's place
-    'Bree': {'pos': (28, 52), 'type': 'town'},          # Where it all began...
-    
-    # Spooky abandoned places
-    'Fornost': {'pos': (30, 57), 'type': 'ruin'},       # Old capital, now empty
-    'Weathertop': {'pos': (32, 52), 'type': 'ruin'},    # That scary place with the Nazgul
-    'Tharbad': {'pos': (35, 45), 'type': 'ruin'},       # Abandoned river crossing
-    'Osgiliath': {'pos': (64, 23), 'type': 'ruin'},     # Gondor's old capital
-    
-    # Big important forests
-    'Mirkwood': {'pos': (60, 55), 'type': 'forest'},    # Thranduil's sketchy woods
-    'Fangorn': {'pos': (48, 38), 'type': 'forest'},     # Home of the Ents
-    
-    # Mountain stuff
-    'Erebor': {'pos': (65, 62), 'type': 'mountain'},    # The Lonely Mountain!
-    'Mount_Doom': {'pos': (69, 25), 'type': 'mountain'},# Where the ring goes bye-bye
-    'Iron_Hills': {'pos': (75, 62), 'type': 'mountain'},# More dwarves here
-    
-    # Major cities and towns
-    'Dale': {'pos': (65, 57), 'type': 'city'},          # City by Erebor
-    'Esgaroth': {'pos': (68, 58), 'type': 'town'},      # Lake-town
-    'Edoras': {'pos': (48, 28), 'type': 'city'},        # Horse bros
-    'Minas_Tirith': {'pos': (62, 23), 'type': 'city'},  # White city
-    'Pelargir': {'pos': (62, 18), 'type': 'city'},      # Harbor city
-    'Dol_Guldur': {'pos': (62, 48), 'type': 'fortress'},# Sauron's vacation home
-    'Minas_Morgul': {'pos': (66, 24), 'type': 'fortress'},# Super creepy city
-    'Barad_dur': {'pos': (72, 26), 'type': 'fortress'}, # Sauron's main crib
-    'Black_Gate': {'pos': (66, 29), 'type': 'gate'},    # Front door to Mordor
-    
-    # Other important spots
-    'Moria': {'pos': (47, 43), 'type': 'ruin'},         # "You shall not pass!"
-    'Lorien': {'pos': (52, 42), 'type': 'haven'},       # Galadriel's forest
-    'Isengard': {'pos': (45, 35), 'type': 'fortress'},  # Saruman's tower
-    'Dead_Marshes': {'pos': (62, 28), 'type': 'hazard'},# Spooky swamp
-    'Paths_of_Dead': {'pos': (51, 24), 'type': 'pass'}, # Ghost shortcut
-    'Cirith_Ungol': {'pos': (68, 24), 'type': 'pass'},  # Spider pass
-    'Cair_Andros': {'pos': (61, 26), 'type': 'fortress'},# River fortress
-    'Rhosgobel': {'pos': (55, 52), 'type': 'town'},     # Radagast's home
-    'Gap_of_Rohan': {'pos': (45, 32), 'type': 'pass'},    # Gap in the White Mountains
-    'Helms_Deep': {'pos': (46, 31), 'type': 'fortress'},  # Rohan's stronghold
-}
+# The interactive map's browser side (see middle_earth/vectormap.py)
+vector_map = components.declare_component('middle_earth_map', path=FRONTEND_DIR)
+
+@st.cache_resource(show_spinner="Loading the map of Middle Earth...")
+def get_graph():
+    """
+    The graph everyone works on, built once per server process and shared by
+    every session (Streamlit reruns this whole script on every click, so
+    building it at the top of the file meant rebuilding it all the time).
 
-# Add all our locations to the graph
-for loc, data in locations.items():
-    G.add_node(loc, pos=data['pos'], type=data['type'])
+    All our locations and paths live in middle_earth/data.py (so the CLI can use them too).
+    Got a bigger map in some files? Set MIDDLE_EARTH_NODES / MIDDLE_EARTH_EDGES
+    (and MIDDLE_EARTH_SNAPSHOT for a fast-loading copy) and we'll load that instead.
+    """
+    cache_miss('graph')
+    return graph_from_env()
+
+def file_mtime(path):
+    """When a file last changed (None if it isn't there) - cache keys use this."""
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
 
-# Now we're setting up all the paths between places
-# weight = how dangerous it is (1 = safe, 10 = super dangerous)
-# type = what kind of path (road, mountain_pass, etc.)
-routes = [
-    ('Bree', 'Weathertop', {'weight': 3, 'type': 'road'}),
-    ('Weathertop', 'Rivendell', {'weight': 4, 'type': 'road'}),
-    ('Rivendell', 'Moria', {'weight': 7, 'type': 'mountain_pass'}),
-    ('Moria', 'Lorien', {'weight': 5, 'type': 'forest_path'}),
-    ('Lorien', 'Fangorn', {'weight': 4, 'type': 'forest_path'}),
-    ('Fangorn', 'Isengard', {'weight': 3, 'type': 'road'}),
-    ('Isengard', 'Helms_Deep', {'weight': 2, 'type': 'road'}),
-    ('Helms_Deep', 'Edoras', {'weight': 2, 'type': 'road'}),
-    ('Edoras', 'Minas_Tirith', {'weight': 4, 'type': 'road'}),
-    ('Minas_Tirith', 'Osgiliath', {'weight': 3, 'type': 'road'}),
-    ('Osgiliath', 'Dead_Marshes', {'weight': 7, 'type': 'hazardous_path'}),
-    ('Dead_Marshes', 'Black_Gate', {'weight': 8, 'type': 'dangerous_path'}),
-    ('Black_Gate', 'Barad_dur', {'weight': 9, 'type': 'dangerous_path'}),
-    ('Barad_dur', 'Mount_Doom', {'weight': 10, 'type': 'dangerous_path'}),
-    ('Rivendell', 'Mirkwood', {'weight': 5, 'type': 'forest_path'}),
-    ('Mirkwood', 'Dale', {'weight': 4, 'type': 'forest_path'}),
-    ('Dale', 'Erebor', {'weight': 2, 'type': 'road'}),
-    ('Gap_of_Rohan', 'Isengard', {'weight': 3, 'type': 'road'}),
-    ('Edoras', 'Paths_of_Dead', {'weight': 6, 'type': 'mountain_pass'}),
-    ('Grey_Havens', 'Shire', {'weight': 2, 'type': 'road'}),
-    ('Shire', 'Bree', {'weight': 2, 'type': 'road'}),
-    ('Shire', 'Fornost', {'weight': 3, 'type': 'road'}),
-    ('Bree', 'Fornost', {'weight': 3, 'type': 'road'}),
-    ('Bree', 'Tharbad', {'weight': 4, 'type': 'road'}),
-    ('Tharbad', 'Moria', {'weight': 5, 'type': 'road'}),
-    ('Mirkwood', 'Dol_Guldur', {'weight': 6, 'type': 'dangerous_path'}),
-    ('Dol_Guldur', 'Lorien', {'weight': 7, 'type': 'dangerous_path'}),
-    ('Dale', 'Iron_Hills', {'weight': 4, 'type': 'road'}),
-    ('Dale', 'Esgaroth', {'weight': 2, 'type': 'road'}),
-    ('Mirkwood', 'Rhosgobel', {'weight': 3, 'type': 'forest_path'}),
-    ('Rhosgobel', 'Lorien', {'weight': 4, 'type': 'forest_path'}),
-    ('Osgiliath', 'Minas_Morgul', {'weight': 5, 'type': 'dangerous_path'}),
-    ('Minas_Morgul', 'Cirith_Ungol', {'weight': 8, 'type': 'dangerous_path'}),
-    ('Cirith_Ungol', 'Mount_Doom', {'weight': 7, 'type': 'dangerous_path'}),
-    ('Minas_Tirith', 'Pelargir', {'weight': 3, 'type': 'road'}),
-    ('Osgiliath', 'Cair_Andros', {'weight': 3, 'type': 'road'}),
-    ('Cair_Andros', 'Dead_Marshes', {'weight': 5, 'type': 'hazardous_path'}),
-    ('Tharbad', 'Gap_of_Rohan', {'weight': 5, 'type': 'road'}),
-]
+@st.cache_resource(show_spinner=False, max_entries=2)
+def get_basemap(image_path, image_mtime):
+    """
+    The background map as a memory-mapped tile pyramid (see middle_earth/basemap.py),
+    opened once per process and rebuilt only when the file changes.
+    Raises FileNotFoundError if there's no map - those don't get cached.
+    """
+    cache_miss('basemap')
+    return Basemap.open(image_path)
 
-# Add bidirectional edges
-# Make all paths two-way (you can go there AND back again... get it?)
-for (src, dst, data) in routes:
-    G.add_edge(src, dst, **data)
-    G.add_edge(dst, src, **data)
+@st.cache_resource(show_spinner=False)
+def get_trace_buffer():
+    """
+    The timing panel's memory of recent reruns (shared by every session).
+    Also switches on whatever sinks MIDDLE_EARTH_TRACE asks for, once per process.
+    """
+    configure_from_env()
+    return RingBufferSink()
 
-def scale_coordinates(locations, original_width, original_height, new_width, new_height):
-    """
-    Makes our coordinates match the map size - just boring math stuff
-    Think of it like resizing a photo but for coordinates
-    """
-    scaled_locations = {}
-    for loc, data in locations.items():
-        x, y = data['pos']
-        # Basic cross multiplication to scale coordinates
-        new_x = (x / original_width) * new_width
-        new_y = (y / original_height) * new_height
-        scaled_locations[loc] = {'pos': (new_x, new_y), 'type': data['type']}
-    return scaled_locations
+@st.cache_resource(show_spinner=False)
+def get_result_cache():
+    """
+    Answers shared by every session (see middle_earth/results.py): once anyone
+    has asked "Bree to Mount Doom?", everyone else gets it for free.
+    Set MIDDLE_EARTH_RESULT_CACHE to a file to keep them across restarts too.
+    """
+    return result_cache_from_env()
 
-def create_visualization():
+def graph_fingerprint(G):
     """
-    This is where the magic happens - creates the whole map visualization
-    It's like drawing the map but with code instead of a pencil
+    Boils the whole graph down to one short string.
+    Same places, same positions, same paths = same fingerprint,
+    so we can tell when a cached map is still good.
     """
-    # Set up our canvas with a dark theme (because it looks cool)
-    plt.style.use('dark_background')
-    fig = plt.figure(figsize=(15, 10), facecolor='#222222')
-    
-    # Make space for our map
-    ax_map = fig.add_subplot(111)
-    ax_map.set_facecolor('#222222')
-    
-    # Try to load the fancy map background
+    return as_compact(G).fingerprint()
+
+def load_basemap(image_path=MAP_IMAGE_PATH):
+    """The (cached) background map, or None with a warning if the picture isn't there."""
     try:
-        map_img = mpimg.imread('middle_earth_map_optimized.png')
-        img_height, img_width = map_img.shape[:2]
-        
-        # Make the coordinates match the map size
-        desired_width = 50
-        desired_height = int(desired_width * (img_height/img_width))
-        scaled_locations = scale_coordinates(locations, 100, 75, desired_width, desired_height)
-        
-        # Update all our location coordinates
-        for loc, data in scaled_locations.items():
-            G.nodes[loc]['pos'] = data['pos']
-        
-        # Show the map
-        ax_map.imshow(map_img, extent=[0, desired_width, 0, desired_height], aspect='auto', alpha=0.8)
+        with cache_lookup('basemap'):
+            return get_basemap(image_path, file_mtime(image_path))
     except FileNotFoundError:
         st.error("Couldn't find the map image :( Using blank background instead")
-    
-    # Get node positions
-    pos = nx.get_node_attributes(G, 'pos')
-    
-    # Define node colors
-    node_colors = {
-        'city': '#ffd700',      # Gold
-        'haven': '#90EE90',     # Light green
-        'fortress': '#8B0000',  # Dark red
-        'mountain': '#4a4a4a',  # Dark gray
-        'forest': '#228B22',    # Forest green
-        'ruin': '#8B4513',      # Saddle brown
-        'town': '#FFA500',      # Orange
-        'gate': '#000000',      # Black
-        'hazard': '#800080',    # Purple
-        'pass': '#A9A9A9'       # Gray
-    }
-    
-    # Draw edges
-    edge_colors = []
-    edge_styles = []
-    for (u, v) in G.edges():
-        if G[u][v]['type'] in ['dangerous_path', 'hazardous_path']:
-            edge_colors.append('#FF0000')
-            edge_styles.append('dotted')
-        else:
-            edge_colors.append('#463E3F')
-            edge_styles.append('solid')
-    
-    nx.draw_networkx_edges(G, pos,
-                          edge_color=edge_colors,
-                          style=edge_styles,
-                          width=1.5,
-                          alpha=0.7,
-                          ax=ax_map)
-    
-    # Draw nodes
-    for node_type in set(nx.get_node_attributes(G, 'type').values()):
-        node_list = [node for node in G.nodes() if G.nodes[node]['type'] == node_type]
-        nx.draw_networkx_nodes(G, pos,
-                             nodelist=node_list,
-                             node_color=node_colors[node_type],
-                             node_size=700,
-                             edgecolors='black',
-                             linewidths=2,
-                             alpha=0.8,
-                             ax=ax_map)
-    
-    # Add labels
-    texts = []
-    for node, (x, y) in pos.items():
-        texts.append(ax_map.text(x, y, node.replace('_', ' '),
-                               fontsize=12,
-                               horizontalalignment='center',
-                               verticalalignment='center'))
-    
-    adjust_text(texts,
-               arrowprops=dict(arrowstyle='-', color='gray', alpha=0.5, lw=0.5),
-               ax=ax_map)
-    
-    # Create legend
-    legend_elements = []
-    for loc_type, color in node_colors.items():
-        legend_elements.append(
-            mpatches.Patch(facecolor=color, edgecolor='black',
-                          label=loc_type.replace('_', ' ').title())
-        )
-    
-    legend_elements.extend([
-        plt.Line2D([0], [0], color='#463E3F', linestyle='-',
-                  label='Safe Path'),
-        plt.Line2D([0], [0], color='#FF0000', linestyle=':',
-                  label='Dangerous Path')
-    ])
-    
-    ax_map.legend(handles=legend_elements,
-                 title='Map Legend',
-                 title_fontsize=12,
-                 fontsize=10,
-                 loc='lower center',
-                 bbox_to_anchor=(0.5, -0.1),
-                 ncol=3,
-                 borderaxespad=0,
-                 labelcolor='white')
-    
-    plt.tight_layout()
-    return fig
+        return None
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def render_map_png(graph_key, image_path, image_mtime, figsize, viewport=None, _graph=None):
+    """
+    Draws the map once and hands back the finished PNG.
+    Streamlit remembers the result for each (graph, image, mtime, size, viewport) combo,
+    so flipping the analysis dropdown doesn't redraw all of Middle Earth.
+    The graph itself is skipped when hashing (that's what the leading _ does) -
+    graph_key stands in for it.
+    """
+    import matplotlib.pyplot as plt
+    cache_miss('map_png')
+    fig = create_visualization(_graph, load_basemap(image_path), figsize, RENDER_DPI, viewport)
+    buf = io.BytesIO()
+    # Same settings st.pyplot uses, so the cached map looks identical
+    with span('savefig'):
+        fig.savefig(buf, format='png', dpi=RENDER_DPI, bbox_inches='tight')
+    plt.close(fig)
+    return buf.getvalue()
+
+def get_map_png(graph=None, image_path=MAP_IMAGE_PATH, figsize=FIGURE_SIZE, viewport=None):
+    """
+    Gets the rendered map, reusing a cached copy whenever nothing changed.
+    Swapping the map file (new mtime) or editing the graph means a fresh render.
+    """
+    if graph is None:
+        graph = get_graph()
+    with cache_lookup('map_png'):
+        return render_map_png(graph_fingerprint(graph), image_path, file_mtime(image_path),
+                              tuple(figsize), tuple(viewport) if viewport else None, _graph=graph)
 
-def shortest_path_analysis(G, start='Bree', end='Mount_Doom'):
+@st.cache_resource(show_spinner=False, max_entries=4)
+def get_map_payload(graph_key, image_path, image_mtime, _graph):
     """
-    Finds the safest path between two places - like Google Maps for Middle Earth!
-    Uses something called Dijkstra's algorithm, but don't worry too much about that.
-    Just know it's really good at finding the best path when each step has a "cost".
+    Everything the interactive map needs (geometry + a right-sized background
+    picture), built once per graph version and shared by every session.
     """
+    cache_miss('map_payload')
     try:
-        # Find the path with the lowest danger score
-        path = nx.shortest_path(G, start, end, weight='weight')
-        # Calculate total danger score for the whole journey
-        distance = nx.shortest_path_length(G, start, end, weight='weight')
-        
-        # Let's get some details about each step of the journey
-        path_details = []
-        for i in range(len(path)-1):
-            current = path[i]
-            next_loc = path[i+1]
-            # Look up info about the path between these two places
-            edge_data = G[current][next_loc]
-            
-            # Store all the juicy details
-            path_details.append({
-                'from': current.replace('_', ' '),  # Make it look prettier
-                'to': next_loc.replace('_', ' '),
-                'danger_level': edge_data['weight'],
-                'path_type': edge_data['type'].replace('_', ' ')
-            })
-        
-        return {
-            'path': [p.replace('_', ' ') for p in path],  # Full journey
-            'total_danger': distance,                      # Total danger score
-            'path_details': path_details                   # Step-by-step details
-        }
-    except nx.NetworkXNoPath:
-        # Uh oh, no path found! (like trying to walk into Mordor... oh wait)
-        return None
+        background = background_image(get_basemap(image_path, image_mtime), MAP_EXTENT)
+    except FileNotFoundError:
+        background = None
+    return map_payload(_graph, graph_key, background)
 
-def strategic_locations_analysis(G, top_n=5):
+def show_vector_map(G, route=None, image_path=MAP_IMAGE_PATH):
     """
-    Figures out which places are the most important for controlling Middle Earth.
-    Kind of like finding the most popular intersections in a city, but for fantasy!
-    
-    The 'betweenness_centrality' thing is just a fancy way of saying:
-    "How often do you HAVE to go through this place to get anywhere else?"
+    Draws the interactive map (pan, zoom, hover for names) with route lit up.
+
+    The browser keeps the map between reruns, so the geometry only gets sent
+    when it doesn't have it yet - after that a rerun just sends what changed
+    about the highlighted route (usually nothing at all).
     """
-    # This calculates how important each location is based on paths going through it
-    centrality = nx.betweenness_centrality(G, weight='weight')
-    
-    # Sort locations by importance score (highest to lowest)
-    sorted_locations = sorted(
-        centrality.items(),
-        key=lambda x: x[1],
-        reverse=True
-    )[:top_n]
-    
-    # Let's get more info about each important place
-    strategic_details = []
-    for loc, score in sorted_locations:
-        # Count how many paths connect to this place
-        connections = len(G.edges(loc))
-        
-        # Calculate average danger of paths around this place
-        danger_levels = [G[loc][neighbor]['weight'] 
-                        for neighbor in G.neighbors(loc)]
-        avg_danger = sum(danger_levels) / len(danger_levels)
-        
-        # Combine all the stats
-        strategic_details.append({
-            'location': loc.replace('_', ' '),
-            'strategic_value': round(score * 100, 2),  # Make it a percentage
-            'num_paths': connections,
-            'avg_danger': round(avg_danger, 2)
-        })
-    
-    return strategic_details
+    graph_key = graph_fingerprint(G)
+    state = st.session_state.setdefault('vector_map_state', HighlightState())
+    # What the browser told us last time: {'version', 'seq', 'gap'}
+    client = st.session_state.get('vector_map') or {}
+    try:
+        nodes, edges = route_ids(G, route) if route else ([], [])
+    except KeyError:
+        # Somebody closed a path on it since: nothing left to light up
+        st.session_state.pop('route', None)
+        nodes, edges = [], []
 
-def regional_groups_analysis(G):
+    geometry = None
+    if client.get('version') != graph_key:
+        # New browser tab (or the graph changed): send the lot
+        with cache_lookup('map_payload'):
+            geometry = get_map_payload(graph_key, image_path, file_mtime(image_path), G)
+        highlight = state.reset(nodes, edges)
+    elif client.get('gap') and client.get('seq') != state.seq:
+        # It missed a diff somewhere, so send the whole highlight again
+        highlight = state.reset(nodes, edges)
+    else:
+        highlight = state.update(nodes, edges)
+    vector_map(geometry=geometry, highlight=highlight, key='vector_map', default=None)
+
+@st.cache_resource(show_spinner=False)
+def get_network(_graph):
     """
-    Groups nearby locations together to find natural "regions" of Middle Earth.
-    Like finding cliques in high school, but for fantasy locations!
-    
-    Uses the Louvain method - it's pretty smart about grouping things.
-    It looks at how places are connected and groups them based on their relationships.
+    The graph's editor (see middle_earth/dynamic.py), shared by every session.
+    It owns the routing index and keeps it up to date across edits (just the
+    affected routes get redone), and the exact strategic scores too once
+    somebody has asked for them. Edits give the graph a new fingerprint, so
+    everything cached on the old one simply stops matching.
     """
-    # Convert our graph to undirected (paths work both ways)
-    G_undirected = G.to_undirected()
-    
-    # Find communities using the Louvain algorithm
-    # Don't worry too much about the math - it's basically magic
-    communities = list(nx.community.louvain_communities(
-        G_undirected,
-        weight='weight',
-        resolution=1.0  # How picky we are about making groups
-    ))
-    
-    # Let's analyze each group we found
-    region_analysis = []
-    for i, community in enumerate(communities):
-        # Get a mini-graph of just this community
-        subgraph = G_undirected.subgraph(community)
-        
-        # Calculate how connected this region is internally
-        internal_edges = subgraph.number_of_edges()
-        possible_edges = len(community) * (len(community) - 1) / 2
-        density = internal_edges / possible_edges if possible_edges > 0 else 0
-        
-        # Find the average danger level within the region
-        danger_levels = [G_undirected[u][v]['weight'] 
-                        for u, v in subgraph.edges()]
-        avg_danger = sum(danger_levels) / len(danger_levels) if danger_levels else 0
-        
-        # Get the most central location in this region
-        # (like finding the capital city)
-        subgraph_centrality = nx.degree_centrality(subgraph)
-        capital = max(subgraph_centrality.items(), key=lambda x: x[1])[0]
-        
-        region_analysis.append({
-            'region_number': i + 1,
-            'locations': [loc.replace('_', ' ') for loc in sorted(community)],
-            'size': len(community),
-            'connectivity': round(density * 100, 2),  # Make it a percentage
-            'avg_danger': round(avg_danger, 2),
-            'regional_capital': capital.replace('_', ' ')
-        })
-    
-    return region_analysis
+    cache_miss('routing_index')
+    return DynamicNetwork(_graph)
+
+def get_routing_index(G):
+    """The shared routing index (always up to date with the latest edits)."""
+    with cache_lookup('routing_index'):
+        return get_network(G).index
+
+def edit_map(network, action):
+    """
+    The map editor's buttons. A callback runs before the rerun starts, so
+    this session isn't in the middle of reading the map while it changes.
+    """
+    start, end = st.session_state['edit_start'], st.session_state['edit_end']
+    danger = st.session_state['edit_danger']
+    pretty = lambda name: name.replace('_', ' ')
+    try:
+        if start == end:
+            raise ValueError("a path has to go somewhere else")
+        if action == 'close':
+            change = network.remove_edge(start, end)
+        else:
+            try:
+                change = network.set_weight(start, end, danger)
+            except KeyError:
+                # No path there yet: open one
+                change = network.add_edge(start, end, danger)
+    except KeyError:
+        st.session_state['edit_message'] = ('error', f"There's no path between {pretty(start)} and {pretty(end)}")
+    except ValueError as e:
+        st.session_state['edit_message'] = ('error', f"Couldn't change that: {e}")
+    else:
+        what = "closed" if action == 'close' else f"set to danger {danger:g}"
+        st.session_state['edit_message'] = (
+            'success', f"{pretty(start)} to {pretty(end)} {what} "
+                       f"({len(change['affected_sources'])} saved routes had to be redone)")
 
+def show_map_editor(G, network):
+    """
+    The sidebar's map editor: make a path more (or less) dangerous, open a new
+    one or close one. There's one map for everybody, so everybody sees it.
+    """
+    with st.sidebar.expander("🛠️ Edit the map"):
+        names = sorted(G.names)
+        st.selectbox("From", names, key='edit_start')
+        st.selectbox("To", names, index=min(1, len(names) - 1), key='edit_end')
+        st.number_input("Danger level", min_value=0.0, value=5.0, step=1.0, key='edit_danger')
+        left, right = st.columns(2)
+        left.button("Set danger", on_click=edit_map, args=(network, 'set'))
+        right.button("Close path", on_click=edit_map, args=(network, 'close'))
+        st.caption("No path there yet? Setting a danger level opens one.")
+        message = st.session_state.pop('edit_message', None)
+        if message:
+            kind, text = message
+            (st.success if kind == 'success' else st.error)(text)
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def get_heuristic(graph_key, kind, _graph):
+    """
+    A* guessers, built once per graph version. The landmark one runs a handful
+    of full Dijkstras up front, so we really don't want to redo it per click.
+    """
+    cache_miss('heuristic')
+    if kind == 'landmarks':
+        return LandmarkHeuristic(_graph, seed=0)
+    return CoordinateHeuristic(_graph)
+
+@traced('show_results')
 def display_results(results, analysis_type):
     """
     Shows the results in a nice way in our Streamlit app
@@ -388,6 +265,8 @@ def display_results(results, analysis_type):
         # Show the path as a cool journey
         path_str = " → ".join(results['path'])
         st.write(f"Complete Path: {path_str}")
+        if 'settled_nodes' in results:
+            st.write(f"Places Explored: {results['settled_nodes']}")
         
         # Make a nice table for the step-by-step details
         st.write("### Step by Step Breakdown:")
@@ -396,12 +275,42 @@ def display_results(results, analysis_type):
                 st.write(f"Path Type: {step['path_type']}")
                 st.write(f"Danger Level: {step['danger_level']}/10")
                 
+    elif analysis_type == "alternatives":
+        st.write("### 🧭 Routes to Choose From")
+        for route in results:
+            with st.expander(f"Route {route['rank']} - Total Danger: {route['total_danger']:.2f}",
+                             expanded=route['rank'] == 1):
+                st.write(" → ".join(route['path']))
+                for step in route['path_details']:
+                    st.write(f"{step['from']} to {step['to']}: {step['path_type']} "
+                             f"(danger {step['danger_level']}/10)")
+                
+    elif analysis_type == "tradeoffs":
+        st.write("### ⚖️ Safe or Short?")
+        st.caption("Each of these is safer or shorter than every other one - the rest aren't worth a hobbit's time.")
+        st.line_chart({'Distance': [route['total_distance'] for route in results],
+                       'Danger': [route['total_danger'] for route in results]},
+                      x='Distance', y='Danger')
+        pick = st.select_slider(
+            "Route to show (safest → shortest)", options=[route['rank'] for route in results],
+            format_func=lambda rank: f"#{rank}: danger {results[rank - 1]['total_danger']:.1f}, "
+                                     f"distance {results[rank - 1]['total_distance']:.1f}")
+        route = results[pick - 1]
+        # This one goes on the map
+        st.session_state['route'] = route['path']
+        st.write(" → ".join(route['path']))
+        for step in route['path_details']:
+            st.write(f"{step['from']} to {step['to']}: {step['path_type']} "
+                     f"(danger {step['danger_level']}/10, distance {step['distance']})")
+                
     elif analysis_type == "strategic":
         st.write("### 🗺️ Strategic Locations Identified")
         for loc in results:
             with st.expander(f"{loc['location']} (Score: {loc['strategic_value']}%)"):
                 st.write(f"Connected Paths: {loc['num_paths']}")
                 st.write(f"Average Danger: {loc['avg_danger']}/10")
+                if 'confidence' in loc:
+                    st.write(f"Ranking Confidence: {loc['confidence']}%")
                 
     elif analysis_type == "regions":
         st.write("### 🏰 Regional Analysis")
@@ -410,53 +319,240 @@ def display_results(results, analysis_type):
                 st.write(f"Member Locations: {', '.join(region['locations'])}")
                 st.write(f"Regional Connectivity: {region['connectivity']}%")
                 st.write(f"Average Danger Level: {region['avg_danger']}/10")
+                
+    elif analysis_type == "batch":
+        st.write("### 📜 Journey Planner Results")
+        found = [result for _, _, result in results if result]
+        total_danger = sum(result['total_danger'] for result in found)
+        
+        # The big numbers first
+        c1, c2, c3 = st.columns(3)
+        c1.metric("Journeys", len(results))
+        c2.metric("Possible", len(found), delta=f"-{len(results) - len(found)} impossible"
+                  if len(found) < len(results) else None)
+        c3.metric("Average Danger", f"{total_danger / len(found):.2f}" if found else "-")
+        st.write(f"Total Danger Across All Journeys: {total_danger:.2f}")
+        
+        # One row per journey
+        st.dataframe([
+            {'Start': start.replace('_', ' '), 'End': end.replace('_', ' '),
+             'Total Danger': result['total_danger'] if result else None,
+             'Steps': len(result['path_details']) if result else None}
+            for start, end, result in results
+        ], hide_index=True)
+        
+        # Take the results home with you
+        csv_file, jsonl_file = io.StringIO(), io.StringIO()
+        write_csv(results, csv_file)
+        write_jsonl(results, jsonl_file)
+        d1, d2 = st.columns(2)
+        d1.download_button("Download CSV", csv_file.getvalue(), "journeys.csv", "text/csv")
+        d2.download_button("Download JSONL", jsonl_file.getvalue(), "journeys.jsonl",
+                           "application/jsonl")
+
+def show_timing_panel(rerun):
+    """
+    The sidebar's "where did the time go" panel: every stage of this rerun
+    (nested ones indented under what called them), plus how often each cache
+    saved us the work over the last few reruns.
+    """
+    buffer = get_trace_buffer()
+    buffer.emit(rerun.record())
+    with st.sidebar:
+        st.write("### ⏱️ Where the time went")
+        st.metric("This rerun", f"{rerun.seconds * 1000:.1f} ms")
+        st.dataframe([
+            {'Stage': '\u2003' * s['depth'] + s['name'], 'ms': round(s['seconds'] * 1000, 2)}
+            for s in rerun.spans if s['seconds'] is not None
+        ], hide_index=True)
+        rates = buffer.cache_rates()
+        if rates:
+            st.write(f"Cache hits (last {len(buffer.traces())} reruns)")
+            st.dataframe([
+                {'Cache': name, 'Hits': r['hits'], 'Misses': r['misses'],
+                 'Hit rate': f"{r['hit_rate']:.0%}"}
+                for name, r in sorted(rates.items())
+            ], hide_index=True)
+        # The shared result cache counts every session, not just these reruns
+        stats = get_result_cache().stats()
+        st.caption(f"Shared results: {stats['entries']} kept, {stats['hits'] + stats['disk_hits']} hits, "
+                   f"{stats['misses']} misses since start-up")
 
 def main():
     """
     This is where everything comes together!
     Like the Council of Elrond, but for code.
     """
-    st.title("Middle Earth Network Analysis")
-    st.write("Analyzing the paths and places of Middle Earth, because walking into Mordor actually requires some planning!")
+    # Where does the time go? (see middle_earth/tracing.py)
+    show_timings = st.sidebar.toggle("⏱️ Timing panel")
+    with trace('rerun', force=show_timings) as rerun:
+        with cache_lookup('graph'):
+            G = get_graph()
+        with cache_lookup('routing_index'):
+            network = get_network(G)
+        show_map_editor(G, network)
+        # Nobody gets to edit the map while this rerun is reading it
+        # (edits wait for us, we wait for edits - see middle_earth/dynamic.py)
+        with network.reading():
+            st.title("Middle Earth Network Analysis")
+            st.write("Analyzing the paths and places of Middle Earth, because walking into Mordor actually requires some planning!")
     
-    # Create two columns - map on left, analysis on right
-    col1, col2 = st.columns([2, 1])
+            # Create two columns - map on left, analysis on right
+            col1, col2 = st.columns([2, 1])
     
-    with col1:
-        # Show our awesome map
-        fig = create_visualization()
-        st.pyplot(fig)
+            with col1:
+                interactive = st.toggle("Interactive map", value=True)
+                # The map gets drawn last, so it can show whatever route we find below
+                map_slot = st.empty()
     
-    with col2:
-        # Add analysis options
-        analysis_type = st.selectbox(
-            "What would you like to analyze?",
-            ["Path Finder", "Strategic Locations", "Regional Groups"]
-        )
+            with col2:
+                # Add analysis options
+                analysis_type = st.selectbox(
+                    "What would you like to analyze?",
+                    ["Path Finder", "Strategic Locations", "Regional Groups"]
+                )
         
-        if analysis_type == "Path Finder":
-            # Let users pick start and end points
-            start = st.selectbox("Start Location", sorted(G.nodes()))
-            end = st.selectbox("End Location", sorted(G.nodes()))
+                if analysis_type == "Path Finder":
+                    # Let users pick start and end points
+                    start = st.selectbox("Start Location", sorted(G.names))
+                    end = st.selectbox("End Location", sorted(G.names))
+                    # All of these find an equally safe path, they just do different amounts of work
+                    method = st.selectbox("Search Method", ["Precomputed index", "Dijkstra",
+                                                            "A* (map distance)", "ALT (landmarks)"])
+                
+                    # Not every hobbit wants the fastest way through Mordor
+                    with st.expander("🛡️ Route rules & alternatives"):
+                        pretty = lambda name: name.replace('_', ' ').title()
+                        avoid_paths = st.multiselect("Never use these paths", sorted(G.edge_type_names),
+                                                     format_func=pretty)
+                        avoid_places = st.multiselect("Stay out of these places", sorted(G.node_type_names),
+                                                      format_func=pretty)
+                        # All the way up = no limit
+                        worst = max(math.ceil(float(G.weights.max())), 2) if G.number_of_edges() else 10
+                        max_leg = st.slider("Most dangerous single path allowed", 1, worst, worst)
+                        alternatives = st.number_input("Routes to show", 1, 10, 1)
+                        st.caption("Start and end are always allowed. With rules or more than one "
+                                   "route the search method above doesn't apply.")
+                    use_rules = bool(avoid_paths or avoid_places or max_leg < worst or alternatives > 1)
+                    rules = (tuple(avoid_paths), tuple(avoid_places), max_leg if max_leg < worst else None)
+                    # Safest is a long way round, shortest goes through Mordor... what's in between?
+                    tradeoffs = st.toggle("⚖️ Danger vs distance trade-offs")
             
-            if st.button("Find Path"):
-                results = shortest_path_analysis(G, start, end)
-                if results:
-                    display_results(results, "path")
-                else:
-                    st.error("No safe path found! Maybe try taking the eagles? 🦅")
+                    find = st.button("Find Path")
+                    if find and tradeoffs:
+                        index = get_routing_index(G)
+                        # Kept around so picking a route on the curve doesn't mean searching again
+                        # (but only for this exact question on this map - new places, rules or edits need a new search)
+                        st.session_state['tradeoffs'] = ((graph_fingerprint(G), start, end, rules), tradeoff_routes_analysis(
+                            G, start, end, *rules, index=index if index.dense else None))
+                    if tradeoffs and st.session_state.get('tradeoffs', (None, None))[0] == (graph_fingerprint(G), start, end, rules):
+                        results = st.session_state['tradeoffs'][1]
+                        if results:
+                            display_results(results, "tradeoffs")
+                        else:
+                            st.session_state.pop('route', None)
+                            st.error("No route follows those rules! Maybe loosen them, or take the eagles? 🦅")
+                    elif find and use_rules:
+                        results = alternative_routes_analysis(G, start, end, int(alternatives), *rules)
+                        if results:
+                            # The safest one goes on the map
+                            st.session_state['route'] = results[0]['path']
+                            display_results(results, "alternatives")
+                        else:
+                            st.session_state.pop('route', None)
+                            st.error("No route follows those rules! Maybe loosen them, or take the eagles? 🦅")
+                    elif find:
+                        graph_key = graph_fingerprint(G)
+
+                        def find_path():
+                            if method == "Precomputed index":
+                                return shortest_path_analysis(G, start, end, index=get_routing_index(G))
+                            if method == "Dijkstra":
+                                return shortest_path_analysis(G, start, end)
+                            kind = 'landmarks' if method.startswith("ALT") else 'coordinates'
+                            with cache_lookup('heuristic'):
+                                heuristic = get_heuristic(graph_key, kind, G)
+                            return shortest_path_analysis(G, start, end, heuristic=heuristic)
+
+                        # Somebody probably asked this one already
+                        results = get_result_cache().fetch(
+                            'path', G, {'start': start, 'end': end, 'method': method}, find_path)
+                        if results:
+                            # Remember it so the map keeps showing it on later reruns
+                            st.session_state['route'] = results['path']
+                            display_results(results, "path")
+                        else:
+                            st.session_state.pop('route', None)
+                            st.error("No safe path found! Maybe try taking the eagles? 🦅")
+            
+                    # Got a whole fellowship's worth of trips? Plan them all in one go
+                    with st.expander("📜 Plan many journeys at once"):
+                        st.write("Upload a CSV with `start` and `end` columns (or JSON Lines with the same keys).")
+                        upload = st.file_uploader("Journey list", type=["csv", "jsonl"])
+                        if upload is not None and st.button("Plan Journeys"):
+                            fmt = upload.name.rsplit('.', 1)[-1].lower()
+                            index = get_routing_index(G)
+                            try:
+                                pairs = read_pairs(upload, fmt)
+                                missing = sorted({p for pair in pairs for p in pair if place_name(G, p) is None})
+                                if missing:
+                                    raise ValueError(f"no such places on this map: {', '.join(missing)}")
+                                # Always through the shared index: small maps have every route solved already,
+                                # big ones search right here (one tree per start, kept for next time) rather
+                                # than forking a process pool full of copies of the whole Streamlit server
+                                with span('plan_routes'):
+                                    results = list(plan_routes(G, pairs, index=index))
+                            except ValueError as e:
+                                st.error(f"Couldn't plan those journeys: {e}")
+                            else:
+                                display_results(results, "batch")
                     
-        elif analysis_type == "Strategic Locations":
-            n_locations = st.slider("Number of locations to analyze", 3, 10, 5)
+                elif analysis_type == "Strategic Locations":
+                    n_locations = st.slider("Number of locations to analyze", 3, 10, 5)
+                    # Exact is perfect but slow on huge maps, approximate samples start points instead
+                    mode = st.radio("Mode", ["Exact", "Approximate"], horizontal=True)
+                    epsilon = 0.05
+                    if mode == "Approximate":
+                        epsilon = st.slider("Error bound (± score)", 0.01, 0.2, 0.05, step=0.01)
             
-            if st.button("Analyze Strategic Points"):
-                results = strategic_locations_analysis(G, n_locations)
-                display_results(results, "strategic")
+                    if st.button("Analyze Strategic Points"):
+                        bar = st.progress(0.0, text="Counting routes...")
+                        # The slow part doesn't care how many places we show, so one
+                        # ranking (per mode) serves every slider value and every session
+                        # (exact scores live in the map editor, so after an edit only the affected part gets redone)
+                        ranking = get_result_cache().fetch(
+                            'centrality', G,
+                            {'mode': mode.lower(), 'epsilon': epsilon if mode == "Approximate" else None},
+                            lambda: centrality_ranking(
+                                G, mode.lower(), epsilon,
+                                progress=lambda done, total: bar.progress(done / total, text=f"Counting routes... {done}/{total}"),
+                                network=get_network(G)
+                            ))
+                        bar.empty()
+                        results = strategic_locations_analysis(G, n_locations, mode=mode.lower(), ranking=ranking)
+                        display_results(results, "strategic")
                 
-        else:  # Regional Groups
-            if st.button("Analyze Regions"):
-                results = regional_groups_analysis(G)
-                display_results(results, "regions")
+                else:  # Regional Groups
+                    # Louvain can occasionally glue together two pieces that don't touch
+                    connected = st.checkbox("Only connected regions (Leiden-style clean-up)")
+            
+                    if st.button("Analyze Regions"):
+                        results = get_result_cache().fetch(
+                            'regions', G, {'seed': 0, 'resolution': 1.0, 'connected': connected},
+                            lambda: regional_groups_analysis(G, connected=connected))
+                        display_results(results, "regions")
+    
+            with map_slot.container(), span('map'):
+                if interactive:
+                    show_vector_map(G, st.session_state.get('route'))
+                else:
+                    # Show our awesome (static) map
+                    png = get_map_png()
+                    with span('show_image'):
+                        st.image(png, width='stretch')
+
+    if show_timings:
+        show_timing_panel(rerun)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
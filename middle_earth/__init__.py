@@ -0,0 +1,4 @@
+"""
+The non-Streamlit bits of the Middle Earth network app live here.
+app.py does the talking to the browser, this package does the thinking.
+"""
@@ -0,0 +1,3 @@
+from middle_earth.cli import main
+
+main()
@@ -0,0 +1,303 @@
+"""
+Routes with rules, and second (and third...) opinions.
+
+RouteFilter says what a route may NOT use: path types ("never take a
+dangerous_path"), place types ("stay out of fortresses") and legs above a
+danger limit. It never copies the graph - it boils down to one yes/no per
+entry of the CSR adjacency lists, and the searches just skip the no's.
+The start and end of a journey are always allowed (if you're going to
+Barad-dur, you're going into a fortress).
+
+k_shortest_paths() then finds the k safest routes that never visit a place
+twice (Yen's algorithm): every new route branches off an earlier one at
+some "spur" place and takes the best way home from there that doesn't reuse
+the earlier branch. Doing a full Dijkstra for every spur would be slow on big
+maps, so we reuse one search tree instead:
+
+- one Dijkstra grows backwards from the end, giving the exact danger left
+  from every place it reaches (it only grows as far as the routes we need)
+- spur searches are A* with that as the guess, which leads them straight
+  home - and as soon as they hit a place whose tree route home is still
+  allowed, that IS the best way, so they stop right there
+- a spur search also gives up once it can't beat the k-th best route we
+  already have lined up
+"""
+import heapq
+from itertools import count
+import math
+
+import numpy as np
+
+from middle_earth.graph import as_compact
+from middle_earth.routing import NO_PRED, _node_id
+
+
+class RouteFilter:
+    """
+    What a route isn't allowed to use. Every rule is optional:
+
+    avoid_edge_types   path types to stay off (e.g. 'dangerous_path')
+    avoid_node_types   place types to stay out of (e.g. 'fortress')
+    max_leg_danger     no single path more dangerous than this
+    """
+
+    def __init__(self, avoid_edge_types=(), avoid_node_types=(), max_leg_danger=None):
+        self.avoid_edge_types = tuple(avoid_edge_types)
+        self.avoid_node_types = tuple(avoid_node_types)
+        self.max_leg_danger = max_leg_danger
+
+    def __bool__(self):
+        return bool(self.avoid_edge_types or self.avoid_node_types or self.max_leg_danger is not None)
+
+    def __repr__(self):
+        return (f'RouteFilter(avoid_edge_types={self.avoid_edge_types}, '
+                f'avoid_node_types={self.avoid_node_types}, max_leg_danger={self.max_leg_danger})')
+
+    @staticmethod
+    def _codes(names, known, what):
+        missing = [name for name in names if name not in known]
+        if missing:
+            raise ValueError(f"No {what} type called {', '.join(map(repr, missing))} "
+                             f"(try {', '.join(known)})")
+        return [known.index(name) for name in names]
+
+    def edge_mask(self, G):
+        """True for every edge (by edge id) a route may use."""
+        cg = as_compact(G)
+        ok = ~np.isin(cg.edge_types, self._codes(self.avoid_edge_types, cg.edge_type_names, 'path'))
+        if self.max_leg_danger is not None:
+            ok &= cg.weights <= self.max_leg_danger
+        return ok
+
+    def node_mask(self, G):
+        """True for every place (by node id) a route may pass through."""
+        cg = as_compact(G)
+        return ~np.isin(cg.node_types, self._codes(self.avoid_node_types, cg.node_type_names, 'place'))
+
+    def arc_mask(self, G, keep=()):
+        """
+        One bool per entry of the adjacency lists (lined up with cg.arc_lists):
+        may a route walk along this arc? Places in keep are always allowed.
+        """
+        cg = as_compact(G)
+        nodes = self.node_mask(cg)
+        nodes[list(keep)] = True
+        return (self.edge_mask(cg)[cg.adj_edges] & nodes[cg.adj_nodes]).tolist()
+
+
+class _ReverseTree:
+    """
+    Dijkstra growing backwards from the target, one step at a time when asked.
+    Settled places know their exact danger to the target (dist) and their next
+    step towards it (succ); everything else is at least `radius` away.
+    """
+
+    def __init__(self, arcs, allowed, target):
+        self.arcs, self.allowed = arcs, allowed
+        self.target = target
+        self.dist = {target: 0.0}
+        self.succ = {target: NO_PRED}
+        self.settled = set()
+        self.radius = 0.0
+        self._c = count()
+        self._heap = [(0.0, next(self._c), target)]
+
+    def grow(self, until_node=None, until_radius=math.inf):
+        """Settles places until until_node is settled, the radius passes until_radius, or we run out."""
+        indptr, nbrs, wts = self.arcs
+        allowed, dist, succ, heap = self.allowed, self.dist, self.succ, self._heap
+        while heap:
+            if until_node in self.settled or heap[0][0] > until_radius:
+                break
+            d, _, u = heapq.heappop(heap)
+            if u in self.settled:
+                continue
+            self.settled.add(u)
+            self.radius = d
+            for k in range(indptr[u], indptr[u + 1]):
+                # Routes are two-way, so arc u -> v walked backwards is the step v -> u
+                # (and the mask already checks that v may be on a route)
+                if allowed is not None and not allowed[k]:
+                    continue
+                v = nbrs[k]
+                nd = d + wts[k]
+                if nd < dist.get(v, math.inf):
+                    dist[v] = nd
+                    succ[v] = u
+                    heapq.heappush(heap, (nd, next(self._c), v))
+        if not heap:
+            # Nothing left to find: everything unsettled is unreachable
+            self.radius = math.inf
+
+    def estimate(self, v):
+        """Never more than the real danger from v to the target (exact once v is settled)."""
+        if v in self.settled:
+            return self.dist[v]
+        return self.radius
+
+    def route_home(self, v):
+        """Places from v to the target along the tree (v has to be settled)."""
+        route = [v]
+        while route[-1] != self.target:
+            route.append(self.succ[route[-1]])
+        return route
+
+
+def _route_costs(arcs, allowed, route):
+    """Danger so far at every place along a route (cheapest allowed path for each leg)."""
+    indptr, nbrs, wts = arcs
+    costs = [0.0]
+    for u, v in zip(route, route[1:]):
+        costs.append(costs[-1] + min(wts[k] for k in range(indptr[u], indptr[u + 1])
+                                     if nbrs[k] == v and (allowed is None or allowed[k])))
+    return costs
+
+
+def _tree_suffix(tree, route):
+    """Smallest m such that route[m:] is just the tree's own way home."""
+    m = len(route) - 1
+    while m > 0 and route[m - 1] in tree.settled and tree.succ[route[m - 1]] == route[m]:
+        m -= 1
+    return m
+
+
+def _clean_way_home(tree, way, route, where, suffix, i, banned_next):
+    """
+    The tree's way home from the end of way (places after it), or None if that
+    would go back through route[:i], loop back onto way, or leave the spur
+    (route[i]) by a banned next step.
+
+    Once it joins route somewhere past everything way touched, and past the
+    point where route itself follows the tree, the rest is just route's tail.
+    """
+    succ, target = tree.succ, tree.target
+    on_way = set(way)
+    # Furthest along route that way has been (at least the spur itself)
+    furthest = max(where.get(v, -1) for v in way)
+    home = []
+    v = way[-1]
+    while v != target:
+        nxt = succ[v]
+        if len(way) == 1 and not home and nxt in banned_next:
+            return None
+        if where.get(nxt, i) < i or nxt in on_way:
+            return None
+        home.append(nxt)
+        j = where.get(nxt)
+        if j is not None and j >= suffix and j > furthest:
+            return home + route[j + 1:]
+        v = nxt
+    return home
+
+
+def _spur_search(arcs, allowed, tree, route, where, suffix, i, banned_next, budget):
+    """
+    Best route from the spur (route[i]) to the tree's target that doesn't go
+    back through route[:i] or step from the spur straight into banned_next.
+    where maps place -> position along route, and route[suffix:] is the tree's
+    own way home. Returns (places from the spur on, danger from the spur),
+    or None if nothing comes in under budget.
+    """
+    indptr, nbrs, wts = arcs
+    estimate, settled = tree.estimate, tree.settled
+    spur = route[i]
+    dist = {spur: 0.0}
+    pred = {spur: NO_PRED}
+    done = set()
+    c = count()
+    heap = [(estimate(spur), 0.0, next(c), spur)]
+    while heap:
+        f, d, _, u = heapq.heappop(heap)
+        if u in done:
+            continue
+        if f > budget or math.isinf(f):
+            return None
+        done.add(u)
+
+        if u in settled:
+            # The guess is exact here: if the tree's way home is still allowed, it's the best one
+            way = [u]
+            while way[-1] != spur:
+                way.append(pred[way[-1]])
+            way.reverse()
+            home = _clean_way_home(tree, way, route, where, suffix, i, banned_next)
+            if home is not None:
+                return way + home, f
+
+        for k in range(indptr[u], indptr[u + 1]):
+            v = nbrs[k]
+            if where.get(v, i) < i or (allowed is not None and not allowed[k]):
+                continue
+            if u == spur and v in banned_next:
+                continue
+            nd = d + wts[k]
+            if nd < dist.get(v, math.inf):
+                dist[v] = nd
+                pred[v] = u
+                heapq.heappush(heap, (nd + estimate(v), nd, next(c), v))
+    return None
+
+
+def k_shortest_paths(G, start, end, k=3, route_filter=None):
+    """
+    Up to k safest routes from start to end that never visit a place twice,
+    safest first, as a list of (list of nodes, total danger). Fewer than k if
+    that's all there are (none at all if there's no allowed way through).
+    Raises nx.NodeNotFound for unknown places, ValueError for a bad k or
+    unknown types in the filter.
+    """
+    if k < 1:
+        raise ValueError('k has to be at least 1')
+    cg = as_compact(G)
+    source, target = _node_id(cg, start), _node_id(cg, end)
+    allowed = route_filter.arc_mask(cg, keep=(source, target)) if route_filter else None
+    arcs = cg.arc_lists
+    tree = _ReverseTree(arcs, allowed, target)
+    tree.grow(until_node=source)
+    if source not in tree.settled:
+        return []
+
+    found = [tree.route_home(source)]
+    costs = [_route_costs(arcs, allowed, found[0])]
+    # Candidates as (total danger, places), plus every route we've ever lined up
+    candidates = []
+    seen = {tuple(found[0])}
+    while len(found) < k:
+        route, route_costs = found[-1], costs[-1]
+        where = {v: j for j, v in enumerate(route)}
+        suffix = _tree_suffix(tree, route)
+        # Next steps already taken from each spur by routes that start out the same way
+        banned_next = [set() for _ in route]
+        for r in found:
+            for j in range(min(len(r), len(route)) - 1):
+                if r[j] != route[j]:
+                    break
+                banned_next[j].add(r[j + 1])
+
+        # Anything pricier than the (k - found)-th best candidate will never make the list
+        wanted = k - len(found)
+        budget = heapq.nsmallest(wanted, candidates)[-1][0] if len(candidates) >= wanted else math.inf
+        if math.isfinite(budget):
+            tree.grow(until_radius=budget)
+            suffix = _tree_suffix(tree, route)
+
+        for i in range(len(route) - 1):
+            spur_route = _spur_search(arcs, allowed, tree, route, where, suffix, i,
+                                      banned_next[i], budget - route_costs[i])
+            if spur_route is None:
+                continue
+            places, danger = spur_route
+            new_route = route[:i] + places
+            if tuple(new_route) in seen:
+                continue
+            seen.add(tuple(new_route))
+            heapq.heappush(candidates, (route_costs[i] + danger, new_route))
+            if len(candidates) >= wanted:
+                budget = heapq.nsmallest(wanted, candidates)[-1][0]
+
+        if not candidates:
+            break
+        found.append(heapq.heappop(candidates)[1])
+        costs.append(_route_costs(arcs, allowed, found[-1]))
+
+    return [([cg.names[v] for v in route], route_costs[-1]) for route, route_costs in zip(found, costs)]
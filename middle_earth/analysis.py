@@ -0,0 +1,262 @@
+"""
+The analyses the app offers (Path Finder - with or without route rules,
+alternatives and danger/distance trade-offs -, Strategic Locations and
+Regional Groups), with no Streamlit anywhere near them.
+
+app.py shows the results, the CLI writes them to JSON Lines and the web
+service hands them out over HTTP - but they all get them from here.
+Every function takes a CompactGraph (or a NetworkX view of one).
+"""
+import numpy as np
+
+from middle_earth.alternatives import RouteFilter, k_shortest_paths
+from middle_earth.astar import CoordinateHeuristic, LandmarkHeuristic, search
+from middle_earth.centrality import approximate_betweenness, betweenness_centrality, ranking_confidence
+from middle_earth.communities import louvain_labels, region_stats
+from middle_earth.graph import as_compact
+from middle_earth.pareto import pareto_routes
+from middle_earth.routing import _node_id, describe_path, path_from_tree
+from middle_earth.tracing import cache_lookup, span, traced
+
+# Ways the Path Finder can search (all equally safe paths, with different amounts of work -
+# when two routes tie exactly, A* and ALT may pick the other one, see middle_earth/astar.py)
+SEARCH_METHODS = ('index', 'dijkstra', 'astar', 'alt')
+
+
+def build_heuristic(G, method):
+    """The A* guesser a search method needs ('astar' or 'alt'), or None for the others."""
+    if method == 'alt':
+        return LandmarkHeuristic(G, seed=0)
+    if method == 'astar':
+        return CoordinateHeuristic(G)
+    return None
+
+
+def place_name(G, name):
+    """
+    The graph's name for a place the way people type it ("Minas Tirith" or
+    "Minas_Tirith"), or None if there's no such place.
+    """
+    cg = as_compact(G)
+    for candidate in (name, name.replace(' ', '_')):
+        if candidate in cg.node_ids:
+            return candidate
+    return None
+
+
+@traced('shortest_path')
+def shortest_path_analysis(G, start='Bree', end='Mount_Doom', index=None, heuristic=None):
+    """
+    Finds the safest path between two places - like Google Maps for Middle Earth!
+    Uses something called Dijkstra's algorithm, but don't worry too much about that.
+    Just know it's really good at finding the best path when each step has a "cost".
+
+    Pass a prebuilt RoutingIndex as index and the answer is just a lookup.
+    Pass a heuristic (CoordinateHeuristic / LandmarkHeuristic) to search with A*
+    instead - just as safe a path, fewer places checked. Searches also report how many
+    places they settled ('settled_nodes') so you can compare.
+
+    Returns None if there's no way through (raises nx.NodeNotFound for unknown places).
+    """
+    cg = as_compact(G)
+    source, target = _node_id(cg, start), _node_id(cg, end)
+    settled = None
+    if index is not None:
+        # Already solved ahead of time, just look it up
+        with span('index_lookup'):
+            found = path_from_tree(cg, index.tree(source), source, target)
+    else:
+        # One search gives us both the path and its total danger score
+        # (no heuristic = good old Dijkstra)
+        with span('dijkstra' if heuristic is None else 'astar'):
+            path, distance, settled = search(cg, source, target, heuristic)
+        found = (path, distance) if path is not None else None
+
+    if found is None:
+        # Uh oh, no path found! (like trying to walk into Mordor... oh wait)
+        return None
+    with span('describe_path'):
+        results = describe_path(cg, *found)
+    if settled is not None:
+        results['settled_nodes'] = settled
+    return results
+
+
+@traced('alternative_routes')
+def alternative_routes_analysis(G, start='Bree', end='Mount_Doom', k=3, avoid_edge_types=(),
+                                avoid_node_types=(), max_leg_danger=None):
+    """
+    Plan B (and C...): the k safest routes between two places, safest first,
+    none of them visiting a place twice. Each one is a Path Finder result
+    with a 'rank' on top.
+
+    Route rules, all optional: avoid_edge_types ('dangerous_path', ...),
+    avoid_node_types ('fortress', ...) and max_leg_danger (no single path
+    worse than this). The start and end are always allowed.
+
+    Returns an empty list if no route follows the rules (raises
+    nx.NodeNotFound for unknown places, ValueError for unknown types).
+    """
+    cg = as_compact(G)
+    route_filter = RouteFilter(avoid_edge_types, avoid_node_types, max_leg_danger)
+    with span('k_shortest_paths'):
+        routes = k_shortest_paths(cg, start, end, k, route_filter)
+
+    results = []
+    for rank, (path, distance) in enumerate(routes, 1):
+        result = describe_path(cg, path, distance)
+        result['rank'] = rank
+        results.append(result)
+    return results
+
+
+@traced('tradeoff_routes')
+def tradeoff_routes_analysis(G, start='Bree', end='Mount_Doom', avoid_edge_types=(),
+                             avoid_node_types=(), max_leg_danger=None, index=None):
+    """
+    Safe or short? Every route where nothing else is both safer AND shorter
+    (the Pareto front), safest first. Each one is a Path Finder result plus
+    its 'total_distance' on the map (and each step's 'distance').
+
+    Same optional route rules as alternative_routes_analysis. index (a
+    RoutingIndex) just saves some work when there are no rules.
+    Returns an empty list if there's no way through.
+    """
+    cg = as_compact(G)
+    route_filter = RouteFilter(avoid_edge_types, avoid_node_types, max_leg_danger)
+    with span('pareto_routes'):
+        routes = pareto_routes(cg, start, end, route_filter or None, index)
+
+    results = []
+    for rank, (path, danger, distance) in enumerate(routes, 1):
+        result = describe_path(cg, path, danger)
+        result['rank'] = rank
+        result['total_distance'] = round(distance, 2)
+        for step, u, v in zip(result['path_details'], path, path[1:]):
+            step['distance'] = round(float(np.hypot(*(cg.pos[cg.node_ids[u]] - cg.pos[cg.node_ids[v]]))), 2)
+        results.append(result)
+    return results
+
+
+@traced('centrality_ranking')
+def centrality_ranking(G, mode='exact', epsilon=0.05, seed=None, progress=None, network=None):
+    """
+    The slow half of strategic_locations_analysis: every place's betweenness
+    and every place ranked by it. Doesn't depend on top_n, so work it out once
+    and hand it to strategic_locations_analysis for as many top_n's as you like.
+    JSON-able (so it can go in a ResultCache): {'scores', 'order', 'pivots'}.
+
+    network: a middle_earth.dynamic.DynamicNetwork for G - exact scores then
+    come from it, so after an edit only the affected start points get redone.
+    """
+    cg = as_compact(G)
+
+    # This calculates how important each location is based on paths going through it
+    with span('betweenness'):
+        if mode == 'approximate':
+            estimate = approximate_betweenness(cg, epsilon=epsilon, seed=seed, progress=progress)
+            centrality, pivots = estimate['scores'], estimate['pivots']
+        elif network is not None:
+            centrality, pivots = network.centrality(progress=progress), None
+        else:
+            centrality, pivots = betweenness_centrality(cg, progress=progress), None
+
+    # Sort locations by importance score (highest to lowest)
+    # (stable sort, so ties keep the original location order)
+    order = np.argsort(-centrality, kind='stable')
+    return {'scores': centrality.tolist(), 'order': order.tolist(), 'pivots': pivots}
+
+
+@traced('strategic_locations')
+def strategic_locations_analysis(G, top_n=5, mode='exact', epsilon=0.05, seed=None,
+                                 progress=None, ranking=None):
+    """
+    Figures out which places are the most important for controlling Middle Earth.
+    Kind of like finding the most popular intersections in a city, but for fantasy!
+
+    The 'betweenness_centrality' thing is just a fancy way of saying:
+    "How often do you HAVE to go through this place to get anywhere else?"
+
+    mode='approximate' only samples enough start points to keep every score
+    within epsilon of the real one - much faster on huge maps. Each result then
+    also says how confident we are it belongs in the top N.
+    progress (optional) gets called as progress(done, total) while we work.
+
+    Already got a centrality_ranking() for this graph and mode? Pass it as
+    ranking and this is just a matter of reading off the top N.
+    """
+    cg = as_compact(G)
+    if ranking is None:
+        ranking = centrality_ranking(cg, mode, epsilon, seed, progress)
+    centrality = ranking['scores']
+
+    top_ids = ranking['order'][:top_n]
+    if mode == 'approximate':
+        confidence = ranking_confidence(np.asarray(centrality, dtype=np.float64), top_ids,
+                                        cg.number_of_nodes(), ranking['pivots'])
+
+    # Let's get more info about each important place
+    strategic_details = []
+    for rank, i in enumerate(top_ids):
+        # Count how many paths connect to this place
+        _, edges = cg.neighbors(i)
+        connections = len(edges)
+
+        # Calculate average danger of paths around this place
+        avg_danger = cg.weights[edges].mean() if connections else 0
+
+        # Combine all the stats
+        strategic_details.append({
+            'location': cg.names[i].replace('_', ' '),
+            'strategic_value': round(float(centrality[i]) * 100, 2),  # Make it a percentage
+            'num_paths': connections,
+            'avg_danger': round(float(avg_danger), 2)
+        })
+        if mode == 'approximate':
+            # How sure we are this place really is in the top N
+            strategic_details[-1]['confidence'] = round(confidence[rank] * 100, 1)
+
+    return strategic_details
+
+
+@traced('regional_groups')
+def regional_groups_analysis(G, seed=0, resolution=1.0, connected=False):
+    """
+    Groups nearby locations together to find natural "regions" of Middle Earth.
+    Like finding cliques in high school, but for fantasy locations!
+
+    Uses the Louvain method - it's pretty smart about grouping things.
+    It looks at how places are connected and groups them based on their relationships.
+
+    The seed makes the grouping come out the same every time (so it can be cached),
+    and connected=True makes sure no region is split into separate pieces.
+    """
+    cg = as_compact(G)
+
+    # Find communities using the Louvain algorithm
+    # Don't worry too much about the math - it's basically magic
+    with cache_lookup('louvain'):
+        labels = louvain_labels(cg, resolution=resolution,  # How picky we are about making groups
+                                seed=seed, connected=connected)
+
+    # Work out the stats for every region in one go
+    with span('region_stats'):
+        stats = region_stats(cg, labels)
+
+    # Members of every region, grouped with one sort instead of a search per region
+    by_region = np.split(np.argsort(labels, kind='stable'), np.cumsum(stats['size'])[:-1])
+
+    # Let's describe each group we found
+    region_analysis = []
+    for i, members in enumerate(by_region):
+        region_analysis.append({
+            'region_number': i + 1,
+            'locations': sorted(cg.names[m].replace('_', ' ') for m in members.tolist()),
+            'size': int(stats['size'][i]),
+            'connectivity': round(float(stats['density'][i]) * 100, 2),  # Make it a percentage
+            'avg_danger': round(float(stats['avg_danger'][i]), 2),
+            # The best-connected place in the region (like finding the capital city)
+            'regional_capital': cg.names[stats['capital'][i]].replace('_', ' ')
+        })
+
+    return region_analysis
@@ -0,0 +1,203 @@
+"""
+The background map, pre-chopped into tiles at several zoom levels.
+
+Decoding the big PNG with mpimg.imread gives a float32 array (35 MB for our
+1762x1237 map) and we used to do that for every render and again in the grid
+helper. Instead we decode it ONCE into a little pyramid on disk:
+
+- level 0 is the full-size map, level 1 is half that, level 2 a quarter... down to
+  about MIN_LEVEL_SIDE pixels
+- every level is plain uint8 RGBA (a quarter the size of floats), cut into
+  TILE_SIZE x TILE_SIZE tiles and saved as .npy files we memory-map
+
+A render then asks for what it can actually show: the smallest level that
+still has enough pixels for the output size/DPI, and only the tiles under
+the viewport. Everything else stays on disk (well, in the OS page cache,
+shared by every process).
+
+The pyramid is rebuilt automatically whenever the PNG changes.
+"""
+import json
+import math
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from middle_earth.tracing import traced
+
+# Where pyramids get stored (one subfolder per source image)
+BASEMAP_DIR = '.basemap'
+# Tiles are this many pixels on a side
+TILE_SIZE = 256
+# Stop halving once the map is about this small
+MIN_LEVEL_SIDE = 256
+# Bump this if the on-disk layout ever changes
+PYRAMID_VERSION = 1
+
+
+def _halve(img):
+    """Half-size copy of an RGBA image (average of every 2x2 block)."""
+    h, w = img.shape[:2]
+    # Odd sizes: repeat the last row/column so every block is complete
+    img = np.pad(img, ((0, h % 2), (0, w % 2), (0, 0)), mode='edge')
+    blocks = img.reshape(img.shape[0] // 2, 2, img.shape[1] // 2, 2, img.shape[2]).astype(np.uint16)
+    return ((blocks.sum(axis=(1, 3)) + 2) // 4).astype(np.uint8)
+
+
+def _to_tiles(img, tile=TILE_SIZE):
+    """(h, w, 4) image -> (rows, cols, tile, tile, 4) array of tiles (padded with transparent)."""
+    h, w, c = img.shape
+    rows, cols = math.ceil(h / tile), math.ceil(w / tile)
+    padded = np.zeros((rows * tile, cols * tile, c), dtype=np.uint8)
+    padded[:h, :w] = img
+    return np.ascontiguousarray(padded.reshape(rows, tile, cols, tile, c).swapaxes(1, 2))
+
+
+def _source_stamp(image_path):
+    stat = os.stat(image_path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+@traced('decode_image')
+def build_pyramid(image_path, directory, tile=TILE_SIZE, min_side=MIN_LEVEL_SIDE):
+    """
+    Decodes image_path once and writes every zoom level into directory.
+    Raises FileNotFoundError if the image isn't there.
+
+    An older Basemap may still have the previous levels memory-mapped (the
+    app keeps a couple around, other processes may too), so we never write
+    over them: the new levels go into a scratch folder and get swapped in
+    with os.replace. Old maps keep reading the old (unlinked) files instead
+    of crashing with SIGBUS when they shrink.
+    """
+    # Pillow comes with matplotlib; decoding straight to uint8 skips the float copy
+    from PIL import Image
+
+    stamp = _source_stamp(image_path)
+    with Image.open(image_path) as im:
+        img = np.asarray(im.convert('RGBA'))
+
+    os.makedirs(directory, exist_ok=True)
+    meta_path = os.path.join(directory, 'meta.json')
+    scratch = tempfile.mkdtemp(prefix='.building-', dir=directory)
+    try:
+        shapes = []
+        while True:
+            np.save(os.path.join(scratch, f'level{len(shapes)}.npy'), _to_tiles(img, tile))
+            shapes.append(img.shape[:2])
+            if max(img.shape[:2]) <= min_side:
+                break
+            img = _halve(img)
+        with open(os.path.join(scratch, 'meta.json'), 'w') as f:
+            json.dump({'version': PYRAMID_VERSION, 'source': stamp, 'tile': tile,
+                       'shapes': [list(s) for s in shapes]}, f)
+
+        # meta.json comes out first and goes back in last, so a half-swapped
+        # pyramid never looks complete
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        for name in [f'level{i}.npy' for i in range(len(shapes))] + ['meta.json']:
+            os.replace(os.path.join(scratch, name), os.path.join(directory, name))
+        # Levels a bigger old map had and this one doesn't (unlinking is safe too)
+        extra = len(shapes)
+        while os.path.exists(os.path.join(directory, f'level{extra}.npy')):
+            os.remove(os.path.join(directory, f'level{extra}.npy'))
+            extra += 1
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+class Basemap:
+    """
+    A memory-mapped map pyramid. Use Basemap.open(image_path) to get one
+    (building the pyramid first if needed), then view() for what to draw.
+    """
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta.get('version') != PYRAMID_VERSION:
+            raise ValueError(f'{directory}: basemap version {meta.get("version")} '
+                             f'is not supported (expected {PYRAMID_VERSION})')
+        self.directory = directory
+        self.tile = meta['tile']
+        self.shapes = [tuple(s) for s in meta['shapes']]
+        self.source = meta['source']
+        self.levels = [np.load(os.path.join(directory, f'level{i}.npy'), mmap_mode='r')
+                       for i in range(len(self.shapes))]
+
+    @classmethod
+    def open(cls, image_path, cache_dir=BASEMAP_DIR):
+        """
+        The pyramid for image_path, (re)built if it's missing or the image changed.
+        Raises FileNotFoundError if the image isn't there.
+        """
+        stamp = _source_stamp(image_path)
+        name = os.path.splitext(os.path.basename(image_path))[0]
+        directory = os.path.join(cache_dir, name)
+        try:
+            basemap = cls(directory)
+            if basemap.source == stamp:
+                return basemap
+        except (OSError, ValueError, KeyError):
+            pass
+        build_pyramid(image_path, directory)
+        return cls(directory)
+
+    @property
+    def shape(self):
+        """(height, width) of the full-size map."""
+        return self.shapes[0]
+
+    def pick_level(self, width_px, height_px):
+        """The smallest level with at least this many pixels (level 0 if none is big enough)."""
+        for level in range(len(self.shapes) - 1, -1, -1):
+            h, w = self.shapes[level]
+            if w >= width_px and h >= height_px:
+                return level
+        return 0
+
+    def crop(self, level, left, top, right, bottom):
+        """
+        Pixels [top:bottom, left:right] of one level, read from just the tiles
+        that overlap them.
+        """
+        h, w = self.shapes[level]
+        left, right = max(0, left), min(w, right)
+        top, bottom = max(0, top), min(h, bottom)
+        t = self.tile
+        r0, r1 = top // t, math.ceil(bottom / t)
+        c0, c1 = left // t, math.ceil(right / t)
+        tiles = self.levels[level][r0:r1, c0:c1]
+        block = tiles.swapaxes(1, 2).reshape((r1 - r0) * t, (c1 - c0) * t, tiles.shape[-1])
+        return block[top - r0 * t:bottom - r0 * t, left - c0 * t:right - c0 * t]
+
+    def view(self, extent, size_px, viewport=None):
+        """
+        What to hand imshow for a map drawn at extent=(x0, x1, y0, y1) in plot
+        units, when the visible part (viewport, same units; default: all of it)
+        ends up size_px=(width, height) pixels big in the output.
+
+        Returns (uint8 RGBA image, its extent), or (None, None) if the
+        viewport misses the map entirely.
+        """
+        ex0, ex1, ey0, ey1 = extent
+        vx0, vx1, vy0, vy1 = viewport or extent
+        clip = lambda f: min(1.0, max(0.0, f))
+        # Which fraction of the map the viewport covers (rows count from the top)
+        fx0, fx1 = clip((vx0 - ex0) / (ex1 - ex0)), clip((vx1 - ex0) / (ex1 - ex0))
+        fy0, fy1 = clip((ey1 - vy1) / (ey1 - ey0)), clip((ey1 - vy0) / (ey1 - ey0))
+        if fx1 <= fx0 or fy1 <= fy0:
+            return None, None
+
+        level = self.pick_level(size_px[0] / (fx1 - fx0), size_px[1] / (fy1 - fy0))
+        h, w = self.shapes[level]
+        left, right = math.floor(fx0 * w), math.ceil(fx1 * w)
+        top, bottom = math.floor(fy0 * h), math.ceil(fy1 * h)
+        img = self.crop(level, left, top, right, bottom)
+
+        # Extent of exactly the pixels we cut out
+        sx, sy = (ex1 - ex0) / w, (ey1 - ey0) / h
+        return img, (ex0 + left * sx, ex0 + right * sx, ey1 - bottom * sy, ey1 - top * sy)
@@ -0,0 +1,155 @@
+"""
+Planning lots of journeys at once (say, every haven to every fortress).
+
+Asking for routes one pair at a time would run a Dijkstra per pair. Instead we
+group the requests by where they start: one single-source Dijkstra from each
+distinct start point answers every journey leaving from there. Different start
+points are independent, so they can be spread over a pool of workers.
+
+Results stream back as (start, end, result) as soon as each start point is
+done, where result is the same dict shortest_path_analysis gives you (or None
+if there's no way through). write_csv / write_jsonl save them to a file.
+"""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import csv
+import io
+import json
+import os
+
+from middle_earth.analysis import place_name
+from middle_earth.graph import as_compact
+from middle_earth.routing import _node_id, describe_path, dijkstra, path_from_tree
+
+# Below this many distinct start points a worker pool isn't worth starting
+PARALLEL_MIN_SOURCES = 8
+# Keep at most this many tasks per worker in flight, so huge batches stream
+# instead of queueing everything up front
+TASKS_PER_WORKER = 4
+
+_worker_graph = None
+
+
+def _init_worker(cg):
+    global _worker_graph
+    _worker_graph = cg
+
+
+def _routes_from(source, targets, cg=None, index=None):
+    """All journeys leaving one start point, from a single search tree."""
+    cg = cg or _worker_graph
+    tree = index.tree(source) if index is not None else dijkstra(cg, source)
+    results = []
+    for end, target in targets:
+        found = path_from_tree(cg, tree, source, target)
+        results.append((end, describe_path(cg, *found) if found else None))
+    return results
+
+
+def _resolve(cg, name):
+    # Same lookup as everywhere else ("Minas Tirith" finds Minas_Tirith); unknown names
+    # go to _node_id as typed, so the error says what was asked for
+    return _node_id(cg, place_name(cg, name) or name)
+
+
+def group_by_source(cg, pairs):
+    """
+    {source id: (start name, [(end name, target id), ...])} for a list of (start, end) pairs.
+    Raises nx.NodeNotFound straight away if any location doesn't exist.
+    """
+    groups = {}
+    for start, end in pairs:
+        source = _resolve(cg, start)
+        groups.setdefault(source, (start, []))[1].append((end, _resolve(cg, end)))
+    return groups
+
+
+def plan_routes(G, pairs, workers=None, executor='process', index=None):
+    """
+    Plans every (start, end) journey in pairs, yielding (start, end, result)
+    as results come in. result is the shortest_path_analysis dict, or None.
+
+    workers:  pool size (default: one per CPU). 1 means plain old serial.
+    executor: 'process' (real parallelism) or 'thread' (no process start-up cost)
+    index:    a RoutingIndex to read trees from instead of searching at all
+    """
+    cg = as_compact(G)
+    groups = group_by_source(cg, pairs)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if index is not None or workers <= 1 or len(groups) < PARALLEL_MIN_SOURCES:
+        for source, (start, targets) in groups.items():
+            for end, result in _routes_from(source, targets, cg, index):
+                yield start, end, result
+        return
+
+    if executor == 'process':
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cg,))
+        submit = lambda source, targets: pool.submit(_routes_from, source, targets)
+    elif executor == 'thread':
+        pool = ThreadPoolExecutor(max_workers=workers)
+        submit = lambda source, targets: pool.submit(_routes_from, source, targets, cg)
+    else:
+        raise ValueError(f"executor should be 'process' or 'thread', got {executor!r}")
+
+    with pool:
+        todo = iter(groups.items())
+        running = {}
+        while True:
+            # Top up the pool, then hand back whatever finished first
+            while len(running) < workers * TASKS_PER_WORKER:
+                try:
+                    source, (start, targets) = next(todo)
+                except StopIteration:
+                    break
+                running[submit(source, targets)] = start
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                start = running.pop(future)
+                for end, result in future.result():
+                    yield start, end, result
+
+
+def read_pairs(f, fmt='csv'):
+    """
+    Reads (start, end) pairs from an open file: a CSV with start,end columns,
+    or JSON Lines with {"start": ..., "end": ...}. Binary files are fine too.
+    """
+    if isinstance(f, (io.RawIOBase, io.BufferedIOBase)) or 'b' in getattr(f, 'mode', ''):
+        f = io.TextIOWrapper(f, encoding='utf-8', newline='')
+    if fmt == 'csv':
+        rows = csv.DictReader(f)
+    elif fmt in ('jsonl', 'ndjson'):
+        rows = (json.loads(line) for line in f if line.strip())
+    else:
+        raise ValueError(f"Don't know how to read '{fmt}' pair files (use csv or jsonl)")
+
+    pairs = []
+    for row_no, row in enumerate(rows, start=1):
+        try:
+            pairs.append((str(row['start']).strip(), str(row['end']).strip()))
+        except (KeyError, TypeError):
+            raise ValueError(f"Row {row_no} needs both a 'start' and an 'end'") from None
+    return pairs
+
+
+def write_jsonl(results, f):
+    """Writes (start, end, result) tuples as one JSON object per line."""
+    for start, end, result in results:
+        record = {'start': start, 'end': end}
+        record.update(result or {'path': None, 'total_danger': None, 'path_details': []})
+        f.write(json.dumps(record) + '\n')
+
+
+def write_csv(results, f):
+    """Writes (start, end, result) tuples as CSV: one row per journey."""
+    writer = csv.writer(f)
+    writer.writerow(['start', 'end', 'total_danger', 'steps', 'path'])
+    for start, end, result in results:
+        if result is None:
+            writer.writerow([start, end, '', '', ''])
+        else:
+            writer.writerow([start, end, result['total_danger'],
+                             len(result['path_details']), ' > '.join(result['path'])])
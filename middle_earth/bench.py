@@ -0,0 +1,252 @@
+"""
+How fast is everything, and how does it scale?
+
+run_benchmarks() builds made-up maps (middle_earth.synthetic) at each size,
+then times every analysis on them:
+
+    path_dijkstra / path_astar / path_alt   a few seeded random journeys
+    strategic                               top 5 (exact up to EXACT_MAX_NODES, approximate above)
+    regions                                 Louvain (with its cache cleared first)
+    render                                  staticmap.create_visualization (needs matplotlib)
+
+For each one we keep every run's time, the peak memory of one extra run
+(tracemalloc, so NumPy arrays count too) and, if asked, the top functions
+from a cProfile run. The report is plain JSON, so two of them (say, before
+and after a change) can be compared with compare_reports():
+
+    python -m middle_earth -o before.json bench --sizes 100 1000 10000
+    python -m middle_earth bench-compare before.json after.json
+
+Some analyses get silly on huge maps (exact betweenness on a million places
+takes days), so each has a size limit; anything above it is skipped and
+says so in the report.
+"""
+import cProfile
+import contextlib
+import datetime
+import gc
+import os
+import platform
+import pstats
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from middle_earth.analysis import (build_heuristic, regional_groups_analysis,
+                                   shortest_path_analysis, strategic_locations_analysis)
+from middle_earth.synthetic import generate_map
+
+# Bump this if the report layout changes
+REPORT_VERSION = 1
+DEFAULT_SIZES = (100, 1000, 10000)
+ANALYSES = ('path_dijkstra', 'path_astar', 'path_alt', 'strategic', 'regions', 'render')
+# Biggest map each analysis is run on by default
+SIZE_LIMITS = {
+    'path_dijkstra': 10 ** 6,
+    'path_astar': 10 ** 6,
+    'path_alt': 10 ** 6,
+    'strategic': 10 ** 4,
+    'regions': 10 ** 5,
+    'render': 10 ** 2,
+}
+# Above this, strategic switches to approximate betweenness
+EXACT_MAX_NODES = 2000
+# Journeys timed per path run
+PATH_QUERIES = 5
+# Functions kept from each profile
+PROFILE_TOP = 15
+# compare_reports() flags anything this much slower (0.2 = 20%)
+REGRESSION_THRESHOLD = 0.2
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The app's background picture (in the repo root), drawn under the render benchmark
+MAP_IMAGE_PATH = 'middle_earth_map_optimized.png'
+
+
+def _path_task(cg, method, seed):
+    rng = np.random.default_rng(seed)
+    pairs = rng.integers(cg.number_of_nodes(), size=(PATH_QUERIES, 2)).tolist()
+    pairs = [(cg.names[a], cg.names[b]) for a, b in pairs]
+    # The guesser is set-up work, timed separately (it's built once per graph in the app)
+    start = time.perf_counter()
+    heuristic = build_heuristic(cg, method)
+    setup = time.perf_counter() - start
+
+    def task():
+        for a, b in pairs:
+            shortest_path_analysis(cg, a, b, heuristic=heuristic)
+    return task, {'setup_seconds': round(setup, 6), 'queries': PATH_QUERIES}
+
+
+def _strategic_task(cg, seed):
+    mode = 'exact' if cg.number_of_nodes() <= EXACT_MAX_NODES else 'approximate'
+    return (lambda: strategic_locations_analysis(cg, 5, mode=mode, seed=seed)), {'mode': mode}
+
+
+def _regions_task(cg, seed):
+    from middle_earth import communities
+
+    def task():
+        # Louvain remembers answers per graph, which would make every run after the first free
+        communities._cache.clear()
+        regional_groups_analysis(cg, seed=seed)
+    return task, {}
+
+
+@contextlib.contextmanager
+def _in_dir(path):
+    """Renders run in a scratch folder, so label layouts and map tiles don't pile up in the repo."""
+    old = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(old)
+
+
+def _render_task(cg):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from middle_earth.basemap import Basemap
+    from middle_earth.staticmap import create_visualization
+
+    # One scratch folder for every run: the first one solves the labels, the rest reuse them
+    scratch = tempfile.TemporaryDirectory()
+    # Cutting the picture into tiles is a one-off set-up cost (the app does it once per process)
+    with _in_dir(scratch.name):
+        try:
+            basemap = Basemap.open(os.path.join(REPO_DIR, MAP_IMAGE_PATH))
+        except FileNotFoundError:
+            basemap = None
+
+    def task():
+        with _in_dir(scratch.name):
+            plt.close(create_visualization(cg, basemap))
+    return task, {'basemap': basemap is not None}
+
+
+def make_task(cg, analysis, seed=0):
+    """(zero-argument function that runs one analysis once, extra info for the report)."""
+    if analysis.startswith('path_'):
+        method = {'path_dijkstra': 'dijkstra', 'path_astar': 'astar', 'path_alt': 'alt'}[analysis]
+        return _path_task(cg, method, seed)
+    if analysis == 'strategic':
+        return _strategic_task(cg, seed)
+    if analysis == 'regions':
+        return _regions_task(cg, seed)
+    if analysis == 'render':
+        return _render_task(cg)
+    raise ValueError(f"Don't know how to benchmark '{analysis}' (try one of {', '.join(ANALYSES)})")
+
+
+def peak_memory(task):
+    """Peak memory (bytes) allocated while running task once."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        task()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def profile(task, top=PROFILE_TOP):
+    """The top functions (by cumulative time) from one profiled run."""
+    profiler = cProfile.Profile()
+    profiler.runcall(task)
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, line, name), (_, calls, own, total, _) in stats.stats.items():
+        rows.append({'function': f'{os.path.basename(filename)}:{line}({name})',
+                     'calls': calls, 'own_seconds': round(own, 6), 'total_seconds': round(total, 6)})
+    rows.sort(key=lambda row: row['total_seconds'], reverse=True)
+    return rows[:top]
+
+
+def benchmark(cg, analysis, repeats=3, seed=0, with_profile=False):
+    """Times one analysis on one graph. Returns its entry for the report."""
+    task, info = make_task(cg, analysis, seed)
+    seconds = []
+    for _ in range(max(1, repeats)):
+        gc.collect()
+        start = time.perf_counter()
+        task()
+        seconds.append(round(time.perf_counter() - start, 6))
+    entry = {'analysis': analysis, 'nodes': cg.number_of_nodes(), 'edges': cg.number_of_edges(),
+             'seconds': seconds, 'best_seconds': min(seconds),
+             'peak_memory_mb': round(peak_memory(task) / 2 ** 20, 3)}
+    entry.update(info)
+    if with_profile:
+        entry['profile'] = profile(task)
+    return entry
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                             capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, analyses=ANALYSES, repeats=3, seed=0,
+                   with_profile=False, limits=SIZE_LIMITS, progress=None):
+    """
+    The whole suite. Returns the report dict (see the module docstring).
+    progress (optional) gets called as progress(analysis, nodes) before each benchmark.
+    """
+    report = {
+        'version': REPORT_VERSION,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'seed': seed,
+        'repeats': repeats,
+        'graphs': [],
+        'results': [],
+    }
+    for n in sizes:
+        start = time.perf_counter()
+        cg = generate_map(n, seed)
+        report['graphs'].append({'nodes': n, 'edges': cg.number_of_edges(),
+                                 'generate_seconds': round(time.perf_counter() - start, 6)})
+        for analysis in analyses:
+            limit = (limits or {}).get(analysis)
+            if limit is not None and n > limit:
+                report['results'].append({'analysis': analysis, 'nodes': n,
+                                          'skipped': f'above the {limit}-node limit'})
+                continue
+            if progress:
+                progress(analysis, n)
+            report['results'].append(benchmark(cg, analysis, repeats, seed, with_profile))
+    return report
+
+
+def compare_reports(old, new, threshold=REGRESSION_THRESHOLD):
+    """
+    Lines up two reports by (analysis, nodes). Returns one dict per benchmark
+    both of them ran, with the speed ratio (new / old best time, so > 1 is
+    slower), the memory ratio and whether it counts as a regression.
+    """
+    def by_key(report):
+        return {(r['analysis'], r['nodes']): r for r in report['results'] if 'skipped' not in r}
+
+    before, after = by_key(old), by_key(new)
+    rows = []
+    for key in sorted(before.keys() & after.keys()):
+        a, b = before[key], after[key]
+        time_ratio = b['best_seconds'] / a['best_seconds'] if a['best_seconds'] else float('inf')
+        memory_ratio = b['peak_memory_mb'] / a['peak_memory_mb'] if a['peak_memory_mb'] else float('inf')
+        rows.append({'analysis': key[0], 'nodes': key[1],
+                     'old_seconds': a['best_seconds'], 'new_seconds': b['best_seconds'],
+                     'time_ratio': round(time_ratio, 3), 'memory_ratio': round(memory_ratio, 3),
+                     'regression': time_ratio > 1 + threshold or memory_ratio > 1 + threshold})
+    return rows
@@ -0,0 +1,209 @@
+"""
+Betweenness centrality ("how often do you HAVE to pass through here?")
+computed straight on the CompactGraph arrays.
+
+This is Brandes' algorithm: one Dijkstra per start point that also counts
+how many equally-safe routes reach each place, then a backwards sweep that
+hands out credit to everything those routes pass through.
+
+Every start point is independent, so big maps split the start points across
+a pool of worker processes and just add up what comes back. If even that's too
+slow, approximate_betweenness() only uses a random sample of start points
+("pivots") - enough of them to stay within an error bound you pick.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import heapq
+from itertools import count
+import math
+import os
+
+import numpy as np
+
+from middle_earth.graph import as_compact
+
+# Below this many nodes a process pool costs more than it saves
+PARALLEL_MIN_NODES = 2000
+# Start points handed to a worker at a time (also how often progress updates)
+SOURCES_PER_TASK = 64
+
+# Each worker process gets its own copy of the adjacency once, not once per task
+_worker_graph = None
+
+
+def source_dependencies(arc_lists, n, source):
+    """
+    How much each node gets credited for routes starting at one source.
+    Returns a list of length n (the source itself always gets 0).
+    """
+    indptr, nbrs, wts = arc_lists
+    dist = [np.inf] * n
+    sigma = [0.0] * n           # number of shortest routes reaching each node
+    preds = [[] for _ in range(n)]
+    done = [False] * n
+    order = []                  # nodes in the order we settled them
+
+    dist[source] = 0.0
+    sigma[source] = 1.0
+    c = count()
+    heap = [(0.0, next(c), source)]
+    while heap:
+        d, _, u = heapq.heappop(heap)
+        if done[u]:
+            continue
+        done[u] = True
+        order.append(u)
+        for k in range(indptr[u], indptr[u + 1]):
+            v = nbrs[k]
+            nd = d + wts[k]
+            if nd < dist[v]:
+                dist[v] = nd
+                sigma[v] = sigma[u]
+                preds[v] = [u]
+                heapq.heappush(heap, (nd, next(c), v))
+            elif nd == dist[v]:
+                sigma[v] += sigma[u]
+                preds[v].append(u)
+
+    # Walk back from the farthest node, passing credit to predecessors
+    delta = [0.0] * n
+    for w in reversed(order):
+        coeff = (1.0 + delta[w]) / sigma[w]
+        for v in preds[w]:
+            delta[v] += sigma[v] * coeff
+    delta[source] = 0.0
+    return delta
+
+
+def _init_worker(arc_lists, n):
+    global _worker_graph
+    _worker_graph = (arc_lists, n)
+
+
+def _accumulate(sources, graph=None):
+    """Adds up the dependencies from a batch of start points."""
+    arc_lists, n = graph or _worker_graph
+    total = np.zeros(n)
+    for source in sources:
+        total += source_dependencies(arc_lists, n, source)
+    return total
+
+
+def _dependency_sum(cg, sources, processes=None, progress=None):
+    """
+    Sum of source_dependencies over the given sources, in parallel if it's worth it.
+    progress (optional) gets called as progress(sources done, total sources).
+    """
+    n = cg.number_of_nodes()
+    sources = list(sources)
+    batches = [sources[i:i + SOURCES_PER_TASK] for i in range(0, len(sources), SOURCES_PER_TASK)]
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    total = np.zeros(n)
+    done = 0
+    if processes <= 1 or n < PARALLEL_MIN_NODES or len(batches) <= 1:
+        graph = (cg.arc_lists, n)
+        for batch in batches:
+            total += _accumulate(batch, graph)
+            done += len(batch)
+            if progress:
+                progress(done, len(sources))
+        return total
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                             initargs=(cg.arc_lists, n)) as pool:
+        futures = {pool.submit(_accumulate, batch): len(batch) for batch in batches}
+        for future in as_completed(futures):
+            total += future.result()
+            done += futures[future]
+            if progress:
+                progress(done, len(sources))
+    return total
+
+
+def betweenness_centrality(G, sources=None, normalized=True, processes=None, progress=None):
+    """
+    Weighted betweenness for every node, as an array indexed by node id.
+    Matches nx.betweenness_centrality(G, weight='weight') on our two-way routes.
+
+    processes: worker processes to use (default: one per CPU, big maps only)
+    progress:  optional callback, called as progress(sources done, total sources)
+    """
+    cg = as_compact(G)
+    n = cg.number_of_nodes()
+    bc = _dependency_sum(cg, range(n) if sources is None else sources, processes, progress)
+
+    if normalized and n > 2:
+        bc /= (n - 1) * (n - 2)
+    return bc
+
+
+def pivots_needed(n, epsilon, delta):
+    """
+    How many random start points keep every node's score within epsilon of
+    the exact (normalized) value, with probability at least 1 - delta.
+
+    Each sampled start point gives an unbiased guess in [0, n/(n-1)], so
+    Hoeffding's inequality plus a union bound over all n nodes gives
+    k >= (n/(n-1))^2 * ln(2n/delta) / (2 epsilon^2).
+    """
+    if n <= 2:
+        return n
+    spread = n / (n - 1)
+    k = math.ceil(spread ** 2 * math.log(2 * n / delta) / (2 * epsilon ** 2))
+    return min(n, k)
+
+
+def approximate_betweenness(G, epsilon=0.05, delta=0.1, seed=None, processes=None,
+                            progress=None):
+    """
+    Estimates betweenness from a random sample of start points.
+
+    epsilon: how far off any score may be (on the same 0-1 scale as the exact scores)
+    delta:   chance we're allowed to miss that bound
+    seed:    fix this to get the same sample (and scores) every time
+
+    Returns a dict with 'scores' (array by node id), 'pivots' (how many start
+    points we used), 'epsilon', 'delta' and 'exact' (True if we ended up
+    using every node anyway).
+    """
+    cg = as_compact(G)
+    n = cg.number_of_nodes()
+    k = pivots_needed(n, epsilon, delta)
+    exact = k >= n
+
+    if exact:
+        scores = betweenness_centrality(cg, processes=processes, progress=progress)
+    else:
+        rng = np.random.default_rng(seed)
+        pivots = rng.choice(n, size=k, replace=False).tolist()
+        # Scale the sample back up to "as if we'd used every start point"
+        scores = _dependency_sum(cg, pivots, processes, progress) * (n / k)
+        if n > 2:
+            scores /= (n - 1) * (n - 2)
+
+    return {'scores': scores, 'pivots': k, 'epsilon': epsilon, 'delta': delta, 'exact': exact}
+
+
+def ranking_confidence(scores, ranked_ids, n, pivots):
+    """
+    How sure we are that each of the top-N nodes really belongs in the top N.
+
+    For each ranked node we look at the gap between its estimate and the best
+    estimate that didn't make the cut. Both estimates would have to be off by
+    at least half that gap to swap them, and Hoeffding tells us how unlikely
+    that is with this many pivots. Exact scores are always 100% sure.
+    """
+    ranked_ids = list(ranked_ids)
+    if pivots >= n or n <= 2:
+        return [1.0] * len(ranked_ids)
+
+    rest = np.delete(scores, ranked_ids)
+    cutoff = rest.max() if len(rest) else 0.0
+    spread = n / (n - 1)
+    confidence = []
+    for i in ranked_ids:
+        gap = max(float(scores[i] - cutoff), 0.0)
+        miss = 4 * math.exp(-pivots * gap ** 2 / (2 * spread ** 2))
+        confidence.append(max(0.0, 1.0 - miss))
+    return confidence
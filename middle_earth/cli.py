@@ -0,0 +1,224 @@
+"""
+Running the analyses without a browser: python -m middle_earth <command>
+
+    python -m middle_earth path Bree "Mount Doom" --method alt
+    python -m middle_earth path Bree "Mount Doom" --alternatives 3 --avoid-path-type dangerous_path
+    python -m middle_earth path Rivendell "Minas Tirith" --tradeoffs
+    python -m middle_earth paths journeys.csv --workers 4
+    python -m middle_earth strategic --top-n 10 --mode approximate
+    python -m middle_earth regions --connected
+    python -m middle_earth serve --port 8000 --metrics --result-cache results.sqlite
+    python -m middle_earth import-budget
+    python -m middle_earth -o report.json bench --sizes 100 1000 10000
+    python -m middle_earth bench-compare before.json after.json
+
+Results come out as JSON Lines (one record per line) on stdout, or in the
+file given with --output. The map is the built-in one unless you point
+--nodes/--edges (or --snapshot) at your own, same as the MIDDLE_EARTH_*
+variables do for the app. Set MIDDLE_EARTH_TRACE (see middle_earth/tracing.py)
+to get a timing trace of every command.
+"""
+import argparse
+from contextlib import nullcontext
+import json
+import os
+import sys
+
+from middle_earth.analysis import (SEARCH_METHODS, alternative_routes_analysis, build_heuristic,
+                                   place_name, regional_groups_analysis, shortest_path_analysis,
+                                   strategic_locations_analysis, tradeoff_routes_analysis)
+from middle_earth.data import EDGES_ENV, NODES_ENV, SNAPSHOT_ENV, build_graph
+from middle_earth.results import RESULT_CACHE_ENV, ResultCache
+from middle_earth.tracing import PrometheusSink, add_sink, configure_from_env, trace
+
+
+def _write(records, out):
+    for record in records:
+        out.write(json.dumps(record) + '\n')
+
+
+def run_path(cg, args, out):
+    start, end = place_name(cg, args.start), place_name(cg, args.end)
+    for asked, found in ((args.start, start), (args.end, end)):
+        if found is None:
+            raise SystemExit(f"No place called '{asked}' on this map")
+    rules = (args.avoid_path_type, args.avoid_place_type, args.max_leg_danger)
+    if args.tradeoffs and args.alternatives != 1:
+        raise SystemExit('Pick one: --tradeoffs or --alternatives')
+    if args.tradeoffs or args.alternatives != 1 or args.avoid_path_type or args.avoid_place_type \
+            or args.max_leg_danger is not None:
+        # Route rules, alternatives and trade-offs have their own searches (--method doesn't apply)
+        if args.tradeoffs:
+            results = tradeoff_routes_analysis(cg, start, end, *rules)
+        else:
+            results = alternative_routes_analysis(cg, start, end, args.alternatives, *rules)
+        if not results:
+            results = [{'rank': None, 'path': None, 'total_danger': None, 'path_details': []}]
+        _write([dict({'start': args.start, 'end': args.end}, **result) for result in results], out)
+        return
+    if args.method == 'index':
+        from middle_earth.routing import RoutingIndex
+        result = shortest_path_analysis(cg, start, end, index=RoutingIndex(cg))
+    else:
+        result = shortest_path_analysis(cg, start, end, heuristic=build_heuristic(cg, args.method))
+    record = {'start': args.start, 'end': args.end}
+    record.update(result or {'path': None, 'total_danger': None, 'path_details': []})
+    _write([record], out)
+
+
+def run_paths(cg, args, out):
+    from middle_earth.batch import plan_routes, read_pairs, write_jsonl
+    fmt = args.format or os.path.splitext(args.pairs)[1].lstrip('.').lower()
+    with open(args.pairs, 'rb') as f:
+        pairs = read_pairs(f, fmt)
+    missing = sorted({p for pair in pairs for p in pair if place_name(cg, p) is None})
+    if missing:
+        raise SystemExit(f"No such places on this map: {', '.join(missing)}")
+    write_jsonl(plan_routes(cg, pairs, workers=args.workers), out)
+
+
+def run_strategic(cg, args, out):
+    _write(strategic_locations_analysis(cg, args.top_n, mode=args.mode,
+                                        epsilon=args.epsilon, seed=args.seed), out)
+
+
+def run_regions(cg, args, out):
+    _write(regional_groups_analysis(cg, seed=args.seed, resolution=args.resolution,
+                                    connected=args.connected), out)
+
+
+def run_serve(cg, args, out):
+    from middle_earth.service import serve
+    if args.metrics:
+        add_sink(PrometheusSink())
+    serve(cg, args.host, args.port, results=ResultCache(args.result_cache))
+
+
+def run_import_budget(cg, args, out):
+    from middle_earth.startup import check_import_budget
+    report = check_import_budget(repeats=args.repeats)
+    _write(report, out)
+    if not all(entry['ok'] for entry in report):
+        raise SystemExit('Start-up is over its import-time budget')
+
+
+def run_bench(cg, args, out):
+    from middle_earth.bench import ANALYSES, SIZE_LIMITS, run_benchmarks
+    report = run_benchmarks(args.sizes, args.analyses or ANALYSES, args.repeats, args.seed,
+                            args.profile, None if args.no_limits else SIZE_LIMITS,
+                            progress=lambda analysis, n: print(f'{analysis} on {n} places...',
+                                                               file=sys.stderr, flush=True))
+    out.write(json.dumps(report, indent=1) + '\n')
+
+
+def run_bench_compare(cg, args, out):
+    from middle_earth.bench import compare_reports
+    with open(args.old) as f_old, open(args.new) as f_new:
+        rows = compare_reports(json.load(f_old), json.load(f_new), args.threshold)
+    _write(rows, out)
+    if any(row['regression'] for row in rows):
+        raise SystemExit('Slower (or hungrier) than before - see the rows marked regression')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m middle_earth',
+                                     description='Middle Earth network analysis, no browser required.')
+    parser.add_argument('--nodes', default=os.environ.get(NODES_ENV),
+                        help='nodes file (name, x, y, type) - CSV, JSON Lines or Parquet')
+    parser.add_argument('--edges', default=os.environ.get(EDGES_ENV),
+                        help='edges file (src, dst, weight, type)')
+    parser.add_argument('--snapshot', default=os.environ.get(SNAPSHOT_ENV),
+                        help='folder for the fast-loading binary copy of the map')
+    parser.add_argument('--output', '-o', help='write JSON Lines here instead of stdout')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    path = commands.add_parser('path', help='safest route between two places')
+    path.add_argument('start')
+    path.add_argument('end')
+    path.add_argument('--method', choices=SEARCH_METHODS, default='dijkstra')
+    path.add_argument('--alternatives', '-k', type=int, default=1, metavar='K',
+                      help='the K safest routes instead of just one (one record each)')
+    path.add_argument('--avoid-path-type', action='append', default=[], metavar='TYPE',
+                      help='never use this kind of path (repeat for more)')
+    path.add_argument('--avoid-place-type', action='append', default=[], metavar='TYPE',
+                      help='never pass through this kind of place (repeat for more)')
+    path.add_argument('--max-leg-danger', type=float, help='no single path more dangerous than this')
+    path.add_argument('--tradeoffs', action='store_true',
+                      help='every route where nothing else is both safer and shorter (one record each)')
+    path.set_defaults(run=run_path)
+
+    paths = commands.add_parser('paths', help='plan every journey in a CSV/JSON Lines file')
+    paths.add_argument('pairs', help="file with 'start' and 'end' columns")
+    paths.add_argument('--format', choices=['csv', 'jsonl', 'ndjson'],
+                       help='file format (default: from the extension)')
+    paths.add_argument('--workers', type=int, help='worker processes (default: one per CPU)')
+    paths.set_defaults(run=run_paths)
+
+    strategic = commands.add_parser('strategic', help='most important places (betweenness)')
+    strategic.add_argument('--top-n', type=int, default=5)
+    strategic.add_argument('--mode', choices=['exact', 'approximate'], default='exact')
+    strategic.add_argument('--epsilon', type=float, default=0.05)
+    strategic.add_argument('--seed', type=int)
+    strategic.set_defaults(run=run_strategic)
+
+    regions = commands.add_parser('regions', help='natural regions (Louvain)')
+    regions.add_argument('--seed', type=int, default=0)
+    regions.add_argument('--resolution', type=float, default=1.0)
+    regions.add_argument('--connected', action='store_true',
+                         help='split regions that fall apart into pieces')
+    regions.set_defaults(run=run_regions)
+
+    serve = commands.add_parser('serve', help='keep the map loaded and answer over HTTP')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8000)
+    serve.add_argument('--metrics', action='store_true',
+                       help='time every request and serve the totals at /metrics (Prometheus text)')
+    serve.add_argument('--result-cache', default=os.environ.get(RESULT_CACHE_ENV), metavar='FILE',
+                       help='also keep answers in this SQLite file, so they survive restarts')
+    serve.set_defaults(run=run_serve)
+
+    budget = commands.add_parser('import-budget', help='check start-up import times against their budgets')
+    budget.add_argument('--repeats', type=int, default=3, help='runs per module (best one counts)')
+    budget.set_defaults(run=run_import_budget, needs_graph=False)
+
+    bench = commands.add_parser('bench', help='time every analysis on made-up maps (JSON report)')
+    bench.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000],
+                       help='number of places in each made-up map')
+    bench.add_argument('--analyses', nargs='+', help='only these (default: all of them)')
+    bench.add_argument('--repeats', type=int, default=3)
+    bench.add_argument('--seed', type=int, default=0)
+    bench.add_argument('--profile', action='store_true', help='add the top functions from cProfile')
+    bench.add_argument('--no-limits', action='store_true',
+                       help="run everything at every size, even if it'll take all day")
+    bench.set_defaults(run=run_bench, needs_graph=False)
+
+    compare = commands.add_parser('bench-compare', help='compare two bench reports')
+    compare.add_argument('old')
+    compare.add_argument('new')
+    compare.add_argument('--threshold', type=float, default=0.2,
+                         help='how much slower counts as a regression (0.2 = 20%%)')
+    compare.set_defaults(run=run_bench_compare, needs_graph=False)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        configure_from_env()
+    except ValueError as e:
+        raise SystemExit(str(e))
+    # The service traces each request on its own, everything else is one trace
+    with trace(args.command) if args.command != 'serve' else nullcontext():
+        cg = None
+        if getattr(args, 'needs_graph', True):
+            try:
+                cg = build_graph(args.nodes, args.edges, args.snapshot)
+            except (OSError, ValueError) as e:
+                raise SystemExit(f"Couldn't load the map: {e}")
+
+        output = open(args.output, 'w', encoding='utf-8') if args.output else nullcontext(sys.stdout)
+        with output as out:
+            try:
+                args.run(cg, args, out)
+            except (OSError, ValueError) as e:
+                raise SystemExit(f"{args.command}: {e}")
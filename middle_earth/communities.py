@@ -0,0 +1,221 @@
+"""
+Regions (communities) of Middle Earth, found straight on the CompactGraph arrays.
+
+This is the Louvain method, same idea as networkx's louvain_communities:
+
+1. every place starts in its own region; visit places in a (seeded) random
+   order and move each one to the neighboring region that raises modularity most
+2. squash every region into a single super-node and repeat on that smaller graph
+
+...until nothing moves anymore. The squashing step is pure NumPy (relabel
+the edge arrays, add up the parallel ones), so only step 1 loops in Python.
+
+With a fixed seed the answer is the same every time, so results get cached
+per graph version. connected=True adds a Leiden-style clean-up: Louvain can
+produce regions that fall apart into pieces, so each region gets split into
+its connected parts.
+
+region_stats() then works out size, density, average danger and capital for
+every region at once from a single edge-to-region label array.
+"""
+from collections import OrderedDict
+import threading
+
+import numpy as np
+
+from middle_earth.graph import as_compact
+from middle_earth.tracing import cache_miss
+
+# Stop once a whole level improves modularity by less than this
+THRESHOLD = 1e-7
+# How many region answers to keep around (per graph version / settings)
+CACHE_SIZE = 16
+
+_cache = OrderedDict()
+# Every Streamlit session (and service worker) shares _cache
+_cache_lock = threading.Lock()
+
+
+def _csr(n, src, dst, weights):
+    """Neighbor lists (no self-loops) as plain Python lists for the local-move loop."""
+    keep = src != dst
+    arc_src = np.concatenate([src[keep], dst[keep]])
+    arc_dst = np.concatenate([dst[keep], src[keep]])
+    arc_w = np.concatenate([weights[keep], weights[keep]])
+    order = np.argsort(arc_src, kind='stable')
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(arc_src, minlength=n), out=indptr[1:])
+    return indptr.tolist(), arc_dst[order].tolist(), arc_w[order].tolist()
+
+
+def _local_moves(n, src, dst, weights, resolution, rng):
+    """
+    Step 1 of Louvain on one level. Returns (labels 0..k-1, whether anything moved).
+    """
+    # Weighted degree, self-loops counted twice (that's the usual convention)
+    degree = np.bincount(src, weights=weights, minlength=n) + \
+        np.bincount(dst, weights=weights, minlength=n)
+    m = degree.sum() / 2
+    if m == 0:
+        return np.arange(n), False
+
+    indptr, nbrs, wts = _csr(n, src, dst, weights)
+    degree = degree.tolist()
+    labels = list(range(n))
+    total = list(degree)            # summed degree of each region
+    scale = resolution / (2 * m)
+    moved_any = False
+
+    improved = True
+    while improved:
+        improved = False
+        for u in rng.permutation(n).tolist():
+            # How strongly u is tied to each neighboring region
+            links = {}
+            for k in range(indptr[u], indptr[u + 1]):
+                c = labels[nbrs[k]]
+                links[c] = links.get(c, 0.0) + wts[k]
+
+            own = labels[u]
+            ku = degree[u]
+            total[own] -= ku
+            best, best_gain = own, links.get(own, 0.0) - scale * total[own] * ku
+            for c, w in links.items():
+                gain = w - scale * total[c] * ku
+                if gain > best_gain:
+                    best, best_gain = c, gain
+            total[best] += ku
+            if best != own:
+                labels[u] = best
+                improved = moved_any = True
+
+    _, labels = np.unique(labels, return_inverse=True)
+    return labels, moved_any
+
+
+def _aggregate(labels, src, dst, weights):
+    """Step 2 of Louvain: one super-node per region, parallel edges added together."""
+    a, b = labels[src], labels[dst]
+    lo, hi = np.minimum(a, b), np.maximum(a, b)
+    pairs, inverse = np.unique(np.stack([lo, hi], axis=1), axis=0, return_inverse=True)
+    merged = np.bincount(inverse.ravel(), weights=weights, minlength=len(pairs))
+    return pairs[:, 0], pairs[:, 1], merged
+
+
+def modularity(G, labels, resolution=1.0):
+    """Newman modularity of a labelling (array of region ids by node id)."""
+    cg = as_compact(G)
+    labels = np.asarray(labels)
+    weights = cg.weights.astype(np.float64)
+    degree = np.bincount(cg.edge_src, weights=weights, minlength=len(labels)) + \
+        np.bincount(cg.edge_dst, weights=weights, minlength=len(labels))
+    m = degree.sum() / 2
+    if m == 0:
+        return 0.0
+    inside = labels[cg.edge_src] == labels[cg.edge_dst]
+    region_degree = np.bincount(labels, weights=degree)
+    return float(weights[inside].sum() / m - resolution * ((region_degree / (2 * m)) ** 2).sum())
+
+
+def _split_disconnected(cg, labels):
+    """Leiden-style fix-up: split every region into its connected pieces."""
+    parent = list(range(cg.number_of_nodes()))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    inside = labels[cg.edge_src] == labels[cg.edge_dst]
+    for u, v in zip(cg.edge_src[inside].tolist(), cg.edge_dst[inside].tolist()):
+        ru, rv = find(u), find(v)
+        if ru != rv:
+            parent[max(ru, rv)] = min(ru, rv)
+    return np.array([find(x) for x in range(len(parent))])
+
+
+def _numbered_by_first_member(labels):
+    """Renumbers regions 0, 1, 2... in order of their lowest node id (stable output)."""
+    _, first, inverse = np.unique(labels, return_index=True, return_inverse=True)
+    rank = np.empty(len(first), dtype=np.int64)
+    rank[np.argsort(first)] = np.arange(len(first))
+    return rank[inverse]
+
+
+def louvain_labels(G, resolution=1.0, seed=0, connected=False):
+    """
+    Region id for every node (array by node id), via Louvain.
+    Same graph + same settings = same answer (and a cache hit after the first time).
+    """
+    cg = as_compact(G)
+    key = (cg.fingerprint(), float(resolution), seed, bool(connected))
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key].copy()
+    cache_miss('louvain')
+
+    rng = np.random.default_rng(seed)
+    n = cg.number_of_nodes()
+    src, dst = cg.edge_src.astype(np.int64), cg.edge_dst.astype(np.int64)
+    weights = cg.weights.astype(np.float64)
+    labels = np.arange(n)
+    level_n = n
+    best = modularity(cg, labels, resolution)
+
+    while True:
+        level_labels, moved = _local_moves(level_n, src, dst, weights, resolution, rng)
+        if not moved:
+            break
+        candidate = level_labels[labels]
+        score = modularity(cg, candidate, resolution)
+        if score - best <= THRESHOLD:
+            break
+        labels, best = candidate, score
+        src, dst, weights = _aggregate(level_labels, src, dst, weights)
+        level_n = int(level_labels.max()) + 1
+
+    if connected:
+        labels = _split_disconnected(cg, labels)
+    labels = _numbered_by_first_member(labels)
+
+    with _cache_lock:
+        _cache[key] = labels
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return labels.copy()
+
+
+def region_stats(G, labels):
+    """
+    Everything regional_groups_analysis shows, for every region in one pass:
+    a dict of arrays (indexed by region id) with size, internal_edges,
+    density, avg_danger and capital (node id of the best-connected member).
+    """
+    cg = as_compact(G)
+    labels = np.asarray(labels)
+    n, k = len(labels), int(labels.max()) + 1 if len(labels) else 0
+
+    src_label = labels[cg.edge_src]
+    inside = src_label == labels[cg.edge_dst]
+    edge_region = src_label[inside]
+
+    size = np.bincount(labels, minlength=k)
+    internal_edges = np.bincount(edge_region, minlength=k)
+    danger = np.bincount(edge_region, weights=cg.weights[inside], minlength=k)
+    possible = size * (size - 1) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        density = np.where(possible > 0, internal_edges / possible, 0.0)
+        avg_danger = np.where(internal_edges > 0, danger / internal_edges, 0.0)
+
+    # Capital = the member with the most paths inside its own region
+    # (ties go to the lowest node id)
+    internal_degree = np.bincount(cg.edge_src[inside], minlength=n) + \
+        np.bincount(cg.edge_dst[inside], minlength=n)
+    order = np.lexsort((np.arange(n), -internal_degree, labels))
+    firsts = np.flatnonzero(np.r_[True, labels[order][1:] != labels[order][:-1]])
+    capital = order[firsts]
+
+    return {'size': size, 'internal_edges': internal_edges, 'density': density,
+            'avg_danger': avg_danger, 'capital': capital}
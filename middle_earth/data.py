@@ -0,0 +1,132 @@
+"""
+The map itself: every location and path in Middle Earth, plus a helper
+that picks where to load the graph from (these literals, files, or a snapshot).
+
+Nothing in here touches Streamlit, so the CLI and the web service use it too.
+"""
+import os
+
+from middle_earth.graph import CompactGraph
+from middle_earth.loaders import load_graph, load_snapshot
+from middle_earth.tracing import traced
+
+# This huge dictionary has all our locations and their info
+# x,y coordinates are based on a reference map, and each place has a type
+# (like haven, fortress, etc.) which we'll use for coloring later
+locations = {
+    # Classic good guy places
+    'Shire': {'pos': (25, 52), 'type': 'haven'},        # Hobbit central!
+    'Grey_Havens': {'pos': (15, 52), 'type': 'haven'},  # Elf port city
+    'Rivendell': {'pos': (47, 52), 'type': 'haven'},    # Elrond's place
+    'Bree': {'pos': (28, 52), 'type': 'town'},          # Where it all began...
+    
+    # Spooky abandoned places
+    'Fornost': {'pos': (30, 57), 'type': 'ruin'},       # Old capital, now empty
+    'Weathertop': {'pos': (32, 52), 'type': 'ruin'},    # That scary place with the Nazgul
+    'Tharbad': {'pos': (35, 45), 'type': 'ruin'},       # Abandoned river crossing
+    'Osgiliath': {'pos': (64, 23), 'type': 'ruin'},     # Gondor's old capital
+    
+    # Big important forests
+    'Mirkwood': {'pos': (60, 55), 'type': 'forest'},    # Thranduil's sketchy woods
+    'Fangorn': {'pos': (48, 38), 'type': 'forest'},     # Home of the Ents
+    
+    # Mountain stuff
+    'Erebor': {'pos': (65, 62), 'type': 'mountain'},    # The Lonely Mountain!
+    'Mount_Doom': {'pos': (69, 25), 'type': 'mountain'},# Where the ring goes bye-bye
+    'Iron_Hills': {'pos': (75, 62), 'type': 'mountain'},# More dwarves here
+    
+    # Major cities and towns
+    'Dale': {'pos': (65, 57), 'type': 'city'},          # City by Erebor
+    'Esgaroth': {'pos': (68, 58), 'type': 'town'},      # Lake-town
+    'Edoras': {'pos': (48, 28), 'type': 'city'},        # Horse bros
+    'Minas_Tirith': {'pos': (62, 23), 'type': 'city'},  # White city
+    'Pelargir': {'pos': (62, 18), 'type': 'city'},      # Harbor city
+    'Dol_Guldur': {'pos': (62, 48), 'type': 'fortress'},# Sauron's vacation home
+    'Minas_Morgul': {'pos': (66, 24), 'type': 'fortress'},# Super creepy city
+    'Barad_dur': {'pos': (72, 26), 'type': 'fortress'}, # Sauron's main crib
+    'Black_Gate': {'pos': (66, 29), 'type': 'gate'},    # Front door to Mordor
+    
+    # Other important spots
+    'Moria': {'pos': (47, 43), 'type': 'ruin'},         # "You shall not pass!"
+    'Lorien': {'pos': (52, 42), 'type': 'haven'},       # Galadriel's forest
+    'Isengard': {'pos': (45, 35), 'type': 'fortress'},  # Saruman's tower
+    'Dead_Marshes': {'pos': (62, 28), 'type': 'hazard'},# Spooky swamp
+    'Paths_of_Dead': {'pos': (51, 24), 'type': 'pass'}, # Ghost shortcut
+    'Cirith_Ungol': {'pos': (68, 24), 'type': 'pass'},  # Spider pass
+    'Cair_Andros': {'pos': (61, 26), 'type': 'fortress'},# River fortress
+    'Rhosgobel': {'pos': (55, 52), 'type': 'town'},     # Radagast's home
+    'Gap_of_Rohan': {'pos': (45, 32), 'type': 'pass'},    # Gap in the White Mountains
+    'Helms_Deep': {'pos': (46, 31), 'type': 'fortress'},  # Rohan's stronghold
+}
+
+# Now we're setting up all the paths between places
+# weight = how dangerous it is (1 = safe, 10 = super dangerous)
+# type = what kind of path (road, mountain_pass, etc.)
+routes = [
+    ('Bree', 'Weathertop', {'weight': 3, 'type': 'road'}),
+    ('Weathertop', 'Rivendell', {'weight': 4, 'type': 'road'}),
+    ('Rivendell', 'Moria', {'weight': 7, 'type': 'mountain_pass'}),
+    ('Moria', 'Lorien', {'weight': 5, 'type': 'forest_path'}),
+    ('Lorien', 'Fangorn', {'weight': 4, 'type': 'forest_path'}),
+    ('Fangorn', 'Isengard', {'weight': 3, 'type': 'road'}),
+    ('Isengard', 'Helms_Deep', {'weight': 2, 'type': 'road'}),
+    ('Helms_Deep', 'Edoras', {'weight': 2, 'type': 'road'}),
+    ('Edoras', 'Minas_Tirith', {'weight': 4, 'type': 'road'}),
+    ('Minas_Tirith', 'Osgiliath', {'weight': 3, 'type': 'road'}),
+    ('Osgiliath', 'Dead_Marshes', {'weight': 7, 'type': 'hazardous_path'}),
+    ('Dead_Marshes', 'Black_Gate', {'weight': 8, 'type': 'dangerous_path'}),
+    ('Black_Gate', 'Barad_dur', {'weight': 9, 'type': 'dangerous_path'}),
+    ('Barad_dur', 'Mount_Doom', {'weight': 10, 'type': 'dangerous_path'}),
+    ('Rivendell', 'Mirkwood', {'weight': 5, 'type': 'forest_path'}),
+    ('Mirkwood', 'Dale', {'weight': 4, 'type': 'forest_path'}),
+    ('Dale', 'Erebor', {'weight': 2, 'type': 'road'}),
+    ('Gap_of_Rohan', 'Isengard', {'weight': 3, 'type': 'road'}),
+    ('Edoras', 'Paths_of_Dead', {'weight': 6, 'type': 'mountain_pass'}),
+    ('Grey_Havens', 'Shire', {'weight': 2, 'type': 'road'}),
+    ('Shire', 'Bree', {'weight': 2, 'type': 'road'}),
+    ('Shire', 'Fornost', {'weight': 3, 'type': 'road'}),
+    ('Bree', 'Fornost', {'weight': 3, 'type': 'road'}),
+    ('Bree', 'Tharbad', {'weight': 4, 'type': 'road'}),
+    ('Tharbad', 'Moria', {'weight': 5, 'type': 'road'}),
+    ('Mirkwood', 'Dol_Guldur', {'weight': 6, 'type': 'dangerous_path'}),
+    ('Dol_Guldur', 'Lorien', {'weight': 7, 'type': 'dangerous_path'}),
+    ('Dale', 'Iron_Hills', {'weight': 4, 'type': 'road'}),
+    ('Dale', 'Esgaroth', {'weight': 2, 'type': 'road'}),
+    ('Mirkwood', 'Rhosgobel', {'weight': 3, 'type': 'forest_path'}),
+    ('Rhosgobel', 'Lorien', {'weight': 4, 'type': 'forest_path'}),
+    ('Osgiliath', 'Minas_Morgul', {'weight': 5, 'type': 'dangerous_path'}),
+    ('Minas_Morgul', 'Cirith_Ungol', {'weight': 8, 'type': 'dangerous_path'}),
+    ('Cirith_Ungol', 'Mount_Doom', {'weight': 7, 'type': 'dangerous_path'}),
+    ('Minas_Tirith', 'Pelargir', {'weight': 3, 'type': 'road'}),
+    ('Osgiliath', 'Cair_Andros', {'weight': 3, 'type': 'road'}),
+    ('Cair_Andros', 'Dead_Marshes', {'weight': 5, 'type': 'hazardous_path'}),
+    ('Tharbad', 'Gap_of_Rohan', {'weight': 5, 'type': 'road'}),
+]
+
+# Got a bigger map in some files? Point these at them and we'll load that instead
+# (see middle_earth/loaders.py for the file format)
+NODES_ENV = 'MIDDLE_EARTH_NODES'
+EDGES_ENV = 'MIDDLE_EARTH_EDGES'
+# Folder for the fast-loading binary copy of those files
+SNAPSHOT_ENV = 'MIDDLE_EARTH_SNAPSHOT'
+
+
+@traced('build_graph')
+def build_graph(nodes=None, edges=None, snapshot_dir=None):
+    """
+    Packs all our locations and paths into one compact array-backed graph.
+    Every path is two-way (you can go there AND back again... get it?) but only stored once.
+
+    nodes + edges files win, then a snapshot folder on its own, then the built-in map.
+    """
+    if nodes and edges:
+        return load_graph(nodes, edges, snapshot_dir=snapshot_dir)
+    if snapshot_dir:
+        return load_snapshot(snapshot_dir)
+    return CompactGraph.from_routes(locations, routes)
+
+
+def graph_from_env():
+    """build_graph() with the file locations taken from the MIDDLE_EARTH_* variables."""
+    return build_graph(os.environ.get(NODES_ENV), os.environ.get(EDGES_ENV),
+                       os.environ.get(SNAPSHOT_ENV))
@@ -0,0 +1,249 @@
+"""
+Editing the map without recomputing everything.
+
+Danger levels change all the time (an orc raid here, a new bridge there).
+Recomputing every shortest path and all of betweenness after each edit is
+a waste: only start points whose shortest routes actually touch the edited
+path can notice the difference.
+
+Because routes are two-way, dist(s, u) is the same as dist(u, s). So one
+Dijkstra from each end of the edited path tells us, for EVERY start point s
+at once, whether that path is (or could become) part of a shortest route from s:
+
+- weight goes up (or path removed): s is affected if the path was on one of
+  its shortest routes, i.e. dist(s, u) + w == dist(s, v) (or the other way round)
+- weight goes down (or path added): s is affected if the new weight would match
+  or beat what s had before, i.e. dist(s, u) + w_new <= dist(s, v)
+
+Only those start points get their shortest-path trees and betweenness
+contributions redone. Every edit changes the graph's fingerprint (the
+version every cache keys on - ResultCache, communities, the app's
+st.cache_resource), so cached answers for the old map simply stop matching.
+The change record hands out the new fingerprint too, and subscribers hear
+which start points changed, in case they keep per-start-point caches.
+
+How much this saves, honestly:
+
+- routing only (nobody asked for centrality()): no searches at all. We only
+  check the trees the routing index is holding, straight from their rows:
+  danger up only matters to trees that use the path, danger down only to
+  trees it strictly beats. Those get re-solved (dense) or forgotten (sparse)
+- with centrality tracked: we need dist to both ends from EVERY start point
+  (two full Dijkstras on big maps), and then two dependency passes over the
+  affected ones. A quiet path is cheap, but a busy one lies on the shortest
+  routes of most start points (ties count too: with whole-number dangers,
+  lots of routes tie). On a 4000-place synthetic map that ran from 1% to
+  over 90% of them - past half we just recount everybody, so an edit never
+  costs much more than starting over, but it's nowhere near sub-second on big maps
+
+Edits and reads mustn't overlap (a search halfway through an edit sees half
+a map), so wrap reads in `with network.reading():` - edits wait for those
+to finish, and new reads wait for the edit. Don't nest reading() blocks.
+"""
+from contextlib import contextmanager
+import threading
+
+import numpy as np
+
+from middle_earth.centrality import _dependency_sum
+from middle_earth.graph import as_compact
+from middle_earth.routing import RoutingIndex, _node_id, dijkstra
+
+
+class _ReadWriteLock:
+    """Any number of readers at once, or one writer on its own (writers go next in line)."""
+
+    def __init__(self):
+        self._turn = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._waiting_writers = 0
+
+    def _free(self):
+        return not self._writing and not self._waiting_writers
+
+    @contextmanager
+    def reading(self, wait=True):
+        """Yields True once we're in - or False straight away if wait=False and an edit has the map."""
+        with self._turn:
+            if not wait and not self._free():
+                got_in = False
+            else:
+                self._turn.wait_for(self._free)
+                self._readers += 1
+                got_in = True
+        try:
+            yield got_in
+        finally:
+            if got_in:
+                with self._turn:
+                    self._readers -= 1
+                    self._turn.notify_all()
+
+    @contextmanager
+    def writing(self):
+        with self._turn:
+            self._waiting_writers += 1
+            self._turn.wait_for(lambda: not self._writing and not self._readers)
+            self._waiting_writers -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._turn:
+                self._writing = False
+                self._turn.notify_all()
+
+
+class DynamicNetwork:
+    """
+    A graph plus its routing index and betweenness scores, kept up to date as you edit.
+
+    Use set_weight / add_edge / remove_edge to change routes (by location name).
+    Each edit returns a change record, bumps self.version and gives the graph
+    a new fingerprint. Do your reading inside `with network.reading():`.
+    """
+
+    def __init__(self, G, index=None, processes=None):
+        self.graph = as_compact(G)
+        if index is not None and index.graph is not self.graph:
+            raise ValueError('The routing index has to be built on this same graph')
+        self.index = index if index is not None else RoutingIndex(self.graph)
+        self.processes = processes
+        self.version = 0
+        self._raw_bc = None        # betweenness before normalizing (worked out on demand)
+        self._bc_lock = threading.Lock()
+        self._subscribers = []
+        self._lock = _ReadWriteLock()
+
+    def reading(self, wait=True):
+        """
+        Context manager: no edits happen while you're inside it. With
+        wait=False it doesn't wait for an edit (in progress or next in line)
+        - it yields False instead, and you're not in.
+        """
+        return self._lock.reading(wait)
+
+    @property
+    def fingerprint(self):
+        """The graph's current version - the one every cache keys on."""
+        return self.graph.fingerprint()
+
+    def subscribe(self, callback):
+        """
+        callback(change) gets called after every edit (see _apply for what's in
+        it), before anyone gets to read the new map - so don't call reading() in there.
+        """
+        self._subscribers.append(callback)
+
+    def centrality(self, normalized=True, progress=None):
+        """
+        Betweenness for every node (array by node id). The first call does the
+        full computation (progress(done, total) hears about it), and from then
+        on every edit patches the affected start points - so only ask if you'll
+        keep asking, it makes edits dearer.
+        """
+        with self._bc_lock:
+            if self._raw_bc is None:
+                n = self.graph.number_of_nodes()
+                self._raw_bc = _dependency_sum(self.graph, range(n), self.processes, progress)
+            bc = self._raw_bc.copy()
+        n = self.graph.number_of_nodes()
+        if normalized and n > 2:
+            bc /= (n - 1) * (n - 2)
+        return bc
+
+    def _distances_to(self, node_id):
+        """dist(s, node) for every s - a matrix column if we have one, otherwise one Dijkstra."""
+        if self.index.dense:
+            return self.index.dist[:, node_id]
+        return dijkstra(self.graph, node_id)[0]
+
+    def _affected_sources(self, u, v, old_weight, new_weight):
+        if self._raw_bc is None:
+            return self._affected_trees(u, v, new_weight > old_weight, new_weight)
+        # Centrality counts every tied route, so every start point gets checked
+        du, dv = self._distances_to(u), self._distances_to(v)
+        reach_u, reach_v = np.isfinite(du), np.isfinite(dv)
+        if new_weight > old_weight:
+            # Only matters if the path was on a shortest route before
+            on_path = np.isclose(du + old_weight, dv) | np.isclose(dv + old_weight, du)
+            hit = reach_u & reach_v & on_path
+        else:
+            # Matters if the cheaper path ties or beats the old best
+            better = (du + new_weight <= dv + 1e-9) | (dv + new_weight <= du + 1e-9)
+            hit = (reach_u | reach_v) & better
+        return np.flatnonzero(hit)
+
+    def _affected_trees(self, u, v, dearer, new_weight):
+        """
+        Routing only: which of the trees the index is holding change. Stricter
+        than the centrality test - a tree that doesn't use the path can't get
+        worse, and a path that only ties the old best doesn't change the answer.
+        No searching needed, it's all in the trees.
+        """
+        sources, du, dv, pu, pv = self.index.held_trees(u, v)
+        if dearer:
+            hit = (pv == u) | (pu == v)
+        else:
+            hit = (du + new_weight < dv - 1e-9) | (dv + new_weight < du - 1e-9)
+        return sources[hit]
+
+    def _apply(self, u, v, old_weight, new_weight, edit):
+        """
+        Shared edit routine: find affected sources, swap their old betweenness
+        contributions for new ones, refresh their routing trees, tell everyone.
+        All of it while no one's reading.
+        """
+        with self._lock.writing():
+            affected = self._affected_sources(u, v, old_weight, new_weight)
+            n = self.graph.number_of_nodes()
+            tracking = self._raw_bc is not None and len(affected)
+            # Swapping contributions is two passes over the affected start points,
+            # so once that's half of everybody one fresh pass is cheaper
+            recount = tracking and 2 * len(affected) >= n
+            if tracking and not recount:
+                self._raw_bc -= _dependency_sum(self.graph, affected, self.processes)
+
+            edit()
+
+            if recount:
+                self._raw_bc = _dependency_sum(self.graph, range(n), self.processes)
+            elif tracking:
+                self._raw_bc += _dependency_sum(self.graph, affected, self.processes)
+            self.index.refresh_sources(affected)
+            self.version += 1
+
+            change = {
+                'version': self.version,
+                'fingerprint': self.graph.fingerprint(),
+                'edge': (self.graph.names[u], self.graph.names[v]),
+                'old_weight': old_weight,
+                'new_weight': new_weight,
+                'affected_sources': affected,
+            }
+            for callback in self._subscribers:
+                callback(change)
+        return change
+
+    def set_weight(self, src, dst, weight):
+        """Changes the danger level of the route between two locations."""
+        u, v = _node_id(self.graph, src), _node_id(self.graph, dst)
+        edge = self.graph.edge_between(u, v)
+        old = float(self.graph.weights[edge])
+        new = self.graph.validate_weight(weight)
+        return self._apply(u, v, old, new, lambda: self.graph.set_weight(edge, new))
+
+    def add_edge(self, src, dst, weight, edge_type='road'):
+        """Opens a new route between two locations."""
+        u, v = _node_id(self.graph, src), _node_id(self.graph, dst)
+        new = self.graph.validate_weight(weight)
+        return self._apply(u, v, np.inf, new,
+                           lambda: self.graph.add_edge(u, v, new, edge_type))
+
+    def remove_edge(self, src, dst):
+        """Closes the route between two locations (the safest one, if there are several)."""
+        u, v = _node_id(self.graph, src), _node_id(self.graph, dst)
+        edge = self.graph.edge_between(u, v)
+        old = float(self.graph.weights[edge])
+        return self._apply(u, v, old, np.inf, lambda: self.graph.remove_edge(edge))
@@ -0,0 +1,274 @@
+"""
+A compact, array-backed version of the Middle Earth graph.
+
+NetworkX keeps every node and edge in its own little dictionaries, and our
+DiGraph stored every route twice (there AND back again). That's fine for 32
+places, not so fine for a few hundred thousand. Here everything lives in flat
+NumPy arrays instead:
+
+- every route is stored exactly once (src, dst, weight, type code)
+- a CSR-style adjacency (indptr / neighbor ids / edge ids) lets you walk
+  the neighbors of a node in both directions without duplicating attributes
+- node and path types are "interned": each distinct name is stored once
+  and the arrays only hold small integer codes
+
+Routes are two-way, so the graph is undirected. Algorithms we haven't ported
+can still run on it through to_networkx(), a read-only nx.Graph that reads
+straight from the arrays instead of copying them (see middle_earth.nxview).
+NetworkX itself is only imported when you ask for that view.
+"""
+from functools import cached_property
+import hashlib
+
+import numpy as np
+
+
+def _intern(values):
+    """
+    Turns a list of strings into (small integer codes, list of distinct names).
+    """
+    table = {}
+    codes = [table.setdefault(value, len(table)) for value in values]
+    dtype = np.min_scalar_type(max(len(table) - 1, 0))
+    return np.asarray(codes, dtype=dtype), list(table)
+
+
+class CompactGraph:
+    """
+    Undirected graph stored in flat arrays, indexed by int32 node ids.
+
+    Node arrays (length n):  names, pos (n x 2), node_types (codes into node_type_names)
+    Edge arrays (length m):  edge_src, edge_dst, weights, edge_types (codes into edge_type_names)
+    Adjacency (CSR):         neighbors of node i are adj_nodes[indptr[i]:indptr[i+1]],
+                             and adj_edges holds the matching edge ids
+    """
+
+    def __init__(self, names, pos, node_types, node_type_names,
+                 edge_src, edge_dst, weights, edge_types, edge_type_names,
+                 adjacency=None):
+        self.names = list(names)
+        self.node_ids = {name: i for i, name in enumerate(self.names)}
+        self.pos = np.asarray(pos, dtype=np.float64).reshape(len(self.names), 2)
+        self.node_types = np.asarray(node_types)
+        self.node_type_names = list(node_type_names)
+
+        self.edge_src = np.asarray(edge_src, dtype=np.int32)
+        self.edge_dst = np.asarray(edge_dst, dtype=np.int32)
+        # Keep whole-number weights as ints so danger levels still read "3/10"
+        self.weights = np.asarray(weights)
+        if self.weights.dtype.kind not in 'iuf':
+            raise ValueError('Edge weights have to be numbers')
+        self.edge_types = np.asarray(edge_types)
+        self.edge_type_names = list(edge_type_names)
+
+        if adjacency is None:
+            self._build_adjacency()
+        else:
+            # Already worked out (e.g. loaded from a snapshot) - no need to sort again
+            self.indptr, self.adj_nodes, self.adj_edges = adjacency
+
+    def _build_adjacency(self):
+        n, m = len(self.names), len(self.edge_src)
+        edge_ids = np.arange(m, dtype=np.int32)
+        # Each route shows up once from each end (self-loops only once)
+        back = self.edge_src != self.edge_dst
+        arc_src = np.concatenate([self.edge_src, self.edge_dst[back]])
+        arc_dst = np.concatenate([self.edge_dst, self.edge_src[back]])
+        arc_edge = np.concatenate([edge_ids, edge_ids[back]])
+
+        order = np.argsort(arc_src, kind='stable')
+        self.adj_nodes = arc_dst[order]
+        self.adj_edges = arc_edge[order]
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(arc_src, minlength=n), out=self.indptr[1:])
+
+    @classmethod
+    def from_routes(cls, locations, routes):
+        """
+        Builds the graph from our usual locations dict and routes list.
+        """
+        names = list(locations)
+        node_ids = {name: i for i, name in enumerate(names)}
+        node_types, node_type_names = _intern([data['type'] for data in locations.values()])
+        edge_types, edge_type_names = _intern([data['type'] for _, _, data in routes])
+        return cls(
+            names,
+            [locations[name]['pos'] for name in names],
+            node_types, node_type_names,
+            [node_ids[src] for src, _, _ in routes],
+            [node_ids[dst] for _, dst, _ in routes],
+            [data['weight'] for _, _, data in routes],
+            edge_types, edge_type_names,
+        )
+
+    @classmethod
+    def from_networkx(cls, G):
+        """
+        Converts a NetworkX graph. For directed graphs, u->v and v->u are
+        treated as the same route (the first one we see wins).
+        """
+        locations = {node: {'pos': data.get('pos', (0.0, 0.0)), 'type': data.get('type', '')}
+                     for node, data in G.nodes(data=True)}
+        seen = set()
+        routes = []
+        for u, v, data in G.edges(data=True):
+            if (v, u) in seen:
+                continue
+            seen.add((u, v))
+            routes.append((u, v, {'weight': data.get('weight', 1), 'type': data.get('type', '')}))
+        return cls.from_routes(locations, routes)
+
+    def number_of_nodes(self):
+        return len(self.names)
+
+    def number_of_edges(self):
+        return len(self.edge_src)
+
+    @property
+    def degree(self):
+        """Number of routes touching each node, as an array."""
+        return np.diff(self.indptr)
+
+    def neighbors(self, node_id):
+        """(neighbor ids, edge ids) for one node - both are array slices, no copying."""
+        lo, hi = self.indptr[node_id], self.indptr[node_id + 1]
+        return self.adj_nodes[lo:hi], self.adj_edges[lo:hi]
+
+    def edge_between(self, u, v):
+        """
+        Id of the route between node ids u and v (the safest one if there are several).
+        Raises KeyError if they aren't connected.
+        """
+        nbrs, edges = self.neighbors(u)
+        hits = edges[nbrs == v]
+        if len(hits) == 0:
+            raise KeyError((self.names[u], self.names[v]))
+        return int(hits[np.argmin(self.weights[hits])])
+
+    def edge_type(self, edge_id):
+        return self.edge_type_names[self.edge_types[edge_id]]
+
+    def node_type(self, node_id):
+        return self.node_type_names[self.node_types[node_id]]
+
+    def validate_weight(self, weight):
+        weight = float(weight)
+        if not np.isfinite(weight) or weight < 0:
+            raise ValueError(f'Edge weights have to be finite and non-negative, got {weight}')
+        return weight
+
+    def _writable_weights(self, weight):
+        """Makes sure the weight array can take this value (floats, not memory-mapped)."""
+        if self.weights.dtype.kind != 'f' and not weight.is_integer():
+            self.weights = self.weights.astype(np.float64)
+        elif not self.weights.flags.writeable:
+            self.weights = np.array(self.weights)
+
+    def set_weight(self, edge_id, weight):
+        """
+        Changes how dangerous one route is, in place. Cheap: the adjacency
+        doesn't move, we just patch the two arcs that use this route.
+        """
+        weight = self.validate_weight(weight)
+        self._writable_weights(weight)
+        self.weights[edge_id] = weight
+        if 'arc_lists' in self.__dict__:
+            arc_weights = self.arc_lists[2]
+            for node in (self.edge_src[edge_id], self.edge_dst[edge_id]):
+                lo = int(self.indptr[node])
+                for k in np.flatnonzero(self.adj_edges[lo:self.indptr[node + 1]] == edge_id):
+                    arc_weights[lo + k] = weight
+        # Last, so anyone who sees the new version also sees the new arcs
+        self.__dict__.pop('_fingerprint', None)
+
+    def add_edge(self, u, v, weight, edge_type):
+        """
+        Adds a new route between node ids u and v and returns its edge id.
+        The adjacency gets rebuilt, so this costs O(edges) - fine for the odd edit.
+        """
+        weight = self.validate_weight(weight)
+        self._writable_weights(weight)
+        if edge_type not in self.edge_type_names:
+            self.edge_type_names.append(edge_type)
+        code = self.edge_type_names.index(edge_type)
+        code_type = np.promote_types(self.edge_types.dtype, np.min_scalar_type(code))
+
+        self.edge_src = np.append(self.edge_src, np.int32(u))
+        self.edge_dst = np.append(self.edge_dst, np.int32(v))
+        self.weights = np.append(self.weights, np.asarray(weight).astype(self.weights.dtype))
+        self.edge_types = np.append(self.edge_types.astype(code_type), code_type.type(code))
+        self._edges_changed()
+        return len(self.edge_src) - 1
+
+    def remove_edge(self, edge_id):
+        """
+        Removes a route. Heads up: every edge id after this one shifts down by one.
+        """
+        self.edge_src = np.delete(self.edge_src, edge_id)
+        self.edge_dst = np.delete(self.edge_dst, edge_id)
+        self.weights = np.delete(self.weights, edge_id)
+        self.edge_types = np.delete(self.edge_types, edge_id)
+        self._edges_changed()
+
+    def _edges_changed(self):
+        self._build_adjacency()
+        for name in ('arc_lists', 'edge_lengths', 'arc_lengths', '_fingerprint'):
+            self.__dict__.pop(name, None)
+
+    @cached_property
+    def arc_lists(self):
+        """
+        The adjacency as plain Python lists: (indptr, neighbor ids, arc weights).
+        Pure-Python loops like Dijkstra run a lot faster over lists than
+        over NumPy scalars, so the search code uses these.
+        """
+        arc_weights = self.weights[self.adj_edges].astype(np.float64)
+        return self.indptr.tolist(), self.adj_nodes.tolist(), arc_weights.tolist()
+
+    @cached_property
+    def edge_lengths(self):
+        """How long every route is on the map (straight line between its ends), by edge id."""
+        return np.hypot(*(self.pos[self.edge_src] - self.pos[self.edge_dst]).T)
+
+    @cached_property
+    def arc_lengths(self):
+        """edge_lengths lined up with arc_lists, as a plain list."""
+        return self.edge_lengths[self.adj_edges].tolist()
+
+    def fingerprint(self):
+        """
+        Hash of everything in the graph. Same graph = same fingerprint,
+        so caches can tell when they're out of date. Worked out once, then
+        remembered until the next set_weight / add_edge / remove_edge.
+        """
+        if '_fingerprint' in self.__dict__:
+            return self._fingerprint
+        h = hashlib.sha256()
+        h.update('\0'.join(map(str, self.names)).encode())
+        h.update('\0'.join(self.node_type_names + self.edge_type_names).encode())
+        for array in (self.pos, self.node_types, self.edge_src, self.edge_dst,
+                      self.weights, self.edge_types):
+            h.update(str(array.dtype).encode())
+            h.update(np.ascontiguousarray(array).tobytes())
+        self._fingerprint = h.hexdigest()
+        return self._fingerprint
+
+    def to_networkx(self):
+        """A read-only nx.Graph that reads straight from these arrays."""
+        from middle_earth.nxview import NetworkXView
+        return NetworkXView(self)
+
+
+def as_compact(G):
+    """
+    Gets a CompactGraph for whatever graph you've got. Our own graphs come
+    back as-is, plain NetworkX graphs get converted.
+    """
+    if isinstance(G, CompactGraph):
+        return G
+    # Our NetworkX view carries its CompactGraph around (checked this way so
+    # we don't have to import NetworkX just to ask)
+    compact = getattr(G, 'compact', None)
+    if isinstance(compact, CompactGraph):
+        return compact
+    return CompactGraph.from_networkx(G)
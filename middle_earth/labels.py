@@ -0,0 +1,126 @@
+"""
+Label placement for the map.
+
+adjust_text is great at un-squishing overlapping labels, but it's also the
+slowest part of drawing the map. So we run it once, write where every label
+ended up to a small JSON sidecar file, and just put the labels straight there
+on every render after that. Bonus: the labels land in the same spot every time.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+from middle_earth.tracing import span
+
+# Sidecar file with the saved label spots (one entry per layout key)
+LABEL_LAYOUT_PATH = 'label_layout.json'
+# Don't let the sidecar grow forever - keep only the newest few layouts
+MAX_SAVED_LAYOUTS = 8
+
+
+def layout_key(pos, fontsize, figsize):
+    """
+    Short hash of everything that changes where labels end up:
+    node positions, font size and figure size.
+    If any of those move, the saved layout is no good anymore.
+    """
+    h = hashlib.sha256()
+    h.update(repr((float(fontsize), tuple(float(s) for s in figsize))).encode())
+    for node in sorted(pos):
+        x, y = pos[node]
+        h.update(repr((node, round(float(x), 6), round(float(y), 6))).encode())
+    return h.hexdigest()[:16]
+
+
+def _read_sidecar(path):
+    try:
+        with open(path) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return saved if isinstance(saved, dict) else {}
+
+
+def load_label_layout(key, path=LABEL_LAYOUT_PATH):
+    """
+    Looks up a saved layout. Returns {node: (x, y, draw_arrow)} or None.
+    """
+    layout = _read_sidecar(path).get(key)
+    if not layout:
+        return None
+    return {node: (x, y, bool(arrow)) for node, (x, y, arrow) in layout.items()}
+
+
+def save_label_layout(key, layout, path=LABEL_LAYOUT_PATH):
+    """
+    Writes a layout to the sidecar file, dropping the oldest ones if it gets crowded.
+    A read-only disk isn't the end of the world - we'll just solve again next time.
+    """
+    saved = _read_sidecar(path)
+    saved.pop(key, None)
+    saved[key] = {node: [x, y, arrow] for node, (x, y, arrow) in layout.items()}
+    while len(saved) > MAX_SAVED_LAYOUTS:
+        saved.pop(next(iter(saved)))
+
+    # A temp file of our own (two sessions saving at once mustn't share one), then swap it in
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                        dir=os.path.dirname(path) or '.')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(saved, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def solve_label_layout(ax, texts, pos):
+    """
+    Runs the (slow) adjust_text overlap solver and reads back where each label went.
+    A label gets a leader line if it got pushed far enough off its own dot.
+    """
+    from adjustText import adjust_text
+
+    adjust_text(texts, ax=ax)
+
+    renderer = ax.figure.canvas.get_renderer()
+    layout = {}
+    for node, text in zip(pos, texts):
+        x, y = text.get_position()
+        target = ax.transData.transform(pos[node])
+        arrow = not text.get_window_extent(renderer).contains(*target)
+        layout[node] = (float(x), float(y), arrow)
+    return layout
+
+
+def place_labels(ax, pos, fontsize=12, arrowprops=None, path=LABEL_LAYOUT_PATH):
+    """
+    Puts a label on every node, reusing the saved layout when there is one.
+    Only falls back to adjust_text when the nodes or their coordinates changed.
+    """
+    # Imported here so loading the app doesn't pull in matplotlib before it draws anything
+    from matplotlib.patches import FancyArrowPatch
+
+    texts = []
+    for node, (x, y) in pos.items():
+        texts.append(ax.text(x, y, node.replace('_', ' '),
+                             fontsize=fontsize,
+                             horizontalalignment='center',
+                             verticalalignment='center'))
+
+    key = layout_key(pos, fontsize, ax.figure.get_size_inches())
+    layout = load_label_layout(key, path)
+    if layout is None or set(layout) != set(pos):
+        with span('adjust_text'):
+            layout = solve_label_layout(ax, texts, pos)
+        save_label_layout(key, layout, path)
+
+    for node, text in zip(pos, texts):
+        x, y, arrow = layout[node]
+        text.set_position((x, y))
+        if arrow and arrowprops:
+            ax.add_patch(FancyArrowPatch(posA=(x, y), posB=pos[node],
+                                         patchA=text, **arrowprops))
+    return texts
@@ -0,0 +1,317 @@
+"""
+Loading maps from files instead of the hardcoded dict in app.py.
+
+Two files describe a map:
+
+- nodes: one row per location with columns name, x, y, type
+- edges: one row per path with columns src, dst, weight, type
+
+Each can be CSV, JSON Lines (.jsonl / .ndjson) or Parquet (needs pyarrow).
+Rows are read in fixed-size chunks and added to a GraphBuilder as we go,
+so even huge files never sit in memory as a pile of dicts.
+
+Parsing big files is still slow-ish, so once a map is loaded we can write a
+binary snapshot: a folder of .npy arrays (memory-mapped on the way back in)
+plus a table of location names. Loading a snapshot skips parsing entirely.
+"""
+from array import array
+import csv
+import json
+import math
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from middle_earth.graph import CompactGraph
+
+# Rows per chunk when streaming files
+CHUNK_SIZE = 50_000
+# Bump this if the snapshot layout ever changes
+SNAPSHOT_VERSION = 1
+
+_SNAPSHOT_ARRAYS = ('pos', 'node_types', 'edge_src', 'edge_dst', 'weights',
+                    'edge_types', 'indptr', 'adj_nodes', 'adj_edges')
+
+
+class GraphLoadError(ValueError):
+    """A map file has something in it we can't use (says which file and row)."""
+
+
+def _chunked(rows, chunk_size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _csv_rows(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        # Row numbers start at 2 because line 1 is the header
+        for line_no, row in enumerate(csv.DictReader(f), start=2):
+            yield line_no, row
+
+
+def _jsonl_rows(path):
+    with open(path, encoding='utf-8') as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                raise GraphLoadError(f'{path}:{line_no}: not valid JSON ({e})') from None
+            if not isinstance(row, dict):
+                raise GraphLoadError(f'{path}:{line_no}: expected a JSON object')
+            yield line_no, row
+
+
+def _parquet_chunks(path, chunk_size):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError('Reading Parquet files needs pyarrow (pip install pyarrow)') from None
+    row_no = 1
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+        rows = batch.to_pylist()
+        yield list(zip(range(row_no, row_no + len(rows)), rows))
+        row_no += len(rows)
+
+
+def iter_chunks(path, chunk_size=CHUNK_SIZE):
+    """
+    Reads a CSV / JSONL / Parquet file in chunks of (row number, record dict) pairs.
+    """
+    ext = os.path.splitext(str(path))[1].lower()
+    if ext == '.csv':
+        return _chunked(_csv_rows(path), chunk_size)
+    if ext in ('.jsonl', '.ndjson'):
+        return _chunked(_jsonl_rows(path), chunk_size)
+    if ext in ('.parquet', '.pq'):
+        return _parquet_chunks(path, chunk_size)
+    raise GraphLoadError(f"{path}: don't know how to read '{ext}' files "
+                         '(use .csv, .jsonl/.ndjson or .parquet)')
+
+
+def _field(row, key, where):
+    value = row.get(key)
+    if value is None or value == '':
+        raise GraphLoadError(f"{where}: missing '{key}'")
+    return value
+
+
+def _text(row, key, where):
+    value = str(_field(row, key, where))
+    if '\0' in value:
+        raise GraphLoadError(f"{where}: '{key}' can't contain NUL characters")
+    return value
+
+
+def _number(row, key, where):
+    value = _field(row, key, where)
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise GraphLoadError(f"{where}: '{key}' should be a number, got {value!r}") from None
+    if not math.isfinite(number):
+        raise GraphLoadError(f"{where}: '{key}' should be a finite number, got {value!r}")
+    return number
+
+
+class GraphBuilder:
+    """
+    Collects locations and paths a chunk at a time, then packs them into a CompactGraph.
+
+    Everything is kept in typed arrays (not lists of dicts), so memory stays at
+    a few bytes per node/edge. Add all the nodes before the edges that use them,
+    and call build() once at the very end.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.node_ids = {}
+        self._pos = array('d')
+        self._node_types = array('i')
+        self._node_type_table = {}
+
+        self._src = array('i')
+        self._dst = array('i')
+        self._weights = array('d')
+        self._edge_types = array('i')
+        self._edge_type_table = {}
+        self._whole_weights = True
+
+    def add_nodes(self, rows, source='nodes'):
+        for line_no, row in rows:
+            where = f'{source}:{line_no}'
+            name = _text(row, 'name', where)
+            if name in self.node_ids:
+                raise GraphLoadError(f"{where}: location '{name}' is listed twice")
+            x, y = _number(row, 'x', where), _number(row, 'y', where)
+            node_type = _text(row, 'type', where)
+
+            self.node_ids[name] = len(self.names)
+            self.names.append(name)
+            self._pos.extend((x, y))
+            self._node_types.append(
+                self._node_type_table.setdefault(node_type, len(self._node_type_table)))
+
+    def add_edges(self, rows, source='edges'):
+        for line_no, row in rows:
+            where = f'{source}:{line_no}'
+            ends = []
+            for key in ('src', 'dst'):
+                name = _text(row, key, where)
+                if name not in self.node_ids:
+                    raise GraphLoadError(f"{where}: unknown location '{name}' in '{key}'")
+                ends.append(self.node_ids[name])
+            weight = _number(row, 'weight', where)
+            if weight < 0:
+                raise GraphLoadError(f"{where}: 'weight' can't be negative, got {weight}")
+            edge_type = _text(row, 'type', where)
+
+            self._src.append(ends[0])
+            self._dst.append(ends[1])
+            self._weights.append(weight)
+            self._whole_weights = self._whole_weights and weight.is_integer()
+            self._edge_types.append(
+                self._edge_type_table.setdefault(edge_type, len(self._edge_type_table)))
+
+    def build(self):
+        weights = np.frombuffer(self._weights, dtype=np.float64)
+        if self._whole_weights:
+            # Danger levels like 3 and 7 stay ints, so they still print as "3/10"
+            weights = weights.astype(np.int64)
+
+        def codes(values, table):
+            return np.frombuffer(values, dtype=np.intc).astype(
+                np.min_scalar_type(max(len(table) - 1, 0)))
+
+        return CompactGraph(
+            self.names,
+            np.frombuffer(self._pos, dtype=np.float64).reshape(-1, 2),
+            codes(self._node_types, self._node_type_table), list(self._node_type_table),
+            np.frombuffer(self._src, dtype=np.intc),
+            np.frombuffer(self._dst, dtype=np.intc),
+            weights,
+            codes(self._edge_types, self._edge_type_table), list(self._edge_type_table),
+        )
+
+
+def load_files(nodes_path, edges_path, chunk_size=CHUNK_SIZE):
+    """
+    Streams a nodes file and an edges file into a CompactGraph.
+    """
+    builder = GraphBuilder()
+    for chunk in iter_chunks(nodes_path, chunk_size):
+        builder.add_nodes(chunk, source=str(nodes_path))
+    for chunk in iter_chunks(edges_path, chunk_size):
+        builder.add_edges(chunk, source=str(edges_path))
+    return builder.build()
+
+
+def source_stamp(path):
+    """Which file this is and what state it's in: {'path', 'size', 'mtime_ns'}."""
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def save_snapshot(cg, directory, sources=()):
+    """
+    Writes the graph as a folder of .npy arrays plus a names table.
+    sources (the files it was parsed from) get stamped into meta.json, so
+    load_graph can tell whether the snapshot still matches them.
+
+    Anyone may still have the old snapshot memory-mapped (the app, the
+    service, another CLI run), so we never write over its files: everything
+    gets written to a scratch folder first and then swapped in with
+    os.replace. The old files just lose their name - whoever has them mapped
+    keeps reading them - instead of shrinking underneath them (SIGBUS).
+    """
+    os.makedirs(directory, exist_ok=True)
+    meta_path = os.path.join(directory, 'meta.json')
+    scratch = tempfile.mkdtemp(prefix='.saving-', dir=directory)
+    try:
+        for key in _SNAPSHOT_ARRAYS:
+            np.save(os.path.join(scratch, f'{key}.npy'), np.ascontiguousarray(getattr(cg, key)))
+        with open(os.path.join(scratch, 'names.bin'), 'wb') as f:
+            f.write('\0'.join(cg.names).encode('utf-8'))
+        with open(os.path.join(scratch, 'meta.json'), 'w') as f:
+            json.dump({
+                'version': SNAPSHOT_VERSION,
+                'nodes': cg.number_of_nodes(),
+                'edges': cg.number_of_edges(),
+                'node_type_names': cg.node_type_names,
+                'edge_type_names': cg.edge_type_names,
+                'sources': [source_stamp(path) for path in sources],
+            }, f)
+
+        # meta.json comes out first and goes back in last, so a half-swapped
+        # snapshot never looks complete to anyone who starts loading it now
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        for name in [f'{key}.npy' for key in _SNAPSHOT_ARRAYS] + ['names.bin', 'meta.json']:
+            os.replace(os.path.join(scratch, name), os.path.join(directory, name))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def load_snapshot(directory, mmap=True):
+    """
+    Loads a snapshot written by save_snapshot. With mmap=True the arrays are
+    memory-mapped, so the OS only reads the parts we actually touch.
+    """
+    try:
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+    except (OSError, ValueError) as e:
+        raise GraphLoadError(f'{directory}: not a graph snapshot ({e})') from None
+    if meta.get('version') != SNAPSHOT_VERSION:
+        raise GraphLoadError(f"{directory}: snapshot version {meta.get('version')} "
+                             f'is not supported (expected {SNAPSHOT_VERSION})')
+
+    mode = 'r' if mmap else None
+    arrays = {key: np.load(os.path.join(directory, f'{key}.npy'), mmap_mode=mode)
+              for key in _SNAPSHOT_ARRAYS}
+    with open(os.path.join(directory, 'names.bin'), 'rb') as f:
+        blob = f.read().decode('utf-8')
+    names = blob.split('\0') if meta['nodes'] else []
+
+    return CompactGraph(
+        names, arrays['pos'],
+        arrays['node_types'], meta['node_type_names'],
+        arrays['edge_src'], arrays['edge_dst'], arrays['weights'],
+        arrays['edge_types'], meta['edge_type_names'],
+        adjacency=(arrays['indptr'], arrays['adj_nodes'], arrays['adj_edges']),
+    )
+
+
+def load_graph(nodes_path, edges_path, snapshot_dir=None, chunk_size=CHUNK_SIZE):
+    """
+    Loads a map from files, going through a snapshot when we can.
+
+    If snapshot_dir holds a snapshot made from these very files (same paths,
+    sizes and modification times) we use that; otherwise we parse the files
+    and (re)write the snapshot for next time. Just being newer than the files
+    isn't enough - point the variables at some other, older files and the
+    snapshot would still look fresh.
+    """
+    if snapshot_dir:
+        try:
+            with open(os.path.join(snapshot_dir, 'meta.json')) as f:
+                stamped = json.load(f).get('sources')
+            fresh = stamped == [source_stamp(nodes_path), source_stamp(edges_path)]
+        except (OSError, ValueError, AttributeError):
+            fresh = False
+        if fresh:
+            return load_snapshot(snapshot_dir)
+
+    cg = load_files(nodes_path, edges_path, chunk_size)
+    if snapshot_dir:
+        save_snapshot(cg, snapshot_dir, sources=(nodes_path, edges_path))
+    return cg
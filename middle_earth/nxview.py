@@ -0,0 +1,77 @@
+"""
+A zero-copy NetworkX view of a CompactGraph.
+
+NetworkX graphs are really just dicts of dicts (G._node and G._adj). Here
+those dicts are swapped for read-only lookalikes that build each attribute
+dict from the CompactGraph arrays when NetworkX asks for it, so any NetworkX
+algorithm can run on our graph without copying it first.
+"""
+from collections.abc import Mapping
+
+import networkx as nx
+
+
+class _NodeAtlas(Mapping):
+    """Looks like G._node to NetworkX: node name -> attribute dict (made on the fly)."""
+
+    def __init__(self, compact):
+        self._g = compact
+
+    def __getitem__(self, name):
+        i = self._g.node_ids[name]
+        return {'pos': tuple(self._g.pos[i].tolist()), 'type': self._g.node_type(i)}
+
+    def __iter__(self):
+        return iter(self._g.names)
+
+    def __len__(self):
+        return len(self._g.names)
+
+    def __contains__(self, name):
+        return name in self._g.node_ids
+
+
+class _AdjAtlas(Mapping):
+    """Looks like G._adj to NetworkX: node name -> {neighbor name: edge attribute dict}."""
+
+    def __init__(self, compact):
+        self._g = compact
+
+    def __getitem__(self, name):
+        g = self._g
+        nbrs, edges = g.neighbors(g.node_ids[name])
+        return {
+            g.names[v]: {'weight': w, 'type': g.edge_type_names[t]}
+            for v, w, t in zip(nbrs.tolist(), g.weights[edges].tolist(),
+                               g.edge_types[edges].tolist())
+        }
+
+    def __iter__(self):
+        return iter(self._g.names)
+
+    def __len__(self):
+        return len(self._g.names)
+
+    def __contains__(self, name):
+        return name in self._g.node_ids
+
+
+class NetworkXView(nx.Graph):
+    """
+    Zero-copy nx.Graph facade over a CompactGraph.
+
+    Nothing gets copied up front - attribute dicts are built when NetworkX
+    asks for them. It's frozen, so edit the CompactGraph instead.
+
+    Some NetworkX algorithms make fresh graphs with G.__class__(), so without
+    a compact graph this is just an ordinary (mutable, empty) nx.Graph.
+    """
+
+    def __init__(self, compact=None, **attr):
+        super().__init__(**attr)
+        self.compact = compact
+        if compact is None:
+            return
+        self._node = _NodeAtlas(compact)
+        self._adj = _AdjAtlas(compact)
+        nx.freeze(self)
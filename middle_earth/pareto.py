@@ -0,0 +1,142 @@
+"""
+Safe or short? Routes that trade danger against distance.
+
+Every path has a danger (its weight) and a length on the map (straight
+line between its ends, see CompactGraph.edge_lengths). The safest route is
+often a long way round and the shortest one goes straight through Mordor.
+pareto_routes() finds every route in between that's worth considering: the
+Pareto front, where no other route is both safer AND shorter.
+
+It's a bi-objective label-setting search (BOA*, Hernandez et al. 2020):
+
+- a "label" is one way of reaching a place, with its (danger, distance)
+- labels come off the heap in (danger, distance) order, each plus exactly
+  what's left at best: the least danger and the least distance from its
+  place to the end (one Dijkstra backwards from the end for each)
+- since danger only goes up as we pop, a label is only worth keeping if it's
+  SHORTER than every label already kept at its place - so checking
+  dominance is one comparison, not a scan of every label there
+- anything that can't end up shorter than the best route already found gets
+  dropped straight away, and so does anything more dangerous than the
+  shortest route (the far end of the front)
+
+Same RouteFilter rules as middle_earth.alternatives, if you want them.
+"""
+import heapq
+import math
+
+from middle_earth.graph import as_compact
+from middle_earth.routing import NO_PRED, _node_id
+
+# Relative wiggle room on the danger ceiling, for float rounding
+SLACK = 1e-9
+
+
+def _backwards(arcs, allowed, target):
+    """
+    Dijkstra from target over (indptr, neighbors, arc costs), only along
+    allowed arcs. Returns (cost to target, next place towards it, arc used to
+    get there from the next place) for every place.
+    """
+    indptr, nbrs, costs = arcs
+    n = len(indptr) - 1
+    dist = [math.inf] * n
+    succ = [NO_PRED] * n
+    via = [NO_PRED] * n
+    done = [False] * n
+    dist[target] = 0.0
+    heap = [(0.0, target)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if done[u]:
+            continue
+        done[u] = True
+        for k in range(indptr[u], indptr[u + 1]):
+            if allowed is not None and not allowed[k]:
+                continue
+            v = nbrs[k]
+            nd = d + costs[k]
+            if nd < dist[v]:
+                dist[v] = nd
+                succ[v] = u
+                via[v] = k
+                heapq.heappush(heap, (nd, v))
+    return dist, succ, via
+
+
+def pareto_routes(G, start, end, route_filter=None, index=None):
+    """
+    The danger/distance trade-offs between start and end: a list of
+    (list of nodes, total danger, total distance), safest (and longest) first,
+    shortest (and most dangerous) last. Empty if there's no allowed way through.
+
+    index (a RoutingIndex for this graph) saves the danger Dijkstra when there are no rules.
+    Raises nx.NodeNotFound for unknown places, ValueError for unknown types in the filter.
+    """
+    cg = as_compact(G)
+    source, target = _node_id(cg, start), _node_id(cg, end)
+    allowed = route_filter.arc_mask(cg, keep=(source, target)) if route_filter else None
+    indptr, nbrs, dangers = cg.arc_lists
+    lengths = cg.arc_lengths
+
+    # The least danger and the least distance left from every place
+    if index is not None and allowed is None:
+        to_go_danger = index.tree(target)[0].tolist()
+    else:
+        to_go_danger = _backwards((indptr, nbrs, dangers), allowed, target)[0]
+    to_go_length, next_step, via = _backwards((indptr, nbrs, lengths), allowed, target)
+    if math.isinf(to_go_length[source]):
+        return []
+
+    # The shortest route is on the front and nothing on it is more dangerous
+    # (a tie for shortest could be safer, so this is just a ceiling)
+    most_danger, u = 0.0, source
+    while u != target:
+        most_danger += dangers[via[u]]
+        u = next_step[u]
+    # (plus a hair, so float rounding can't knock that route itself off the front)
+    most_danger += SLACK * max(1.0, most_danger)
+
+    # Labels: place, danger, distance and the label we came from (parallel lists)
+    label_node, label_danger, label_length, label_prev = [source], [0.0], [0.0], [-1]
+    shortest_kept = [math.inf] * cg.number_of_nodes()
+    heap = [(to_go_danger[source], to_go_length[source], 0)]
+    found = []
+    while heap:
+        _, f_length, lab = heapq.heappop(heap)
+        u, length = label_node[lab], label_length[lab]
+        # Dominated by a label we kept here, or can't beat the shortest full route so far
+        if length >= shortest_kept[u] or f_length >= shortest_kept[target]:
+            continue
+        shortest_kept[u] = length
+        if u == target:
+            found.append(lab)
+            continue
+
+        danger = label_danger[lab]
+        for k in range(indptr[u], indptr[u + 1]):
+            if allowed is not None and not allowed[k]:
+                continue
+            v = nbrs[k]
+            new_length = length + lengths[k]
+            new_f_length = new_length + to_go_length[v]
+            if new_length >= shortest_kept[v] or new_f_length >= shortest_kept[target]:
+                continue
+            new_f_danger = danger + dangers[k] + to_go_danger[v]
+            if new_f_danger > most_danger:
+                continue
+            label_node.append(v)
+            label_danger.append(danger + dangers[k])
+            label_length.append(new_length)
+            label_prev.append(lab)
+            heapq.heappush(heap, (new_f_danger, new_f_length, len(label_node) - 1))
+
+    routes = []
+    for lab in found:
+        danger, length = label_danger[lab], label_length[lab]
+        path = []
+        while lab != -1:
+            path.append(cg.names[label_node[lab]])
+            lab = label_prev[lab]
+        routes.append((path[::-1], danger, length))
+    return routes
@@ -0,0 +1,168 @@
+"""
+Answers worth remembering: one result cache for every user.
+
+Lots of people ask the same questions ("Bree to Mount Doom?", "top 5
+strategic places?") about the same map. ResultCache keeps the answers, keyed
+by the graph's version (its fingerprint) plus the question's parameters, so
+only the first person to ask waits:
+
+    cache = ResultCache(path='.results.sqlite')    # path is optional
+    result = cache.fetch('path', G, {'start': 'Bree', 'end': 'Mount_Doom'},
+                         lambda: shortest_path_analysis(G, 'Bree', 'Mount_Doom'))
+
+- memory: the most recently used answers, up to max_entries of them (and
+  max_bytes in total), the least recently used ones get dropped first
+- disk (optional): a SQLite file with up to max_disk_entries more, so answers
+  survive restarts. Memory misses look here before computing anything
+
+Answers have to be JSON-able (NumPy arrays aren't - turn them into lists
+first): that's how they go to disk and how their size gets measured. The
+memory tier keeps them already decoded, so a hit costs nothing - but like
+st.cache_resource, everyone gets the SAME object, so treat answers as
+read-only. An edited graph gets a new fingerprint, so its old answers just
+never match again (and eventually fall out the LRU end).
+
+Hits and misses are counted (stats()) and show up in tracing too, as the
+'results' cache. Two people asking the same new question at the same moment
+both compute it - harmless, just not free.
+
+Set MIDDLE_EARTH_RESULT_CACHE to a file to switch the disk tier on for the
+app and the service.
+"""
+from collections import OrderedDict
+import json
+import os
+import threading
+import time
+
+from middle_earth.graph import as_compact
+from middle_earth.tracing import cache_lookup, cache_miss
+
+RESULT_CACHE_ENV = 'MIDDLE_EARTH_RESULT_CACHE'
+# Answers kept in memory (and how many bytes of JSON they can add up to)
+MAX_ENTRIES = 512
+MAX_BYTES = 64 * 2 ** 20
+# Answers kept on disk
+MAX_DISK_ENTRIES = 10000
+
+
+def result_key(analysis, version, params):
+    """
+    One string for (analysis, graph version, parameters). Parameters are
+    sorted by name, and lists/tuples count the same, so equal questions
+    always make equal keys.
+    """
+    return json.dumps([analysis, version, params], sort_keys=True, separators=(',', ':'))
+
+
+class ResultCache:
+    """Thread-safe LRU of (read-only) JSON-able answers, with an optional SQLite file behind it."""
+
+    def __init__(self, path=None, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES,
+                 max_disk_entries=MAX_DISK_ENTRIES):
+        self.path = path
+        self.max_entries, self.max_bytes = max_entries, max_bytes
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()    # key -> (answer, size of its JSON in bytes)
+        self._bytes = 0
+        self._counts = {'hits': 0, 'disk_hits': 0, 'misses': 0}
+        self._lock = threading.Lock()
+        self._db = None
+        if path is not None:
+            import sqlite3
+            # One connection for every thread (the lock takes turns)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS results '
+                             '(key TEXT PRIMARY KEY, value TEXT NOT NULL, used REAL NOT NULL)')
+            self._db.commit()
+
+    def _remember(self, key, value, size):
+        """Puts an answer at the fresh end of the memory LRU (lock held)."""
+        if key in self._memory:
+            self._bytes -= self._memory.pop(key)[1]
+        if size > self.max_bytes:
+            return
+        self._memory[key] = (value, size)
+        self._bytes += size
+        while len(self._memory) > self.max_entries or self._bytes > self.max_bytes:
+            self._bytes -= self._memory.popitem(last=False)[1][1]
+
+    def _lookup(self, key):
+        """(True, answer) for key (memory, then disk), or (False, None). Counts the hit or miss."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._counts['hits'] += 1
+                return True, self._memory[key][0]
+            if self._db is not None:
+                row = self._db.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    self._db.execute('UPDATE results SET used = ? WHERE key = ?', (time.time(), key))
+                    self._db.commit()
+                    data = row[0].encode()
+                    value = json.loads(data)
+                    self._remember(key, value, len(data))
+                    self._counts['disk_hits'] += 1
+                    return True, value
+            self._counts['misses'] += 1
+            return False, None
+
+    def _store(self, key, value):
+        """Remembers an answer. Returns it the way every later hit will see it (decoded JSON)."""
+        text = json.dumps(value)
+        # Round-tripped, so a tuple comes back as a list now rather than only after a restart
+        value = json.loads(text)
+        with self._lock:
+            self._remember(key, value, len(text.encode()))
+            if self._db is not None:
+                self._db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?)',
+                                 (key, text, time.time()))
+                # Least recently used ones go first
+                self._db.execute('DELETE FROM results WHERE key IN (SELECT key FROM results '
+                                 'ORDER BY used DESC LIMIT -1 OFFSET ?)', (self.max_disk_entries,))
+                self._db.commit()
+        return value
+
+    def fetch(self, analysis, G, params, compute):
+        """
+        The answer to analysis(params) on graph G: from the cache if anyone
+        asked before, otherwise compute() (which gets remembered).
+        """
+        key = result_key(analysis, as_compact(G).fingerprint(), params)
+        with cache_lookup('results'):
+            found, value = self._lookup(key)
+            if not found:
+                cache_miss('results')
+                value = self._store(key, compute())
+        return value
+
+    def stats(self):
+        """Hits (memory and disk), misses, hit rate and how full the memory tier is."""
+        with self._lock:
+            stats = dict(self._counts)
+            stats['entries'], stats['bytes'] = len(self._memory), self._bytes
+            if self._db is not None:
+                stats['disk_entries'] = self._db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        asked = stats['hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['disk_hits']) / asked if asked else None
+        return stats
+
+    def clear(self):
+        """Forgets everything (on disk too) - the counters keep going."""
+        with self._lock:
+            self._memory.clear()
+            self._bytes = 0
+            if self._db is not None:
+                self._db.execute('DELETE FROM results')
+                self._db.commit()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+def result_cache_from_env():
+    """A ResultCache, with a disk tier if MIDDLE_EARTH_RESULT_CACHE names a file."""
+    return ResultCache(os.environ.get(RESULT_CACHE_ENV) or None)
@@ -0,0 +1,228 @@
+"""
+Precomputed shortest paths, so the Path Finder doesn't run Dijkstra on every click.
+
+For small and medium maps we just solve every start/end pair up front and keep
+the answers in two NumPy matrices: one with the total danger between every pair
+of places, one with "who comes right before you on the best route". Rebuilding a
+path is then just walking that predecessor row backwards.
+
+Big maps would need a ridiculous amount of memory for that, so past a certain
+size we switch to running Dijkstra from one start point at a time and remembering
+the most recent answers (an LRU cache). One index gets shared by every session
+and request, so that cache has a lock.
+"""
+from collections import OrderedDict
+import heapq
+from itertools import count
+import threading
+
+import numpy as np
+
+from middle_earth.graph import as_compact
+
+# Past this many nodes the n x n matrices get too big (2000 nodes ~ 48 MB)
+DENSE_NODE_LIMIT = 2000
+# How many single-source search trees to remember for big maps
+TREE_CACHE_SIZE = 256
+# Marker for "no predecessor" in the predecessor arrays
+NO_PRED = -1
+
+
+def dijkstra(cg, source, target=None):
+    """
+    Classic single-source Dijkstra straight over the CSR arrays.
+    Returns (distance array, predecessor array), both indexed by node id.
+    Stops early once target (if given) is settled.
+
+    When two routes tie, the predecessor with the smaller node id wins, so the
+    chosen path doesn't depend on search order. A* (middle_earth.astar) breaks
+    ties the same way, but only promises an equally safe route, see there.
+    """
+    indptr, nbrs, wts = cg.arc_lists
+    n = cg.number_of_nodes()
+    # Plain lists while searching (way faster than poking NumPy one item at a time)
+    dist = [np.inf] * n
+    pred = [NO_PRED] * n
+    done = [False] * n
+
+    dist[source] = 0.0
+    c = count()
+    heap = [(0.0, next(c), source)]
+    while heap:
+        d, _, u = heapq.heappop(heap)
+        if done[u]:
+            continue
+        done[u] = True
+        if u == target:
+            break
+        for k in range(indptr[u], indptr[u + 1]):
+            v = nbrs[k]
+            nd = d + wts[k]
+            if nd < dist[v]:
+                dist[v] = nd
+                pred[v] = u
+                heapq.heappush(heap, (nd, next(c), v))
+            elif nd == dist[v] and not done[v] and u < pred[v]:
+                pred[v] = u
+    return np.array(dist), np.array(pred, dtype=np.int32)
+
+
+# We raise NetworkX's own exceptions (so callers can catch them like before),
+# but only import NetworkX once something actually goes wrong
+
+def _node_id(cg, node):
+    try:
+        return cg.node_ids[node]
+    except KeyError:
+        import networkx as nx
+        raise nx.NodeNotFound(f"Node {node} not in graph") from None
+
+
+def _no_path(start, end):
+    import networkx as nx
+    return nx.NetworkXNoPath(f"No path between {start} and {end}.")
+
+
+def _walk_back(cg, pred, source, target):
+    """Rebuilds a path of node names by following predecessors from the end."""
+    path = [target]
+    while path[-1] != source:
+        path.append(int(pred[path[-1]]))
+    path.reverse()
+    return [cg.names[i] for i in path]
+
+
+def shortest_path(cg, start, end):
+    """
+    One-off safest route from start to end: (list of nodes, total danger).
+    Raises nx.NetworkXNoPath if you can't get there from here.
+    """
+    source, target = _node_id(cg, start), _node_id(cg, end)
+    dist, pred = dijkstra(cg, source, target)
+    if not np.isfinite(dist[target]):
+        raise _no_path(start, end)
+    return _walk_back(cg, pred, source, target), float(dist[target])
+
+
+def describe_path(cg, path, distance):
+    """
+    Turns a path (list of node names) into the result dict the Path Finder shows:
+    prettified names, the total danger and a step-by-step breakdown.
+    """
+    # Let's get some details about each step of the journey
+    path_details = []
+    for current, next_loc in zip(path, path[1:]):
+        # Look up info about the path between these two places
+        edge = cg.edge_between(cg.node_ids[current], cg.node_ids[next_loc])
+        path_details.append({
+            'from': current.replace('_', ' '),  # Make it look prettier
+            'to': next_loc.replace('_', ' '),
+            'danger_level': cg.weights[edge].item(),
+            'path_type': cg.edge_type(edge).replace('_', ' ')
+        })
+
+    return {
+        'path': [p.replace('_', ' ') for p in path],  # Full journey
+        'total_danger': distance,                      # Total danger score
+        'path_details': path_details                   # Step-by-step details
+    }
+
+
+def path_from_tree(cg, tree, source, target):
+    """
+    Reads one route out of a shortest-path tree (dist, pred) from source.
+    Returns (list of node names, total danger), or None if target is out of reach.
+    """
+    dist, pred = tree
+    if not np.isfinite(dist[target]):
+        return None
+    return _walk_back(cg, pred, source, target), float(dist[target])
+
+
+class RoutingIndex:
+    """
+    All the shortest-path answers for one version of the graph.
+
+    Build it once per graph (and again whenever routes or weights change),
+    then call shortest_path() as often as you like.
+    """
+
+    def __init__(self, G, dense_limit=DENSE_NODE_LIMIT, cache_size=TREE_CACHE_SIZE):
+        self.graph = as_compact(G)
+        self.dense = self.graph.number_of_nodes() <= dense_limit
+
+        self.cache_size = cache_size
+
+        if self.dense:
+            self.dist, self.pred = self._build_matrices()
+        else:
+            self.dist = self.pred = None
+            # source id -> (dist, pred), oldest first
+            self._trees = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _build_matrices(self):
+        n = self.graph.number_of_nodes()
+        dist = np.empty((n, n))
+        pred = np.empty((n, n), dtype=np.int32)
+        for source in range(n):
+            dist[source], pred[source] = dijkstra(self.graph, source)
+        return dist, pred
+
+    def tree(self, source_id):
+        """
+        Shortest-path tree from one node: (distance row, predecessor row).
+        """
+        if self.dense:
+            return self.dist[source_id], self.pred[source_id]
+        with self._lock:
+            if source_id in self._trees:
+                self._trees.move_to_end(source_id)
+                return self._trees[source_id]
+        # Searched outside the lock, so one slow tree doesn't hold up everyone else
+        # (two threads asking for the same new one both search - no harm done)
+        tree = dijkstra(self.graph, source_id)
+        with self._lock:
+            self._trees[source_id] = tree
+            if len(self._trees) > self.cache_size:
+                self._trees.popitem(last=False)
+        return tree
+
+    def held_trees(self, u, v):
+        """
+        For every source we're holding a tree for right now (dense: all of
+        them) - (source ids, dist to u, dist to v, pred of u, pred of v).
+        """
+        if self.dense:
+            return (np.arange(len(self.dist)), self.dist[:, u], self.dist[:, v],
+                    self.pred[:, u], self.pred[:, v])
+        with self._lock:
+            held = list(self._trees.items())
+        sources = np.array([source for source, _ in held], dtype=np.int64)
+        dist = np.array([(tree[0][u], tree[0][v]) for _, tree in held], dtype=float).reshape(-1, 2)
+        pred = np.array([(tree[1][u], tree[1][v]) for _, tree in held], dtype=np.int64).reshape(-1, 2)
+        return sources, dist[:, 0], dist[:, 1], pred[:, 0], pred[:, 1]
+
+    def refresh_sources(self, source_ids):
+        """
+        Call after editing the graph: re-solves (or forgets) just the trees
+        from these sources, leaving every other answer alone.
+        """
+        for source in source_ids:
+            source = int(source)
+            if self.dense:
+                self.dist[source], self.pred[source] = dijkstra(self.graph, source)
+            else:
+                with self._lock:
+                    self._trees.pop(source, None)
+
+    def shortest_path(self, start, end):
+        """
+        Best route from start to end as (list of nodes, total danger).
+        Raises nx.NetworkXNoPath if you can't get there from here.
+        """
+        source, target = _node_id(self.graph, start), _node_id(self.graph, end)
+        found = path_from_tree(self.graph, self.tree(source), source, target)
+        if found is None:
+            raise _no_path(start, end)
+        return found
@@ -0,0 +1,369 @@
+"""
+A tiny HTTP service that keeps the map (and everything built on it) warm in memory.
+
+Loading the graph, building the routing index and picking A* landmarks only
+happens once at start-up, then every request is just the query itself.
+It's plain asyncio with just enough HTTP/1.1 to answer GET requests (with
+keep-alive), plus one POST for editing the map, so there's nothing extra to install:
+
+    GET /health
+    GET /path?start=Bree&end=Mount+Doom&method=alt   (method: index, dijkstra, astar, alt)
+    GET /path?start=Bree&end=Mount+Doom&k=3&avoid_path_types=dangerous_path&max_leg_danger=8
+        (k alternatives and/or route rules: answers {"routes": [...]}; also avoid_place_types)
+    GET /tradeoffs?start=Rivendell&end=Minas+Tirith   (danger vs distance, same route rules)
+    GET /strategic?top_n=5&mode=approximate&epsilon=0.05&seed=1
+    GET /regions?seed=0&resolution=1.0&connected=true
+    GET /metrics        (if tracing has a PrometheusSink, see middle_earth/tracing.py)
+    GET /cache          (hits and misses of the shared result cache)
+    POST /edit?start=Bree&end=Weathertop&danger=8       (changes a path's danger, or opens a
+        new one: path_type=road by default)
+    POST /edit?start=Bree&end=Weathertop&close=true     (closes it)
+
+Answers are JSON (/metrics is Prometheus text). Bad parameters get a 400, unknown places (or no way
+through) a 404. Anything slower than a lookup runs in a thread pool so the
+event loop keeps taking requests in the meantime, and its answer goes in a
+ResultCache (middle_earth/results.py) so nobody waits for the same one twice.
+
+Edits go through a DynamicNetwork (middle_earth/dynamic.py): they wait for
+the requests already running, only redo the routing trees they touch, and
+give the map a new version - so every cached answer for the old map stops
+matching. /edit answers with the new version. Any POST body is ignored.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import json
+from urllib.parse import parse_qs, urlsplit
+
+from middle_earth.analysis import (SEARCH_METHODS, alternative_routes_analysis, build_heuristic,
+                                   centrality_ranking, place_name, regional_groups_analysis,
+                                   shortest_path_analysis, strategic_locations_analysis,
+                                   tradeoff_routes_analysis)
+from middle_earth.dynamic import DynamicNetwork
+from middle_earth.graph import as_compact
+from middle_earth.results import result_cache_from_env
+from middle_earth.routing import RoutingIndex
+from middle_earth.tracing import PrometheusSink, sinks, trace
+
+# Longest request line / header line we'll read before giving up on a client
+MAX_LINE = 8192
+# Biggest POST body we'll read (and throw away)
+MAX_BODY = 65536
+# Threads for the slow stuff (centrality, regions, uncached searches)
+WORKERS = 4
+# Most alternative routes one /path request can ask for
+MAX_ALTERNATIVES = 20
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           500: 'Internal Server Error'}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _param(query, name, convert=str, default=None):
+    """One query-string value, converted (a bad value is the client's fault: 400)."""
+    values = query.get(name)
+    if not values:
+        return default
+    try:
+        return convert(values[-1])
+    except ValueError:
+        raise HTTPError(400, f"'{name}' doesn't look right: {values[-1]!r}") from None
+
+
+def _names(value):
+    """A comma-separated list of names."""
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def _rules(query):
+    """The optional route rules (keyword arguments for the route analyses)."""
+    return {'avoid_edge_types': _param(query, 'avoid_path_types', _names, []),
+            'avoid_node_types': _param(query, 'avoid_place_types', _names, []),
+            'max_leg_danger': _param(query, 'max_leg_danger', float)}
+
+
+def _flag(value):
+    if value.lower() in ('1', 'true', 'yes', 'on'):
+        return True
+    if value.lower() in ('0', 'false', 'no', 'off', ''):
+        return False
+    raise ValueError(value)
+
+
+def _danger(weight):
+    """A danger level for JSON (a path that isn't there has none, rather than infinity)."""
+    return None if weight == float('inf') else weight
+
+
+class MapService:
+    """
+    Everything the endpoints need, built once: the graph, its routing index
+    (kept up to date across edits by self.dynamic), the A* guessers and the
+    result cache (from MIDDLE_EARTH_RESULT_CACHE unless you bring your own).
+    """
+
+    def __init__(self, G, workers=WORKERS, results=None):
+        self.graph = as_compact(G)
+        self.results = results if results is not None else result_cache_from_env()
+        self.index = RoutingIndex(self.graph)
+        self.dynamic = DynamicNetwork(self.graph, index=self.index)
+        self.dynamic.subscribe(self._edited)
+        self.heuristics = {method: build_heuristic(self.graph, method) for method in ('astar', 'alt')}
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+    def _edited(self, change):
+        # A cheaper path can make the A* guessers overestimate, so they get redone
+        # (dearer or closed paths only make their guesses more cautious - still fine)
+        if change['new_weight'] < change['old_weight']:
+            self.heuristics = {method: build_heuristic(self.graph, method) for method in ('astar', 'alt')}
+
+    async def _in_thread(self, fn):
+        loop = asyncio.get_running_loop()
+        # Take the request's trace along into the worker thread
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self.pool, lambda: context.run(fn))
+
+    async def _in_pool(self, fn, *args, **kwargs):
+        """fn(*args, **kwargs) in a worker thread, with no edit going on meanwhile."""
+        def read():
+            with self.dynamic.reading():
+                return fn(*args, **kwargs)
+        return await self._in_thread(read)
+
+    def _path(self, start, end, method):
+        if method == 'index':
+            return shortest_path_analysis(self.graph, start, end, index=self.index)
+        return shortest_path_analysis(self.graph, start, end, heuristic=self.heuristics.get(method))
+
+    def _strategic(self, top_n, mode, epsilon, seed):
+        # One ranking per mode (and sample size), whatever top_n gets asked for
+        if mode == 'exact':
+            epsilon = seed = None
+        # (exact scores come from the DynamicNetwork, so after an edit only the affected part gets redone)
+        ranking = self.results.fetch('centrality', self.graph,
+                                     {'mode': mode, 'epsilon': epsilon, 'seed': seed},
+                                     lambda: centrality_ranking(self.graph, mode, epsilon, seed,
+                                                                network=self.dynamic))
+        return strategic_locations_analysis(self.graph, top_n, mode=mode, ranking=ranking)
+
+    def _places(self, query):
+        """The graph's names for ?start= and ?end= (400 if missing, 404 if unknown)."""
+        names = []
+        for key in ('start', 'end'):
+            asked = _param(query, key)
+            if asked is None:
+                raise HTTPError(400, f"'{key}' is required")
+            name = place_name(self.graph, asked)
+            if name is None:
+                raise HTTPError(404, f"No place called '{asked}' on this map")
+            names.append(name)
+        return names
+
+    def _edit(self, start, end, danger, close, path_type):
+        if close:
+            change = self.dynamic.remove_edge(start, end)
+        else:
+            try:
+                change = self.dynamic.set_weight(start, end, danger)
+            except KeyError:
+                # No path there yet: open one
+                change = self.dynamic.add_edge(start, end, danger, path_type)
+        return {'version': change['fingerprint'], 'edits': change['version'],
+                'path': [name.replace('_', ' ') for name in change['edge']],
+                'old_danger': _danger(change['old_weight']), 'new_danger': _danger(change['new_weight']),
+                'routes_redone': len(change['affected_sources'])}
+
+    async def edit(self, query):
+        """Answers POST /edit: changes the map, returns what changed (or raises HTTPError)."""
+        names = self._places(query)
+        if names[0] == names[1]:
+            raise HTTPError(400, 'A path has to go somewhere else')
+        close = _param(query, 'close', _flag, False)
+        danger = _param(query, 'danger', float)
+        path_type = _param(query, 'path_type', default='road')
+        if not close and danger is None:
+            raise HTTPError(400, "'danger' is required (or close=true)")
+        try:
+            # Not _in_pool: the edit takes its own (exclusive) turn
+            return await self._in_thread(lambda: self._edit(*names, danger, close, path_type))
+        except KeyError:
+            raise HTTPError(404, 'There is no path between {} and {}'.format(
+                *(name.replace('_', ' ') for name in names))) from None
+        except ValueError as e:
+            raise HTTPError(400, str(e)) from None
+
+    async def _routes(self, fn, *args, **kwargs):
+        """Runs one of the many-routes analyses: {'routes': [...]}, 404 if there are none."""
+        try:
+            routes = await self._in_pool(fn, self.graph, *args, **kwargs)
+        except ValueError as e:
+            raise HTTPError(400, str(e)) from None
+        if not routes:
+            raise HTTPError(404, 'No route follows those rules! Maybe try taking the eagles?')
+        return {'routes': routes}
+
+    async def handle(self, path, query):
+        """Answers one GET request: returns the JSON-able result or raises HTTPError."""
+        if path == '/health':
+            return {'status': 'ok', 'nodes': self.graph.number_of_nodes(),
+                    'edges': self.graph.number_of_edges(), 'version': self.graph.fingerprint()}
+
+        if path == '/cache':
+            return self.results.stats()
+
+        if path == '/metrics':
+            for sink in sinks():
+                if isinstance(sink, PrometheusSink):
+                    return sink.render()
+            raise HTTPError(404, 'Metrics are off (start with --metrics or MIDDLE_EARTH_TRACE=prometheus)')
+
+        if path == '/path':
+            method = _param(query, 'method', default='index')
+            if method not in SEARCH_METHODS:
+                raise HTTPError(400, f"method should be one of {', '.join(SEARCH_METHODS)}")
+            names = self._places(query)
+            k = _param(query, 'k', int, 1)
+            rules = _rules(query)
+            if k != 1 or any(value not in (None, []) for value in rules.values()):
+                # Alternatives and route rules have their own search (method doesn't apply)
+                if not 1 <= k <= MAX_ALTERNATIVES:
+                    raise HTTPError(400, f'k has to be between 1 and {MAX_ALTERNATIVES}')
+                return await self._routes(alternative_routes_analysis, *names, k, **rules)
+
+            got_in = False
+            if method == 'index' and self.index.dense:
+                # Just a lookup, no point leaving the event loop (or caching it). But never
+                # WAIT on the loop: if an edit has the map, off to the pool like the rest
+                with self.dynamic.reading(wait=False) as got_in:
+                    if got_in:
+                        result = self._path(*names, method)
+            if not got_in:
+                params = {'start': names[0], 'end': names[1], 'method': method}
+                result = await self._in_pool(self.results.fetch, 'path', self.graph, params,
+                                             lambda: self._path(*names, method))
+            if result is None:
+                raise HTTPError(404, 'No safe path found! Maybe try taking the eagles?')
+            return result
+
+        if path == '/tradeoffs':
+            names = self._places(query)
+            return await self._routes(tradeoff_routes_analysis, *names, index=self.index, **_rules(query))
+
+        if path == '/strategic':
+            mode = _param(query, 'mode', default='exact')
+            if mode not in ('exact', 'approximate'):
+                raise HTTPError(400, "mode should be 'exact' or 'approximate'")
+            top_n = _param(query, 'top_n', int, 5)
+            epsilon = _param(query, 'epsilon', float, 0.05)
+            if top_n < 1 or not 0 < epsilon < 1:
+                raise HTTPError(400, 'top_n has to be at least 1 and epsilon between 0 and 1')
+            return await self._in_pool(self._strategic, top_n, mode, epsilon, _param(query, 'seed', int))
+
+        if path == '/regions':
+            resolution = _param(query, 'resolution', float, 1.0)
+            if resolution <= 0:
+                raise HTTPError(400, 'resolution has to be positive')
+            params = {'seed': _param(query, 'seed', int, 0), 'resolution': resolution,
+                      'connected': _param(query, 'connected', _flag, False)}
+            return await self._in_pool(self.results.fetch, 'regions', self.graph, params,
+                                       lambda: regional_groups_analysis(self.graph, **params))
+
+        raise HTTPError(404, f'Nothing at {path}')
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            body, content_type = payload.encode(), 'text/plain; version=0.0.4'
+        else:
+            body, content_type = json.dumps(payload).encode(), 'application/json'
+        head = (f'HTTP/1.1 {status} {REASONS.get(status, "")}\r\n'
+                f'Content-Type: {content_type}\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n')
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    async def client_connected(self, reader, writer):
+        """One connection: keep answering requests until the client is done."""
+        try:
+            while True:
+                try:
+                    request_line = await reader.readuntil(b'\r\n')
+                    headers = {}
+                    while True:
+                        line = await reader.readuntil(b'\r\n')
+                        if line == b'\r\n':
+                            break
+                        key, _, value = line.decode('latin-1').partition(':')
+                        headers[key.strip().lower()] = value.strip()
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+
+                parts = request_line.decode('latin-1').split()
+                if len(parts) != 3:
+                    await self._respond(writer, 400, {'error': 'Malformed request line'}, False)
+                    break
+                method, target, version = parts
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+
+                url = urlsplit(target)
+                if method == 'POST' and url.path == '/edit':
+                    try:
+                        # Read past the body (we don't use it) so the next request lines up
+                        length = int(headers.get('content-length', 0))
+                        if 'transfer-encoding' in headers or not 0 <= length <= MAX_BODY:
+                            raise ValueError(length)
+                        await reader.readexactly(length)
+                    except ValueError:
+                        await self._respond(writer, 400, {'error': 'Bad or too big a body'}, False)
+                        break
+                    except (asyncio.IncompleteReadError, ConnectionError):
+                        break
+                if (method, url.path == '/edit') not in (('GET', False), ('POST', True)):
+                    status, payload = 405, {'error': 'Only GET is supported (and POST for /edit)'}
+                    if method != 'GET':
+                        # We never read its body, so whatever's left on the wire isn't a request line:
+                        # answer and hang up rather than parse the body as the next request
+                        keep_alive = False
+                else:
+                    query = parse_qs(url.query)
+                    try:
+                        with trace(f'{method} {url.path}'):
+                            if method == 'POST':
+                                status, payload = 200, await self.edit(query)
+                            else:
+                                status, payload = 200, await self.handle(url.path, query)
+                    except HTTPError as e:
+                        status, payload = e.status, {'error': str(e)}
+                    except Exception as e:  # don't let one bad query take the whole server down
+                        status, payload = 500, {'error': f'{type(e).__name__}: {e}'}
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+
+async def start_server(G, host='127.0.0.1', port=8000, workers=WORKERS, results=None):
+    """Builds the MapService and starts listening. Returns the asyncio server."""
+    service = MapService(G, workers, results)
+    return await asyncio.start_server(service.client_connected, host, port, limit=MAX_LINE)
+
+
+def serve(G, host='127.0.0.1', port=8000, workers=WORKERS, results=None):
+    """Runs the service until you hit Ctrl+C."""
+    async def run():
+        server = await start_server(G, host, port, workers, results)
+        print(f'Serving Middle Earth on http://{host}:{port} (Ctrl+C to stop)', flush=True)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,70 @@
+"""
+Keeping start-up fast.
+
+Every new Python process (a Streamlit server, a CLI run, a worker) pays for
+its imports before doing anything useful, and matplotlib + NetworkX +
+adjustText alone cost over a second. So the app and the core only import
+those when they actually draw something.
+
+check_import_budget() keeps us honest: it imports each entry point in a
+fresh interpreter with -X importtime, and complains if it got slower than
+its budget or pulled in one of the heavy libraries at start-up:
+
+    python -m middle_earth import-budget
+"""
+import os
+import subprocess
+import sys
+
+# Cumulative import time allowed per entry point, in milliseconds
+# (app.py is mostly Streamlit itself, the core is mostly NumPy)
+IMPORT_BUDGETS_MS = {
+    'middle_earth.cli': 300,
+    'app': 900,
+}
+# Nothing on the start-up path should drag these in
+HEAVY_MODULES = ('matplotlib', 'networkx', 'adjustText')
+# Import times are noisy, so take the best of a few runs
+REPEATS = 3
+
+# app.py lives next to the package, so that's where we run from
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_import(module, cwd=REPO_DIR):
+    """
+    Imports module in a fresh interpreter. Returns (milliseconds, set of
+    top-level packages that got imported along the way).
+    """
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                          cwd=cwd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Couldn't import {module}:\n{proc.stderr.strip()}")
+
+    total_us = 0
+    imported = set()
+    for line in proc.stderr.splitlines():
+        # import time: <self us> | <cumulative us> | <indent><name>
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imported.add(name.strip().split('.')[0])
+        if name.strip() == module:
+            total_us = int(cumulative)
+    return total_us / 1000, imported
+
+
+def check_import_budget(budgets=None, repeats=REPEATS, cwd=REPO_DIR):
+    """
+    Measures every entry point against its budget. Returns one dict per module
+    with the best time ('ms'), the 'budget_ms', any 'heavy' modules it
+    imported and whether it's 'ok'.
+    """
+    report = []
+    for module, budget in (budgets or IMPORT_BUDGETS_MS).items():
+        best, imported = min((measure_import(module, cwd) for _ in range(max(1, repeats))),
+                             key=lambda run: run[0])
+        heavy = sorted(m for m in HEAVY_MODULES if m in imported)
+        report.append({'module': module, 'ms': round(best, 1), 'budget_ms': budget,
+                       'heavy': heavy, 'ok': best <= budget and not heavy})
+    return report
@@ -0,0 +1,165 @@
+"""
+The static (matplotlib) map: every place, every path and the background picture.
+
+This used to live in app.py, which meant anything that wanted a picture
+(like the benchmarks) had to import the whole Streamlit page along with it.
+Here it's just a function: hand it a graph and (optionally) a Basemap and
+you get a matplotlib figure back. Caching the result, and complaining when
+the map picture is missing, is up to whoever calls it.
+
+matplotlib, NetworkX and adjustText take over a second to import, so they
+only get loaded once we actually draw something.
+"""
+from middle_earth.graph import as_compact
+from middle_earth.labels import place_labels
+from middle_earth.tracing import span, traced
+from middle_earth.vectormap import DANGEROUS_EDGE_TYPES, NODE_COLORS
+
+FIGURE_SIZE = (15, 10)
+# Resolution figures get saved at (so we fetch a background just sharp enough)
+RENDER_DPI = 200
+
+
+def scale_coordinates(locations, original_width, original_height, new_width, new_height):
+    """
+    Makes our coordinates match the map size - just boring math stuff
+    Think of it like resizing a photo but for coordinates
+    """
+    scaled_locations = {}
+    for loc, data in locations.items():
+        x, y = data['pos']
+        # Basic cross multiplication to scale coordinates
+        new_x = (x / original_width) * new_width
+        new_y = (y / original_height) * new_height
+        scaled_locations[loc] = {'pos': (new_x, new_y), 'type': data['type']}
+    return scaled_locations
+
+
+@traced('create_visualization')
+def create_visualization(graph, basemap=None, figsize=FIGURE_SIZE, dpi=RENDER_DPI, viewport=None):
+    """
+    This is where the magic happens - creates the whole map visualization
+    It's like drawing the map but with code instead of a pencil
+
+    basemap (a middle_earth.basemap.Basemap) goes underneath - no basemap,
+    blank background. dpi is what the figure will be saved at (so we fetch a
+    map just sharp enough), and viewport=(x0, x1, y0, y1) zooms in on part of the map.
+    """
+    # The slow-to-import drawing stuff, only loaded once we really draw something
+    import matplotlib.patches as mpatches
+    import matplotlib.pyplot as plt
+    import networkx as nx
+
+    cg = as_compact(graph)
+    # NetworkX's drawing functions want a NetworkX graph (this view doesn't copy anything)
+    graph = cg.to_networkx()
+
+    # Set up our canvas with a dark theme (because it looks cool)
+    plt.style.use('dark_background')
+    fig = plt.figure(figsize=figsize, facecolor='#222222')
+
+    # Make space for our map
+    ax_map = fig.add_subplot(111)
+    ax_map.set_facecolor('#222222')
+
+    # Get node positions (raw grid coordinates unless we have a map to fit)
+    nodes = {name: {'pos': tuple(xy), 'type': cg.node_type(i)}
+             for i, (name, xy) in enumerate(zip(cg.names, cg.pos.tolist()))}
+    pos = {name: data['pos'] for name, data in nodes.items()}
+
+    # The fancy map background, if we've got one
+    if basemap is not None:
+        img_height, img_width = basemap.shape
+
+        # Make the coordinates match the map size
+        # (we keep the scaled positions to ourselves so the graph itself never changes)
+        desired_width = 50
+        desired_height = int(desired_width * (img_height/img_width))
+        scaled_locations = scale_coordinates(nodes, 100, 75,
+                                             desired_width, desired_height)
+        pos = {loc: data['pos'] for loc, data in scaled_locations.items()}
+
+        # Show the map (just the zoom level and tiles this figure can actually show)
+        with span('draw_basemap'):
+            map_img, map_extent = basemap.view((0, desired_width, 0, desired_height),
+                                               (figsize[0] * dpi, figsize[1] * dpi), viewport)
+            if map_img is not None:
+                ax_map.imshow(map_img, extent=map_extent, aspect='auto', alpha=0.8)
+
+    # Node colors (shared with the interactive map)
+    node_colors = NODE_COLORS
+
+    # Draw edges (straight from the compact edge arrays, one line per path)
+    edge_list = []
+    edge_colors = []
+    edge_styles = []
+    for u, v, t in zip(cg.edge_src.tolist(), cg.edge_dst.tolist(), cg.edge_types.tolist()):
+        edge_list.append((cg.names[u], cg.names[v]))
+        if cg.edge_type_names[t] in DANGEROUS_EDGE_TYPES:
+            edge_colors.append('#FF0000')
+            edge_styles.append('dotted')
+        else:
+            edge_colors.append('#463E3F')
+            edge_styles.append('solid')
+
+    with span('draw_edges'):
+        nx.draw_networkx_edges(graph, pos,
+                              edgelist=edge_list,
+                              edge_color=edge_colors,
+                              style=edge_styles,
+                              width=1.5,
+                              alpha=0.7,
+                              ax=ax_map)
+
+    # Draw nodes
+    with span('draw_nodes'):
+        for node_type in cg.node_type_names:
+            node_list = [node for node, data in nodes.items() if data['type'] == node_type]
+            nx.draw_networkx_nodes(graph, pos,
+                                 nodelist=node_list,
+                                 node_color=node_colors[node_type],
+                                 node_size=700,
+                                 edgecolors='black',
+                                 linewidths=2,
+                                 alpha=0.8,
+                                 ax=ax_map)
+
+    # Add labels (spots come from the saved layout, adjust_text only runs if the nodes moved)
+    with span('labels'):
+        place_labels(ax_map, pos,
+                     fontsize=12,
+                     arrowprops=dict(arrowstyle='-', color='gray', alpha=0.5, lw=0.5))
+
+    # Create legend
+    legend_elements = []
+    for loc_type, color in node_colors.items():
+        legend_elements.append(
+            mpatches.Patch(facecolor=color, edgecolor='black',
+                          label=loc_type.replace('_', ' ').title())
+        )
+
+    legend_elements.extend([
+        plt.Line2D([0], [0], color='#463E3F', linestyle='-',
+                  label='Safe Path'),
+        plt.Line2D([0], [0], color='#FF0000', linestyle=':',
+                  label='Dangerous Path')
+    ])
+
+    ax_map.legend(handles=legend_elements,
+                 title='Map Legend',
+                 title_fontsize=12,
+                 fontsize=10,
+                 loc='lower center',
+                 bbox_to_anchor=(0.5, -0.1),
+                 ncol=3,
+                 borderaxespad=0,
+                 labelcolor='white')
+
+    if viewport is not None:
+        # Zoomed in: only show the part we asked for
+        ax_map.set_xlim(viewport[0], viewport[1])
+        ax_map.set_ylim(viewport[2], viewport[3])
+
+    with span('tight_layout'):
+        plt.tight_layout()
+    return fig
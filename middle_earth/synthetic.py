@@ -0,0 +1,170 @@
+"""
+Made-up Middle Earths of any size, for benchmarks (and for stress-testing the app).
+
+Our real map only has 32 places, which tells us nothing about how things
+scale. generate_map(n, seed) builds a bigger one that still looks the part:
+
+- places cluster around the real ones (a "Minas Tirith_1234" turns up near
+  Minas Tirith) and mostly share their type, with the rest drawn from the
+  real mix of types
+- paths link places that are next to each other along a Hilbert curve, which
+  keeps them short and local and the whole map connected, plus some extra
+  cross-links from a second, shifted curve
+- ...and every place also links to its few nearest neighbors, so places
+  have 3-4 paths like a real crossroads instead of 2 (a chain of places
+  along a curve is barely a network: there's only ever one way to go, and
+  A* has nothing to skip). Nearest is worked out among the places close by
+  along either curve, which finds the real nearest ones almost always
+- every path gets a (type, danger) pair copied from a real route. Paths
+  touching dark places (fortresses, gates, hazards) copy from routes that
+  do too, so Mordor stays scarier than the Shire
+
+Same n + same seed = the same map, every time.
+"""
+import numpy as np
+
+from middle_earth.data import locations, routes
+from middle_earth.graph import CompactGraph
+
+# How far (in map units) places stray from the real place they cluster around
+SPREAD = 6.0
+# Chance a place keeps the type of the real place it clusters around
+KEEP_TYPE = 0.7
+# Extra cross-links, as a fraction of the number of places
+EXTRA_EDGES = 0.2
+# Every place links to this many of its nearest neighbors...
+NEIGHBORS = 2
+# ...looking for them among this many places either side along each curve
+NEIGHBOR_WINDOW = 8
+# ...this many places at a time (keeps the candidate tables a few MB, not GBs)
+NEIGHBOR_CHUNK = 65536
+# Places that make the paths around them more dangerous
+DARK_TYPES = ('fortress', 'gate', 'hazard')
+# Our coordinates live on a 100 x 75 grid
+WIDTH, HEIGHT = 100.0, 75.0
+# Hilbert curve resolution (2**HILBERT_BITS cells a side)
+HILBERT_BITS = 16
+
+
+def hilbert_index(x, y, bits=HILBERT_BITS):
+    """
+    Position along a Hilbert curve for every (x, y) cell (integer arrays in
+    [0, 2**bits)). Points next to each other on the curve are next to each
+    other on the map too - unlike plain row-by-row order.
+    """
+    x, y = x.astype(np.int64), y.astype(np.int64)
+    size = 1 << bits
+    d = np.zeros(len(x), dtype=np.int64)
+    s = size >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += s * s * ((3 * rx.astype(np.int64)) ^ ry.astype(np.int64))
+        # Rotate the quadrant so the curve lines up for the next level down
+        flip = ~ry & rx
+        x = np.where(flip, size - 1 - x, x)
+        y = np.where(flip, size - 1 - y, y)
+        x, y = np.where(~ry, y, x), np.where(~ry, x, y)
+        s >>= 1
+    return d
+
+
+def _curve_order(pos, offset=(0.0, 0.0)):
+    """Places sorted along a Hilbert curve laid over the map (shifted by offset)."""
+    # The curve's square has to cover the shifted map too
+    scale = ((1 << HILBERT_BITS) - 1) / (max(WIDTH, HEIGHT) + max(offset))
+    cells = np.clip((pos + offset) * scale, 0, (1 << HILBERT_BITS) - 1)
+    return np.argsort(hilbert_index(cells[:, 0], cells[:, 1]), kind='stable')
+
+
+def _nearest_links(pos, orders, k, window, chunk=NEIGHBOR_CHUNK):
+    """
+    (src, dst) linking every place to its k nearest neighbors, picked from
+    the places within window steps along any of the given curve orders.
+    Works through chunk places at a time, so the candidate tables stay small
+    however big the map gets.
+    """
+    n = len(pos)
+    x, y = np.ascontiguousarray(pos[:, 0]), np.ascontiguousarray(pos[:, 1])
+    steps = np.array([step for step in range(-window, window + 1) if step != 0])
+    # Where each place sits along each curve
+    wheres = []
+    for order in orders:
+        where = np.empty(n, dtype=np.int64)
+        where[order] = np.arange(n)
+        wheres.append(where)
+
+    src, dst = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+    for lo in range(0, n, chunk):
+        rows = np.arange(lo, min(lo + chunk, n))
+        # Candidates: one row per place, one column per (curve, step), -1 past either end
+        columns = []
+        for order, where in zip(orders, wheres):
+            j = where[rows, None] + steps
+            columns.append(np.where((j >= 0) & (j < n), order[np.clip(j, 0, n - 1)], -1))
+        candidates = np.concatenate(columns, axis=1)
+        del columns
+        dist = np.hypot(x[candidates] - x[rows, None], y[candidates] - y[rows, None])
+        dist[candidates < 0] = np.inf
+
+        # Closest first in every row; the same place found along both curves ends up side by side
+        by_dist = np.argsort(dist, axis=1, kind='stable')
+        candidates = np.take_along_axis(candidates, by_dist, axis=1)
+        dist = np.take_along_axis(dist, by_dist, axis=1)
+        fresh = np.isfinite(dist)
+        fresh[:, 1:] &= candidates[:, 1:] != candidates[:, :-1]
+        keep = fresh & (np.cumsum(fresh, axis=1) <= k)
+        picked_rows, picked_cols = np.nonzero(keep)
+        src.append(rows[picked_rows])
+        dst.append(candidates[picked_rows, picked_cols])
+    return np.concatenate(src), np.concatenate(dst)
+
+
+def generate_map(n, seed=0, spread=SPREAD, extra_edges=EXTRA_EDGES, neighbors=NEIGHBORS):
+    """A connected, made-up Middle Earth with n places, as a CompactGraph."""
+    rng = np.random.default_rng(seed)
+    real = CompactGraph.from_routes(locations, routes)
+
+    # Places: scattered around the real ones, mostly keeping their type
+    parent = rng.integers(real.number_of_nodes(), size=n)
+    pos = real.pos[parent] + rng.normal(scale=spread, size=(n, 2))
+    pos = np.clip(pos, 0, (WIDTH, HEIGHT))
+    node_types = np.where(rng.random(n) < KEEP_TYPE, real.node_types[parent],
+                          rng.choice(real.node_types, size=n))
+    names = [f'{real.names[p]}_{i}' for i, p in enumerate(parent.tolist())]
+
+    # Paths: neighbors along one curve (connects everything), some along a second
+    order = _curve_order(pos)
+    shifted = _curve_order(pos, offset=(WIDTH / 3, HEIGHT / 3))
+    src, dst = [order[:-1]], [order[1:]]
+    if n > 2 and extra_edges > 0:
+        pick = rng.random(n - 1) < extra_edges
+        src.append(shifted[:-1][pick])
+        dst.append(shifted[1:][pick])
+    # ...plus each place's nearest neighbors, for some real crossroads
+    if neighbors > 0:
+        near_src, near_dst = _nearest_links(pos, (order, shifted), neighbors, NEIGHBOR_WINDOW)
+        src.append(near_src)
+        dst.append(near_dst)
+    src, dst = np.concatenate(src), np.concatenate(dst)
+    # The two curves sometimes pick the same pair - keep one copy
+    # (sort + compare neighbours: same as np.unique, minus its hash table)
+    keys = np.minimum(src, dst).astype(np.int64) * n + np.maximum(src, dst)
+    del src, dst
+    keys.sort()
+    keys = np.concatenate((keys[:1], keys[1:][keys[1:] != keys[:-1]]))
+    src, dst = keys // n, keys % n
+    del keys
+
+    # Types and dangers copied from real routes, dark ones near dark places
+    dark_codes = [real.node_type_names.index(t) for t in DARK_TYPES if t in real.node_type_names]
+    real_dark = np.isin(real.node_types[real.edge_src], dark_codes) | \
+        np.isin(real.node_types[real.edge_dst], dark_codes)
+    dark = np.isin(node_types[src], dark_codes) | np.isin(node_types[dst], dark_codes)
+    dark_pool, light_pool = np.flatnonzero(real_dark), np.flatnonzero(~real_dark)
+    template = np.where(dark, rng.choice(dark_pool, size=len(src)),
+                        rng.choice(light_pool, size=len(src)))
+
+    return CompactGraph(names, pos, node_types, real.node_type_names,
+                        src, dst, real.weights[template], real.edge_types[template],
+                        real.edge_type_names)
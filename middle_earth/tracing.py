@@ -0,0 +1,301 @@
+"""
+Where does the time go? Timing spans for the slow bits.
+
+    with trace('rerun') as rerun:          # one per Streamlit rerun / HTTP request
+        with span('dijkstra'):
+            ...
+    rerun.record()   # {'name', 'seconds', 'spans': [...], 'caches': {...}}
+
+Spans only get recorded inside an active trace, so with tracing off (the
+default) a span costs one context-variable lookup. A trace only starts when
+there's somewhere to send it (a sink) or the caller forces one (the app's
+timing panel does). Finished traces go to every sink:
+
+- RingBufferSink: the last few traces, in memory
+- JsonlSink: one JSON line per trace, appended to a file
+- PrometheusSink: running totals per stage and cache, as Prometheus text
+  (the service's /metrics)
+
+Caches count hits and misses too: wrap the call in cache_lookup(name) and
+call cache_miss(name) inside the cached function (it only runs on a miss).
+
+Set MIDDLE_EARTH_TRACE to switch sinks on without touching any code:
+"ring", "prometheus" or "jsonl:traces.jsonl" (comma-separated for several).
+"""
+import contextlib
+import contextvars
+from collections import deque
+import functools
+import json
+import os
+import threading
+import time
+
+# Environment variable that picks the sinks (see configure())
+TRACE_ENV = 'MIDDLE_EARTH_TRACE'
+# How many traces a RingBufferSink keeps
+RING_SIZE = 100
+
+# (trace, depth) while a trace is running, in this thread / asyncio task
+_current = contextvars.ContextVar('middle_earth_trace', default=None)
+_NOOP = contextlib.nullcontext()
+_sinks = []
+_sinks_lock = threading.Lock()
+
+
+class Trace:
+    """One traced request: its spans (in the order they started) and cache hits/misses."""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.time()
+        self.seconds = None
+        self.spans = []
+        self.caches = {}        # cache name -> [hits, misses]
+        self._missed = set()
+        self._t0 = time.perf_counter()
+
+    def count(self, cache, hit):
+        counts = self.caches.setdefault(cache, [0, 0])
+        counts[0 if hit else 1] += 1
+
+    def record(self):
+        """The whole trace as a JSON-able dict (this is what sinks get)."""
+        return {'name': self.name, 'started': self.started, 'seconds': self.seconds,
+                'spans': self.spans,
+                'caches': {name: {'hits': hits, 'misses': misses}
+                           for name, (hits, misses) in self.caches.items()}}
+
+
+def add_sink(sink):
+    """Sends every finished trace to sink (anything with an emit(record) method)."""
+    with _sinks_lock:
+        _sinks.append(sink)
+    return sink
+
+
+def remove_sink(sink):
+    with _sinks_lock:
+        if sink in _sinks:
+            _sinks.remove(sink)
+
+
+def sinks():
+    return list(_sinks)
+
+
+def current_trace():
+    """The trace we're inside, or None."""
+    current = _current.get()
+    return current[0] if current else None
+
+
+@contextlib.contextmanager
+def _span(current, name):
+    trace, depth = current
+    span = {'name': name, 'depth': depth, 'start': time.perf_counter() - trace._t0, 'seconds': None}
+    trace.spans.append(span)
+    token = _current.set((trace, depth + 1))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+        span['seconds'] = time.perf_counter() - trace._t0 - span['start']
+
+
+def span(name):
+    """Times the with-block as one stage of the current trace (does nothing outside one)."""
+    current = _current.get()
+    if current is None:
+        return _NOOP
+    return _span(current, name)
+
+
+def traced(name):
+    """Decorator version of span(): times every call of the function."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            current = _current.get()
+            if current is None:
+                return fn(*args, **kwargs)
+            with _span(current, name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+@contextlib.contextmanager
+def _lookup(current, name):
+    trace = current[0]
+    trace._missed.discard(name)
+    with _span(current, name):
+        yield
+    trace.count(name, hit=name not in trace._missed)
+    trace._missed.discard(name)
+
+
+def cache_lookup(name):
+    """
+    Times a call to a cached function as a span, and counts it as a hit
+    unless the function called cache_miss(name) along the way.
+    """
+    current = _current.get()
+    if current is None:
+        return _NOOP
+    return _lookup(current, name)
+
+
+def cache_miss(name):
+    """Call this inside a cached function: we're computing, not reusing."""
+    current = _current.get()
+    if current is not None:
+        current[0]._missed.add(name)
+
+
+@contextlib.contextmanager
+def trace(name, force=False):
+    """
+    Traces the with-block as one request and hands the finished record to
+    every sink. Yields the Trace, or None if nobody's listening (no sinks and
+    not forced). Inside another trace this is just a span of that one.
+    """
+    current = _current.get()
+    if current is not None:
+        with _span(current, name):
+            yield current[0]
+        return
+    if not (force or _sinks):
+        yield None
+        return
+
+    t = Trace(name)
+    token = _current.set((t, 0))
+    try:
+        yield t
+    finally:
+        _current.reset(token)
+        t.seconds = time.perf_counter() - t._t0
+        record = t.record()
+        for sink in sinks():
+            sink.emit(record)
+
+
+class RingBufferSink:
+    """Keeps the last size traces in memory."""
+
+    def __init__(self, size=RING_SIZE):
+        self._traces = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        with self._lock:
+            self._traces.append(record)
+
+    def traces(self):
+        with self._lock:
+            return list(self._traces)
+
+    def latest(self):
+        with self._lock:
+            return self._traces[-1] if self._traces else None
+
+    def cache_rates(self):
+        """{cache: {'hits', 'misses', 'hit_rate'}} over every trace we're holding."""
+        totals = {}
+        for record in self.traces():
+            for name, counts in record['caches'].items():
+                total = totals.setdefault(name, {'hits': 0, 'misses': 0})
+                total['hits'] += counts['hits']
+                total['misses'] += counts['misses']
+        for total in totals.values():
+            total['hit_rate'] = total['hits'] / (total['hits'] + total['misses'])
+        return totals
+
+
+class JsonlSink:
+    """Appends every trace to a JSON Lines file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        line = json.dumps(record) + '\n'
+        with self._lock, open(self.path, 'a') as f:
+            f.write(line)
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class PrometheusSink:
+    """Running totals per trace name, stage and cache, in Prometheus' text format."""
+
+    def __init__(self, prefix='middle_earth'):
+        self.prefix = prefix
+        self._traces = {}       # name -> [count, seconds]
+        self._stages = {}       # name -> [count, seconds]
+        self._caches = {}       # name -> [hits, misses]
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        with self._lock:
+            totals = self._traces.setdefault(record['name'], [0, 0.0])
+            totals[0] += 1
+            totals[1] += record['seconds']
+            for s in record['spans']:
+                if s['seconds'] is not None:
+                    totals = self._stages.setdefault(s['name'], [0, 0.0])
+                    totals[0] += 1
+                    totals[1] += s['seconds']
+            for name, counts in record['caches'].items():
+                totals = self._caches.setdefault(name, [0, 0])
+                totals[0] += counts['hits']
+                totals[1] += counts['misses']
+
+    def render(self):
+        """Everything so far, ready to serve as text/plain; version=0.0.4."""
+        p = self.prefix
+        lines = []
+        with self._lock:
+            for metric, label, table in ((f'{p}_request_seconds', 'name', self._traces),
+                                         (f'{p}_stage_seconds', 'stage', self._stages)):
+                lines.append(f'# TYPE {metric} summary')
+                for name, (count, seconds) in sorted(table.items()):
+                    lines.append(f'{metric}_count{{{label}="{_label(name)}"}} {count}')
+                    lines.append(f'{metric}_sum{{{label}="{_label(name)}"}} {seconds:.6f}')
+            lines.append(f'# TYPE {p}_cache_requests_total counter')
+            for name, (hits, misses) in sorted(self._caches.items()):
+                for result, count in (('hit', hits), ('miss', misses)):
+                    lines.append(f'{p}_cache_requests_total{{cache="{_label(name)}",'
+                                 f'result="{result}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def configure(spec):
+    """
+    Adds the sinks spec asks for ("ring", "prometheus", "jsonl:PATH",
+    comma-separated) and returns them. Raises ValueError for anything else.
+    """
+    added = []
+    for part in filter(None, (p.strip() for p in spec.split(','))):
+        kind, _, arg = part.partition(':')
+        if kind == 'ring':
+            added.append(RingBufferSink(int(arg) if arg else RING_SIZE))
+        elif kind == 'prometheus':
+            added.append(PrometheusSink())
+        elif kind == 'jsonl' and arg:
+            added.append(JsonlSink(arg))
+        else:
+            raise ValueError(f"Don't know the trace sink '{part}' "
+                             "(try ring, prometheus or jsonl:PATH)")
+    for sink in added:
+        add_sink(sink)
+    return added
+
+
+def configure_from_env():
+    """configure() with whatever MIDDLE_EARTH_TRACE says (nothing if it's not set)."""
+    return configure(os.environ.get(TRACE_ENV, ''))
@@ -0,0 +1,134 @@
+"""
+Everything the interactive (vector) map needs from the server.
+
+Instead of drawing a picture on the server every time, we send the browser
+the map itself ONCE - where every place is, which paths connect them - and
+let it draw, pan, zoom and show names on hover on its own. After that, a
+new route is just a small diff ("light up these 9 paths, dim those 7").
+
+- map_payload(): compact geometry (flat lists of numbers plus lookup tables)
+- HighlightState: remembers what one browser is showing and works out the diffs
+- route_ids(): which nodes/edges a Path Finder result runs along
+
+The drawing itself lives in vectormap_frontend/index.html.
+"""
+import base64
+import io
+import os
+
+import numpy as np
+
+from middle_earth.graph import as_compact
+
+# The browser side of the map (a plain HTML/JS Streamlit component, no build step)
+FRONTEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vectormap_frontend')
+
+# Same colors as the static map
+NODE_COLORS = {
+    'city': '#ffd700',      # Gold
+    'haven': '#90EE90',     # Light green
+    'fortress': '#8B0000',  # Dark red
+    'mountain': '#4a4a4a',  # Dark gray
+    'forest': '#228B22',    # Forest green
+    'ruin': '#8B4513',      # Saddle brown
+    'town': '#FFA500',      # Orange
+    'gate': '#000000',      # Black
+    'hazard': '#800080',    # Purple
+    'pass': '#A9A9A9'       # Gray
+}
+# Paths of these types get drawn red and dotted
+DANGEROUS_EDGE_TYPES = ('dangerous_path', 'hazardous_path')
+# Coordinates only need to be this precise on screen (keeps the payload small)
+COORD_DECIMALS = 3
+
+
+def background_image(basemap, extent, width_px=800, background='#222222', quality=85):
+    """
+    The background map as a data: URL JPEG plus where it goes (extent in map
+    coordinates), taken from the smallest pyramid level that's width_px wide.
+    A photo-like map compresses far better as JPEG than PNG, so any
+    see-through bits get flattened onto the page background first.
+    """
+    from PIL import Image
+
+    x0, x1, y0, y1 = extent
+    img, img_extent = basemap.view(extent, (width_px, width_px * (y1 - y0) / (x1 - x0)))
+    rgba = Image.fromarray(np.ascontiguousarray(img), 'RGBA')
+    flat = Image.new('RGB', rgba.size, background)
+    flat.paste(rgba, mask=rgba.getchannel('A'))
+    buf = io.BytesIO()
+    flat.save(buf, format='JPEG', quality=quality)
+    return {'url': 'data:image/jpeg;base64,' + base64.b64encode(buf.getvalue()).decode('ascii'),
+            'extent': list(img_extent)}
+
+
+def map_payload(G, version, background=None):
+    """
+    The whole map as one small JSON-able dict. Every per-node / per-edge field
+    is a flat list, indexed by node id / edge id.
+    """
+    cg = as_compact(G)
+    xy = cg.pos.round(COORD_DECIMALS)
+    return {
+        'version': version,
+        'names': [name.replace('_', ' ') for name in cg.names],
+        'x': xy[:, 0].tolist(),
+        'y': xy[:, 1].tolist(),
+        'node_type': cg.node_types.tolist(),
+        'node_type_names': list(cg.node_type_names),
+        'node_colors': NODE_COLORS,
+        'src': cg.edge_src.tolist(),
+        'dst': cg.edge_dst.tolist(),
+        'edge_type': cg.edge_types.tolist(),
+        'edge_type_names': list(cg.edge_type_names),
+        'dangerous_edge_types': list(DANGEROUS_EDGE_TYPES),
+        'background': background,
+    }
+
+
+def route_ids(G, path):
+    """
+    (node ids, edge ids) along a route given as place names
+    (pretty "Minas Tirith" style names from the Path Finder are fine too).
+    """
+    cg = as_compact(G)
+    nodes = [cg.node_ids[name if name in cg.node_ids else name.replace(' ', '_')] for name in path]
+    edges = [int(cg.edge_between(u, v)) for u, v in zip(nodes, nodes[1:])]
+    return nodes, edges
+
+
+class HighlightState:
+    """
+    What one browser's map is showing, so we only ever send the changes.
+
+    Every change gets a sequence number. The browser applies a diff only if it
+    has already applied the one before it (diff['base']); if it missed one it
+    tells us, and we send it the full picture instead (reset()).
+    """
+
+    def __init__(self):
+        self.seq = 0
+        self.nodes = set()
+        self.edges = set()
+        self.last = None        # most recent thing we sent
+
+    def reset(self, nodes, edges):
+        """The full highlight state (for a browser that's new or missed a diff)."""
+        self.nodes, self.edges = set(nodes), set(edges)
+        self.seq += 1
+        self.last = {'seq': self.seq, 'base': None,
+                     'add_nodes': sorted(self.nodes), 'remove_nodes': [],
+                     'add_edges': sorted(self.edges), 'remove_edges': []}
+        return self.last
+
+    def update(self, nodes, edges):
+        """Highlights exactly these nodes/edges. Returns the diff (or the last one if nothing changed)."""
+        nodes, edges = set(nodes), set(edges)
+        if nodes == self.nodes and edges == self.edges and self.last is not None:
+            return self.last
+        self.seq += 1
+        self.last = {'seq': self.seq, 'base': self.seq - 1,
+                     'add_nodes': sorted(nodes - self.nodes), 'remove_nodes': sorted(self.nodes - nodes),
+                     'add_edges': sorted(edges - self.edges), 'remove_edges': sorted(self.edges - edges)}
+        self.nodes, self.edges = nodes, edges
+        return self.last
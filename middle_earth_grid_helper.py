@@ -1,14 +1,15 @@
-import networkx as nx
 import matplotlib.pyplot as plt
-import matplotlib.image as mpimg
+
+from middle_earth.basemap import Basemap
 
 def show_coordinate_grid():
     # Create figure with map background
-    plt.figure(figsize=(20, 15))
+    fig = plt.figure(figsize=(20, 15))
     
-    # Load and display the map
-    map_img = mpimg.imread('middle_earth_map_optimized.png')
-    plt.imshow(map_img, extent=[0, 100, 0, 75], aspect='auto', alpha=0.7)
+    # Load and display the map (same tile pyramid the app uses, at screen resolution)
+    basemap = Basemap.open('middle_earth_map_optimized.png')
+    map_img, extent = basemap.view((0, 100, 0, 75), fig.get_size_inches() * fig.dpi)
+    plt.imshow(map_img, extent=extent, aspect='auto', alpha=0.7)
     
     # Add grid
     plt.grid(True, linestyle='--', alpha=0.5)